@@ -15,7 +15,9 @@ const ProposalSchema = new mongoose.Schema({
         quantity: mongoose.Schema.Types.Mixed,
         terms: String,
         warranty: String,
-        delivery_time: String
+        delivery_time: String,
+        delivery_days: Number,
+        warranty_months: Number
     },
     raw_email: String,
     received_at: { type: Date, default: Date.now }
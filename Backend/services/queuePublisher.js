@@ -4,7 +4,12 @@ const publishMessage = async (queueName, data) => {
     try {
         const channel = await getChannel();
         await channel.assertQueue(queueName, { durable: true });
-        channel.sendToQueue(queueName, Buffer.from(JSON.stringify(data)), { persistent: true });
+        channel.sendToQueue(queueName, Buffer.from(JSON.stringify(data)), {
+            persistent: true,
+            // Lets the Python consumers measure how long messages wait in the queue
+            timestamp: Math.floor(Date.now() / 1000),
+            headers: { "x-published-at": Date.now() }
+        });
         console.log(`Message sent to queue: ${queueName}`);
         console.log(`Data sent: ${JSON.stringify(data)}`);
     } catch (err) {
@@ -1,14 +1,118 @@
 import json
+import logging
 import requests
-from typing import Dict, Any
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Any, List, Union
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from llm_cache import get_llm_cache, make_cache_key
+from proposal_scorer import score_proposals
+from duration_normalizer import delivery_days, warranty_months
+from structured_output import extraction_format, parse_structured
+from resilience import ollama_circuit
+from llm_router import LLMRouter, NoEndpointAvailable
+from model_tiers import tiers_for, model_tiers, run_tiers, run_local_tiers, validate_extraction, record_tier, register_extractor
+from rule_extractor import RULE_EXTRACTOR_ENABLED, extract_confident_vendor_quote
+from metrics import STAGE_SECONDS, CACHE_REQUESTS, PARSE_FAILURES
+from prompt_templates import (
+    CLIENT_EXTRACTION,
+    VENDOR_EXTRACTION,
+    CLIENT_BATCH_EXTRACTION,
+    VENDOR_BATCH_EXTRACTION,
+    PROPOSAL_RANKING,
+    RANKING_REASONING
+)
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 OLLAMA_API_URL = os.getenv("API_URL", "http://localhost:11434/api/chat")
-MODEL = "deepseek-r1:1.5b"
+# Comma-separated /api/chat URLs of several model servers; calls are balanced
+# across them (see llm_router). Defaults to API_URL alone.
+OLLAMA_API_URLS = [url.strip() for url in os.getenv("OLLAMA_API_URLS", "").split(",") if url.strip()]
+MODEL = os.getenv("OLLAMA_MODEL", "deepseek-r1:1.5b")
+
+# Keep-alive connections held open to the model server; should be at least the
+# number of threads that call Ollama concurrently (e.g. CONSUMER_WORKERS).
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", 10))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", 5))
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", 300))
+# Calls in flight per model server; further calls go elsewhere or wait for a slot
+OLLAMA_ENDPOINT_CONCURRENCY = int(os.getenv("OLLAMA_ENDPOINT_CONCURRENCY", OLLAMA_POOL_SIZE))
+# Seconds between health probes of the model servers (only with several of them)
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", 10))
+# Stream completions and stop reading as soon as a complete JSON value follows the <think> block
+OLLAMA_STREAM = os.getenv("OLLAMA_STREAM", "false").lower() == "true"
+# How long Ollama keeps the model (and its cached prompt prefix) loaded after a call, e.g. "30m"
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Fixed context size; changing num_ctx between calls forces a reload, so it is set once here
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", 0))
+
+# A prompt is either plain text (sent as one user message) or a list of chat messages
+Prompt = Union[str, List[Dict[str, str]]]
+
+# "scored": rank proposals deterministically with proposal_scorer (default)
+# "llm": ask the model to rank them (original behaviour)
+EVALUATION_MODE = os.getenv("EVALUATION_MODE", "scored").lower()
+# In scored mode, optionally let the model write the reasoning for the overall top 3
+EVALUATION_LLM_REASONING = os.getenv("EVALUATION_LLM_REASONING", "false").lower() == "true"
+
+# Context budget for one ranking prompt in llm mode; larger RFPs are ranked in
+# shards whose winners meet in a final round
+EVALUATION_CONTEXT_TOKENS = int(os.getenv("EVALUATION_CONTEXT_TOKENS", 4096))
+# Tokens kept free for the model's answer (the ranking JSON)
+EVALUATION_RESPONSE_TOKENS = int(os.getenv("EVALUATION_RESPONSE_TOKENS", 1536))
+EVALUATION_SHARD_WORKERS = int(os.getenv("EVALUATION_SHARD_WORKERS", 4))
+
+# Bump when a prompt template or its post-processing changes so cached
+# extractions produced by the old version are not reused
+PROMPT_VERSION = "3"
+
+_session = None
+_session_lock = threading.Lock()
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    Shared keep-alive session for Ollama calls.
+
+    urllib3's connection pool is thread-safe, so one session serves all worker
+    threads of a process.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # One connection pool per model server
+                adapter = HTTPAdapter(pool_connections=len(get_router().endpoints), pool_maxsize=OLLAMA_POOL_SIZE, pool_block=True)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({"Content-Type": "application/json"})
+                _session = session
+    return _session
+
+
+def get_router() -> LLMRouter:
+    """Process-wide router over OLLAMA_API_URLS (or OLLAMA_API_URL), created on first use."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = LLMRouter(
+                    OLLAMA_API_URLS or [OLLAMA_API_URL],
+                    OLLAMA_ENDPOINT_CONCURRENCY,
+                    health_interval=OLLAMA_HEALTH_INTERVAL,
+                    health_timeout=OLLAMA_CONNECT_TIMEOUT
+                )
+    return _router
 
 
 def parse_budget(budget_value: Any) -> float:
@@ -38,12 +142,115 @@ def flatten_string_value(value: Any) -> str:
     return str(value)
 
 
+_TAG_RE = re.compile(r'<[^>]+>')
+_JSON_DECODER = json.JSONDecoder()
+_CLOSERS = {'}': '{', ']': '['}
+# Spans nested deeper than this are not decoded (json would hit the recursion
+# limit); only their shallower nested spans are tried
+_MAX_DECODE_DEPTH = 200
+
+
+def _decode_span(s: str, start: int, end: int):
+    """
+    Decode s[start:end] if it is exactly one JSON value; returns (ok, value,
+    error_pos) where error_pos is where decoding failed, when known.
+    """
+    # Decoding a slice keeps errors cheap: JSONDecodeError counts lines up to the error
+    try:
+        value, stop = _JSON_DECODER.raw_decode(s[start:end])
+    except json.JSONDecodeError as e:
+        return False, None, start + e.pos
+    return stop == end - start, value, None
+
+
+def find_first_json_value(s: str):
+    """
+    Find the first balanced {...} or [...] span in s that is valid JSON.
+
+    One left-to-right pass matches brackets (ignoring brackets inside JSON
+    strings) and records the nested spans. A span is only decoded once its
+    brackets balance; if an outer span is not valid JSON its nested spans are
+    tried in order. Unclosed brackets are never decoded, so adversarial input
+    such as long runs of '{' stays linear.
+
+    When a span fails to decode at some position, the nested spans enclosing
+    that position fail there too (the decoder was inside them), so they are
+    not decoded again; nested invalid spans therefore cost one decode, not
+    one per nesting level.
+
+    Returns (True, value) or (False, None).
+    """
+    # stack frames: [open_pos, open_char, child_spans]
+    stack = []
+    in_string = False
+    escape = False
+
+    def try_span(span):
+        # (span, error_pos): error_pos is set when the span is known to fail there
+        pending = [(span, None)]
+        while pending:
+            (start, end, children, height), error_pos = pending.pop()
+            if error_pos is None and height <= _MAX_DECODE_DEPTH:
+                ok, value, error_pos = _decode_span(s, start, end)
+                if ok:
+                    return ok, value
+            for child in reversed(children):
+                known = error_pos if error_pos is not None and child[0] < error_pos < child[1] else None
+                pending.append((child, known))
+        return False, None
+
+    for i, ch in enumerate(s):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+            elif ch == '\n':
+                # JSON strings can't contain raw newlines; resync after stray quotes in prose
+                in_string = False
+            continue
+
+        if ch == '{' or ch == '[':
+            stack.append([i, ch, []])
+        elif ch == '"':
+            if stack:
+                in_string = True
+        elif ch in _CLOSERS and stack:
+            opener = _CLOSERS[ch]
+            # Look a few frames down for the matching opener; a stray closer is ignored
+            match = next((k for k in range(len(stack) - 1, max(-1, len(stack) - 9), -1) if stack[k][1] == opener), None)
+            if match is None:
+                continue
+            frame = stack[match]
+            # Openers above the match never closed; keep their balanced children as candidates
+            for unclosed in stack[match + 1:]:
+                frame[2].extend(unclosed[2])
+            del stack[match:]
+            span = (frame[0], i + 1, frame[2], 1 + max((child[3] for child in frame[2]), default=0))
+            if stack:
+                stack[-1][2].append(span)
+            else:
+                ok, value = try_span(span)
+                if ok:
+                    return ok, value
+
+    # Balanced spans nested inside brackets that never closed
+    for frame in stack:
+        for child in frame[2]:
+            ok, value = try_span(child)
+            if ok:
+                return ok, value
+    return False, None
+
+
 def extract_json_from_response(text: str) -> Dict[str, Any]:
     if not text:
         raise ValueError("Empty response from AI")
 
-    text = re.sub(r'<\/?think>', '', text, flags=re.IGNORECASE).strip()
-    text = re.sub(r'<[^>]+>', '', text).strip()
+    # Drops <think>/</think> and any other tags the model emits
+    text = _TAG_RE.sub('', text).strip()
     if "```json" in text:
         start = text.find("```json") + len("```json")
         end = text.find("```", start)
@@ -63,51 +270,16 @@ def extract_json_from_response(text: str) -> Dict[str, Any]:
             except json.JSONDecodeError:
                 pass
 
-    try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        pass
-    
-    def find_balanced_json(s: str):
-        length = len(s)
-        for i, ch in enumerate(s):
-            if ch == '{':
-                depth = 0
-                for j in range(i, length):
-                    if s[j] == '{':
-                        depth += 1
-                    elif s[j] == '}':
-                        depth -= 1
-                        if depth == 0:
-                            candidate = s[i:j+1]
-                            try:
-                                json.loads(candidate)
-                                return candidate
-                            except json.JSONDecodeError:
-                                break
-            elif ch == '[':
-                depth = 0
-                for j in range(i, length):
-                    if s[j] == '[':
-                        depth += 1
-                    elif s[j] == ']':
-                        depth -= 1
-                        if depth == 0:
-                            candidate = s[i:j+1]
-                            try:
-                                json.loads(candidate)
-                                return candidate
-                            except json.JSONDecodeError:
-                                break
-        return None
-
-    candidate = find_balanced_json(text)
-    if candidate:
+    if text[:1] in ('{', '['):
         try:
-            return json.loads(candidate)
+            return json.loads(text)
         except json.JSONDecodeError:
             pass
 
+    found, value = find_first_json_value(text)
+    if found:
+        return value
+
     brace_start = text.find('{')
     brace_end = text.rfind('}')
     if brace_start != -1 and brace_end != -1 and brace_end > brace_start:
@@ -128,47 +300,260 @@ def normalize_null_fields(data: Dict[str, Any], field_defaults: Dict[str, Any])
     return normalized
 
 
-def call_ollama(prompt: str) -> str:
+def build_ollama_payload(
+    prompt: Prompt,
+    keep_alive: str = None,
+    options: Dict[str, Any] = None,
+    response_format: Dict[str, Any] = None,
+    model: str = None
+) -> Dict[str, Any]:
+    messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
     payload = {
-        "model": MODEL,
-        "messages": [{"role": "user", "content": prompt}],
+        "model": model or MODEL,
+        "messages": messages,
         "stream": False  
     }
+    keep_alive = OLLAMA_KEEP_ALIVE if keep_alive is None else keep_alive
+    if keep_alive:
+        payload["keep_alive"] = keep_alive
+    merged_options = {"num_ctx": OLLAMA_NUM_CTX} if OLLAMA_NUM_CTX else {}
+    merged_options.update(options or {})
+    if merged_options:
+        payload["options"] = merged_options
+    if response_format is not None:
+        # JSON schema (or "json"); Ollama constrains decoding to match it
+        payload["format"] = response_format
+    return payload
+
+
+def parse_ollama_response(data: Dict[str, Any]) -> str:
+    if "message" in data:
+        return data["message"]["content"]
+    raise ValueError(f"Unexpected response format: {data}")
+
+
+class StreamingJsonDetector:
+    """
+    Accumulates streamed model output and reports when the first complete
+    top-level JSON object/array after deepseek's <think> block has arrived.
+
+    Each character is scanned once: the </think> search only looks at the new
+    chunk (plus the few characters a split tag can span), and the chunks are
+    joined only when a candidate JSON value is parsed. The scanner is string-
+    and escape-aware so braces inside JSON strings don't affect the depth.
+    """
+
+    _THINK_OPEN = "<think>"
+    _THINK_CLOSE = "</think>"
+
+    def __init__(self):
+        self._parts = []
+        self._length = 0
+        self._joined = ""
+        # Leading text until it is clear whether it opens a <think> block
+        self._lead = ""
+        self._in_think = False
+        # End of the reasoning seen so far, in case </think> is split across chunks
+        self._tail = ""
+        self._body_start = None
+        self._depth = 0
+        self._start = None
+        self._in_string = False
+        self._escape = False
+        self.complete = False
+
+    @property
+    def text(self) -> str:
+        if len(self._joined) != self._length:
+            self._joined = "".join(self._parts)
+            self._parts = [self._joined]
+        return self._joined
+
+    def _find_body_start(self, chunk: str, offset: int):
+        """Offset where the answer starts, once known; `chunk` begins at `offset`."""
+        if self._in_think:
+            window = self._tail + chunk
+            close = window.lower().find(self._THINK_CLOSE)
+            if close != -1:
+                return offset - len(self._tail) + close + len(self._THINK_CLOSE)
+            self._tail = window[-(len(self._THINK_CLOSE) - 1):]
+            return None
+
+        self._lead += chunk
+        lead_offset = offset + len(chunk) - len(self._lead)
+        stripped = self._lead.lstrip()
+        if not stripped:
+            return None
+        head = stripped[:len(self._THINK_OPEN)].lower()
+        if head == self._THINK_OPEN:
+            self._in_think = True
+            after_tag = len(self._lead) - len(stripped) + len(self._THINK_OPEN)
+            self._tail = ""
+            return self._find_body_start(self._lead[after_tag:], lead_offset + after_tag)
+        if self._THINK_OPEN.startswith(head):
+            # Could still turn out to be the start of a <think> tag
+            return None
+        return lead_offset + len(self._lead) - len(stripped)
+
+    def feed(self, chunk: str) -> bool:
+        """Add a chunk; returns True once a complete JSON value has been seen."""
+        if self.complete:
+            return True
+        offset = self._length
+        self._parts.append(chunk)
+        self._length += len(chunk)
+
+        if self._body_start is None:
+            self._body_start = self._find_body_start(chunk, offset)
+            if self._body_start is None:
+                return False
+            scan_from = self._body_start
+        else:
+            scan_from = offset
+
+        for i in range(scan_from, self._length):
+            ch = chunk[i - offset] if i >= offset else self.text[i]
+            if self._start is None:
+                if ch in "{[":
+                    self._start = i
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        json.loads(self.text[self._start:i + 1])
+                        self.complete = True
+                        return True
+                    except json.JSONDecodeError:
+                        self._start = None
+        return False
+
+
+def _call_ollama_streaming(url: str, payload: Dict[str, Any], on_token: Callable[[str], None] = None) -> str:
+    payload = dict(payload, stream=True)
+    detector = StreamingJsonDetector()
+    # Leaving the with-block early closes the connection, which makes Ollama
+    # stop generating instead of finishing a completion nobody will read.
+    with get_http_session().post(
+        url,
+        json=payload,
+        timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT),
+        stream=True
+    ) as response:
+        response.raise_for_status()
+        for raw_line in response.iter_lines():
+            if not raw_line:
+                continue
+            chunk = json.loads(raw_line)
+            if "error" in chunk:
+                raise ValueError(f"Ollama error: {chunk['error']}")
+            content = chunk.get("message", {}).get("content", "")
+            if content and on_token is not None:
+                on_token(content)
+            if content and detector.feed(content):
+                break
+            if chunk.get("done", False):
+                break
+    return detector.text
+
+
+def call_ollama(
+    prompt: Prompt,
+    stream: bool = None,
+    keep_alive: str = None,
+    options: Dict[str, Any] = None,
+    response_format: Dict[str, Any] = None,
+    on_token: Callable[[str], None] = None,
+    model: str = None
+) -> str:
+    """
+    Send a prompt to Ollama and return the response text. Passing `on_token`
+    switches to streaming and calls it with every chunk of output as it arrives.
+    `model` overrides OLLAMA_MODEL (see model_tiers).
+    """
+    payload = build_ollama_payload(prompt, keep_alive=keep_alive, options=options, response_format=response_format, model=model)
+    if stream is None:
+        stream = OLLAMA_STREAM or on_token is not None
     
-    headers = {"Content-Type": "application/json"}
-    
-    try:
-        response = requests.post(
-            OLLAMA_API_URL,
+    def send(url: str) -> str:
+        if stream:
+            return _call_ollama_streaming(url, payload, on_token)
+        response = get_http_session().post(
+            url,
             json=payload,
-            headers=headers,
-            timeout=300  
+            timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)
         )
         response.raise_for_status()
-        
-        data = response.json()
-        if "message" in data:
-            return data["message"]["content"]
-        else:
-            raise ValueError(f"Unexpected response format: {data}")
-            
-    except requests.RequestException as e:
-        raise ConnectionError(f"Failed to connect to Ollama at {OLLAMA_API_URL}: {e}")
+        return parse_ollama_response(response.json())
 
+    # Fails fast with CircuitOpenError while no model server is reachable
+    ollama_circuit.before_call()
+    start = time.perf_counter()
+    try:
+        # Fails over to the other model servers when one is unreachable or answers 5xx
+        content = get_router().call(send)
+    except NoEndpointAvailable as e:
+        ollama_circuit.record_failure()
+        raise ConnectionError(f"Failed to connect to Ollama: {e}")
+    except (requests.Timeout, requests.ConnectionError) as e:
+        # Only read timeouts get here: the server is up, the generation took too long
+        ollama_circuit.record_success()
+        raise TimeoutError(f"Ollama did not answer within {OLLAMA_READ_TIMEOUT}s: {e}")
+    except requests.HTTPError as e:
+        # 4xx: the request itself is wrong (e.g. unknown model), another tier may do better
+        ollama_circuit.record_success()
+        raise ValueError(f"Ollama rejected the request: {e}")
+    except Exception:
+        # The server answered, just not with what we expected; it is up
+        ollama_circuit.record_success()
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm_call")
+    ollama_circuit.record_success()
+    return content
 
-def process_client_request(text: str) -> Dict[str, Any]:
-    
-    json_example = '{"title":"...", "description":"...", "budget":"...", "items":[{"name":"...", "quantity":"...", "specs":"a string describing the specifications"}], "delivery_time":"...", "payment_terms":"...", "warranty":"..."}'
-    prompt = f"""Extract structured RFP from this text:
 
-"{text}"
+def build_client_prompt(text: str) -> List[Dict[str, str]]:
+    return CLIENT_EXTRACTION.render(text=text)
 
-Return ONLY a JSON object in this exact format (no markdown, no code blocks, no extra text):
-{json_example}"""
-    
-    response_text = call_ollama(prompt)
-    structured_data = extract_json_from_response(response_text)
-    
+
+def parse_extraction(task: str, response_text: str, structured: bool = False) -> Any:
+    """
+    JSON value of an extraction response.
+
+    Structured (schema-constrained) responses are validated directly; if that
+    fails, or in free-form mode, the JSON is searched for in the text.
+    """
+    with STAGE_SECONDS.time(stage="json_extraction"):
+        if structured:
+            try:
+                return parse_structured(task, response_text)
+            except ValueError:
+                PARSE_FAILURES.inc(task=task, mode="structured")
+        try:
+            return extract_json_from_response(response_text)
+        except ValueError:
+            PARSE_FAILURES.inc(task=task, mode="free_form")
+            raise
+
+
+def parse_client_response(response_text: str, structured: bool = False) -> Dict[str, Any]:
+    return postprocess_client_data(parse_extraction("client", response_text, structured))
+
+
+def postprocess_client_data(structured_data: Any) -> Dict[str, Any]:
     if isinstance(structured_data, list):
         structured_data = {"items": structured_data}
     
@@ -203,23 +588,64 @@ Return ONLY a JSON object in this exact format (no markdown, no code blocks, no
     return structured_data
 
 
-def process_vendor_proposal(text: str) -> Dict[str, Any]:
-    json_example = '{"price_per_piece": null, "total_price": null, "quantity": null, "terms": "...", "warranty": "...", "delivery_time": "..."}'
-    prompt = f"""Extract structured proposal from this text:
+def cache_model(task: str) -> str:
+    """Model part of the cache key: the task's tiers, since any of them may have answered."""
+    return "+".join(tiers_for(task, MODEL))
 
-"{text}"
 
-Return ONLY a JSON object in this exact format (no markdown, no code blocks, no extra text):
-{json_example}
+def lookup_cached_extraction(task: str, text: str):
+    cache = get_llm_cache()
+    if cache is None:
+        return None
+    cached = cache.get(make_cache_key(cache_model(task), PROMPT_VERSION, task, text))
+    CACHE_REQUESTS.inc(result="miss" if cached is None else "hit")
+    return cached
 
-Notes:
-- If vendor provides only a single price, prefer returning it as `price_per_piece`.
-- `total_price` is the overall total (price_per_piece * quantity) if provided or calculable.
-"""
-    
-    response_text = call_ollama(prompt)
-    structured_data = extract_json_from_response(response_text)
-    
+
+def store_cached_extraction(task: str, text: str, structured_data: Any):
+    cache = get_llm_cache()
+    if cache is not None:
+        cache.set(make_cache_key(cache_model(task), PROMPT_VERSION, task, text), structured_data)
+
+
+def extract_with_tiers(task: str, text: str, on_token: Callable[[str], None] = None) -> Dict[str, Any]:
+    """
+    Extract with the task's cheapest tier first; an answer that doesn't parse
+    or validate is escalated to the next tier (see model_tiers).
+    """
+    if task == "client":
+        prompt, parse_response = build_client_prompt(text), parse_client_response
+    else:
+        prompt, parse_response = build_vendor_prompt(text), parse_vendor_response
+    response_format = extraction_format(task)
+
+    def attempt(model: str) -> Dict[str, Any]:
+        return parse_response(
+            call_ollama(prompt, response_format=response_format, on_token=on_token, model=model),
+            structured=response_format is not None
+        )
+
+    return run_tiers(task, tiers_for(task, MODEL), attempt, text)
+
+
+def process_client_request(text: str, on_token: Callable[[str], None] = None) -> Dict[str, Any]:
+    cached = lookup_cached_extraction("client", text)
+    if cached is not None:
+        return cached
+    structured_data = extract_with_tiers("client", text, on_token)
+    store_cached_extraction("client", text, structured_data)
+    return structured_data
+
+
+def build_vendor_prompt(text: str) -> List[Dict[str, str]]:
+    return VENDOR_EXTRACTION.render(text=text)
+
+
+def parse_vendor_response(response_text: str, structured: bool = False) -> Dict[str, Any]:
+    return postprocess_vendor_data(parse_extraction("vendor", response_text, structured))
+
+
+def postprocess_vendor_data(structured_data: Dict[str, Any]) -> Dict[str, Any]:
     structured_data = normalize_null_fields(structured_data, {
         "price_per_piece": None,
         "total_price": None,
@@ -279,10 +705,111 @@ Notes:
     structured_data["price_per_piece"] = ppp
     structured_data["total_price"] = total
     structured_data["price"] = ppp
+    # Canonical numbers next to the free text so ranking never re-parses it
+    structured_data["delivery_days"] = delivery_days(structured_data.get("delivery_time"))
+    structured_data["warranty_months"] = warranty_months(structured_data.get("warranty"))
     
     return structured_data
 
 
+def rule_extract_vendor(text: str) -> Dict[str, Any]:
+    """The "rules" tier: simple quotes extracted by rule_extractor, None when it isn't confident."""
+    data = extract_confident_vendor_quote(text)
+    return None if data is None else postprocess_vendor_data(data)
+
+
+if RULE_EXTRACTOR_ENABLED:
+    register_extractor("rules", "vendor", rule_extract_vendor, default=True)
+
+
+def process_vendor_proposal(text: str, on_token: Callable[[str], None] = None) -> Dict[str, Any]:
+    cached = lookup_cached_extraction("vendor", text)
+    if cached is not None:
+        return cached
+    structured_data = extract_with_tiers("vendor", text, on_token)
+    store_cached_extraction("vendor", text, structured_data)
+    return structured_data
+
+
+def build_batch_prompt(task: str, documents: Dict[str, str]) -> List[Dict[str, str]]:
+    """One extraction prompt covering several short documents, keyed by id."""
+    template = CLIENT_BATCH_EXTRACTION if task == "client" else VENDOR_BATCH_EXTRACTION
+    return template.render(
+        count=len(documents),
+        ids=", ".join(f'"{doc_id}"' for doc_id in documents),
+        documents="\n\n".join(f'Document {doc_id}:\n"{text}"' for doc_id, text in documents.items())
+    )
+
+
+def parse_batch_response(task: str, response_text: str, ids) -> Dict[str, Dict[str, Any]]:
+    """Split a batch answer back into per-document extractions; unknown or missing ids are left out."""
+    data = extract_json_from_response(response_text)
+    if isinstance(data, dict):
+        data = data.get("results") or data.get("documents") or [data]
+    if not isinstance(data, list):
+        raise ValueError(f"Expected JSON array from batch extraction, got {type(data).__name__}")
+
+    postprocess = postprocess_client_data if task == "client" else postprocess_vendor_data
+    wanted = {str(doc_id) for doc_id in ids}
+    results = {}
+    for entry in data:
+        if not isinstance(entry, dict):
+            continue
+        doc_id = str(entry.pop("id", ""))
+        if doc_id in wanted and doc_id not in results:
+            try:
+                results[doc_id] = postprocess(entry)
+            except Exception as e:
+                logger.warning("Batch entry %s could not be post-processed: %s", doc_id, e)
+    return results
+
+
+def process_extraction_batch(task: str, documents: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Extract several documents of the same task with one model call.
+
+    Cached documents are answered from the cache and simple ones by the
+    local tiers (e.g. the rule-based extractor); documents the model left
+    out of its answer, or answered with an invalid extraction, are missing
+    from the result so the caller can process them individually (and
+    escalate them through the model tiers). The batch itself uses the task's
+    cheapest model tier.
+    """
+    results = {}
+    pending = {}
+    for doc_id, text in documents.items():
+        cached = lookup_cached_extraction(task, text)
+        if cached is not None:
+            results[doc_id] = cached
+        else:
+            pending[doc_id] = text
+    if len(pending) > 1:
+        # Simple documents the local tiers can answer stay out of the model call
+        for doc_id in list(pending):
+            structured_data = run_local_tiers(task, pending[doc_id], MODEL)
+            if structured_data is not None:
+                results[doc_id] = structured_data
+                del pending[doc_id]
+
+    if len(pending) == 1:
+        doc_id, text = next(iter(pending.items()))
+        results[doc_id] = process_client_request(text) if task == "client" else process_vendor_proposal(text)
+    elif pending:
+        model = model_tiers(task, MODEL)[0]
+        extracted = parse_batch_response(task, call_ollama(build_batch_prompt(task, pending), model=model), pending.keys())
+        for doc_id, structured_data in extracted.items():
+            try:
+                validate_extraction(task, structured_data)
+            except ValueError as e:
+                record_tier(task, model, "escalated")
+                logger.info("Batch entry %s left for individual extraction: %s", doc_id, e)
+                continue
+            record_tier(task, model, "served")
+            store_cached_extraction(task, pending[doc_id], structured_data)
+            results[doc_id] = structured_data
+    return results
+
+
 def generate_vendor_message(rfp_data: Dict[str, Any]) -> str:
     items_str = "\n".join([
         f"  - {item.get('name', 'N/A')}: {item.get('quantity', 'N/A')} units ({item.get('specs', 'N/A')})"
@@ -337,8 +864,8 @@ Please review and let us know if you would like to accept this proposal or reque
     return message
 
 
-def evaluate_proposals(proposals: list) -> Dict[str, Any]:
-    proposals_text = "\n\n".join([
+def format_proposal_block(i: int, p: Dict[str, Any]) -> str:
+    return (
         f"Proposal {i+1}:\n"
         f"- Vendor Email: {p.get('vendor_email')}\n"
         f"- Vendor ID: {p.get('vendor_id')}\n"
@@ -349,97 +876,28 @@ def evaluate_proposals(proposals: list) -> Dict[str, Any]:
         f"- Delivery time: {p.get('extracted', {}).get('delivery_time', 'N/A')}\n"
         f"- Warranty: {p.get('extracted', {}).get('warranty', 'N/A')}\n"
         f"- Payment Terms: {p.get('extracted', {}).get('terms', 'N/A')}"
+    )
+
+
+def build_evaluation_prompt(proposals: list) -> List[Dict[str, str]]:
+    proposals_text = "\n\n".join([
+        format_proposal_block(i, p)
         for i, p in enumerate(proposals)
     ])
-    
-    json_example = '''{
-    "best_price": [{
-        "proposal_index": 0,
-        "reasoning": "why this has best price"
-    },{
-        "proposal_index": 1,
-        "reasoning": "why this has second best price"
-    },{
-        "proposal_index": 2,
-        "reasoning": "why this has third best price"
-    }],
-    "best_warranty": [{
-        "proposal_index": 0,
-        "reasoning": "why this has best warranty"
-    },{
-        "proposal_index": 1,
-        "reasoning": "why this has second best warranty"
-    },{
-        "proposal_index": 2,
-        "reasoning": "why this has third best warranty"
-    }],
-    "best_delivery": [{
-        "proposal_index": 0,
-        "reasoning": "why this has best delivery"
-    },{
-        "proposal_index": 2,
-        "reasoning": "why this has second best delivery"
-    },{
-        "proposal_index": 3,
-        "reasoning": "why this has third best delivery"
-    }],
-    "best_quantity": [{
-        "proposal_index": 0,
-        "reasoning": "why this has best quantity"
-    },{
-        "proposal_index": 1,
-        "reasoning": "why this has second best quantity"
-    },{
-        "proposal_index": 2,
-        "reasoning": "why this has third best quantity"
-    }],
-    "overall_best": [{
-        "proposal_index": 0,
-        "reasoning": "comprehensive reasoning for overall best",
-        "scores": {
-            "price_score": 8,
-            "warranty_score": 7,
-            "delivery_score": 9,
-            "overall_score": 8
-        }
-    },{
-        "proposal_index": 1,
-        "reasoning": "comprehensive reasoning for overall second best",
-        "scores": {
-            "price_score": 7,
-            "warranty_score": 6,
-            "delivery_score": 8,
-            "overall_score": 7
-        }
-    },{
-        "proposal_index": 2,
-        "reasoning": "comprehensive reasoning for overall third best",
-        "scores": {
-            "price_score": 6,
-            "warranty_score": 5,
-            "delivery_score": 7,
-            "overall_score": 6
-        }
-    }]
-}'''
-    
-    prompt = f"""Rank these {len(proposals)} proposals in 5 categories. Return JSON only.
-
-{proposals_text}
+    return PROPOSAL_RANKING.render(
+        count=len(proposals),
+        last_index=len(proposals) - 1,
+        proposals=proposals_text
+    )
 
-Rank by: price (lowest), warranty (best), delivery (fastest), quantity (best fit), overall (best value).
-Return JSON with keys: best_price, best_warranty, best_delivery, best_quantity, overall_best
-Each has 3 items with proposal_index (0 to {len(proposals)-1}), reasoning (1 sentence), scores.
 
-Format:
-{json_example}"""
-    
+def parse_evaluation_response(proposals: list, response_text: str) -> Dict[str, Any]:
     try:
-        response_text = call_ollama(prompt)
-        result = extract_json_from_response(response_text)
+        with STAGE_SECONDS.time(stage="json_extraction"):
+            result = extract_json_from_response(response_text)
         
         if isinstance(result, list):
-            print(f"AI returned list instead of dict, converting to expected format...")
+            logger.warning("AI returned list instead of dict, converting to expected format")
             ranking_list = result[:3] if len(result) >= 3 else result
             result = {
                 "best_price": ranking_list,
@@ -450,10 +908,11 @@ Format:
             }
         
         if not isinstance(result, dict):
-            print(f"Warning: AI returned {type(result).__name__}, cannot process.")
+            logger.warning("AI returned %s, cannot process", type(result).__name__)
             raise ValueError(f"Expected dict from AI, got {type(result).__name__}")
     except Exception as e:
-        print(f"AI call or parsing failed: {e}")
+        PARSE_FAILURES.inc(task="evaluation", mode="free_form")
+        logger.error("AI call or parsing failed: %s", e)
         raise 
     
     try:
@@ -474,22 +933,22 @@ Format:
                     
                 idx = rank.get("proposal_index")
                 if idx is None:
-                    print(f"Warning: {category_name} rank {i+1} missing proposal_index")
+                    logger.warning("%s rank %d missing proposal_index", category_name, i + 1)
                     continue
                     
                 if not (0 <= idx < len(proposals)):
-                    print(f"Warning: {category_name} has invalid proposal_index {idx} (valid: 0-{len(proposals)-1})")
+                    logger.warning("%s has invalid proposal_index %s (valid: 0-%d)", category_name, idx, len(proposals) - 1)
                     continue
                 
                 if idx in seen_indices:
                     vendor = proposals[idx].get('vendor_email', 'N/A')
-                    print(f"Warning: {category_name} has duplicate proposal_index {idx} (vendor: {vendor}) - skipping")
+                    logger.warning("%s has duplicate proposal_index %s (vendor: %s) - skipping", category_name, idx, vendor)
                     continue
                 
                 vendor_id = proposals[idx].get('vendor_id')
                 if vendor_id and vendor_id in seen_vendor_ids:
                     vendor = proposals[idx].get('vendor_email', 'N/A')
-                    print(f"Warning: {category_name} has duplicate vendor {vendor} - skipping")
+                    logger.warning("%s has duplicate vendor %s - skipping", category_name, vendor)
                     continue
                 
                 seen_indices.add(idx)
@@ -528,44 +987,189 @@ Format:
             "overall_best_top3": get_top_n(overall_best_list, 3, "Overall Best"),
             "total_proposals_evaluated": len(proposals)
         }
+    except Exception:
+        logger.exception("AI evaluation failed, using fallback")
+        return fallback_evaluation(proposals)
+
+
+def build_reasoning_prompt(evaluation_result: Dict[str, Any]) -> List[Dict[str, str]]:
+    lines = []
+    for i, entry in enumerate(evaluation_result.get("overall_best_top3", []), 1):
+        extracted = entry["proposal"].get("extracted", {})
+        lines.append(
+            f"Rank {i}: vendor {entry['proposal'].get('vendor_email')}, "
+            f"total price ${extracted.get('total_price', 'N/A')}, "
+            f"price per piece ${extracted.get('price_per_piece', 'N/A')}, "
+            f"quantity {extracted.get('quantity', 'N/A')}, "
+            f"delivery {extracted.get('delivery_time', 'N/A')}, "
+            f"warranty {extracted.get('warranty', 'N/A')}, "
+            f"scores {entry.get('scores', {})}"
+        )
+    return RANKING_REASONING.render(ranking="\n".join(lines))
+
+
+def apply_llm_reasoning(evaluation_result: Dict[str, Any], response_text: str) -> Dict[str, Any]:
+    data = extract_json_from_response(response_text)
+    sentences = data.get("reasoning", []) if isinstance(data, dict) else data
+    for entry, sentence in zip(evaluation_result.get("overall_best_top3", []), sentences):
+        if isinstance(sentence, str) and sentence.strip():
+            entry["reasoning"] = sentence.strip()
+    return evaluation_result
+
+
+def estimate_tokens(prompt: Prompt) -> int:
+    """Rough token count (~4 characters per token for English/JSON)."""
+    if not isinstance(prompt, str):
+        prompt = "\n".join(message["content"] for message in prompt)
+    return len(prompt) // 4 + 1
+
+
+def evaluation_shard_size(proposals: list) -> int:
+    """How many proposals fit into one ranking prompt within EVALUATION_CONTEXT_TOKENS."""
+    fixed = estimate_tokens(build_evaluation_prompt([]))
+    per_proposal = max(
+        (estimate_tokens(format_proposal_block(i, p)) + 1 for i, p in enumerate(proposals)),
+        default=1
+    )
+    available = EVALUATION_CONTEXT_TOKENS - EVALUATION_RESPONSE_TOKENS - fixed
+    # Below 4 a shard can't both produce a top 3 and shrink the field
+    return max(4, available // per_proposal)
+
+
+def split_into_shards(proposals: list, shard_size: int) -> list:
+    shard_count = -(-len(proposals) // shard_size)
+    # Spread proposals evenly so no shard is a tiny remainder
+    return [proposals[i::shard_count] for i in range(shard_count)]
+
+
+def shard_winners(result: Dict[str, Any], limit: int) -> list:
+    """Proposals placed in any category of a shard's ranking, best-placed first."""
+    winners, seen = [], set()
+    categories = [result.get(key, []) for key in (
+        "overall_best_top3", "best_price_top3", "best_delivery_top3", "best_warranty_top3", "best_quantity_top3"
+    )]
+    for rank in range(3):
+        for entries in categories:
+            if rank < len(entries):
+                proposal = entries[rank]["proposal"]
+                if id(proposal) not in seen:
+                    seen.add(id(proposal))
+                    winners.append(proposal)
+    return winners[:limit]
+
+
+def round_winners(candidates: list, shards: list, results: list):
+    """
+    Proposals that go on to the next tournament round: at most half of each
+    shard. None when the round didn't narrow the field (or placed nobody), so
+    the caller stops instead of ranking the same candidates forever.
+    """
+    winners = [
+        winner
+        for shard, result in zip(shards, results)
+        for winner in shard_winners(result, max(1, len(shard) // 2))
+    ]
+    if not winners or len(winners) >= len(candidates):
+        logger.warning("Evaluation round did not narrow %d candidates; ranking them in one call", len(candidates))
+        return None
+    return winners
+
+
+def rank_with_llm(proposals: list) -> Dict[str, Any]:
+    """LLM ranking; an unparseable answer is escalated through the evaluation tiers."""
+    prompt = build_evaluation_prompt(proposals)
+    return run_tiers(
+        "evaluation",
+        model_tiers("evaluation", MODEL),
+        lambda model: parse_evaluation_response(proposals, call_ollama(prompt, model=model))
+    )
+
+
+def _rank_shard(shard: list) -> Dict[str, Any]:
+    try:
+        return rank_with_llm(shard)
     except Exception as e:
-        print(f"Warning: AI evaluation failed, using fallback: {e}")
-        import traceback
-        traceback.print_exc()
-        
-        def get_price(proposal):
-            extracted = proposal.get('extracted', {})
-            total = extracted.get('total_price')
-            if total is not None:
-                try:
-                    return float(total)
-                except (ValueError, TypeError):
-                    pass
-            ppp = extracted.get('price_per_piece')
-            if ppp is not None:
-                try:
-                    return float(ppp)
-                except (ValueError, TypeError):
-                    pass
-            return float('inf')  
-        
-        sorted_by_price = sorted(proposals, key=get_price)[:min(3, len(proposals))]
-        
-        def create_fallback_top3(count=3):
-            result = []
-            for i in range(min(count, len(proposals))):
-                result.append({
-                    "proposal": proposals[i],
-                    "reasoning": f"Rank {i+1} (fallback - AI evaluation failed)",
-                    "scores": {}
-                })
-            return result
-        
-        return {
-            "best_price_top3": [{"proposal": p, "reasoning": f"Rank {i+1} by price (fallback)", "scores": {}} for i, p in enumerate(sorted_by_price)],
-            "best_warranty_top3": create_fallback_top3(),
-            "best_delivery_top3": create_fallback_top3(),
-            "best_quantity_top3": create_fallback_top3(),
-            "overall_best_top3": [{"proposal": p, "reasoning": f"Rank {i+1} by price (fallback)", "scores": {}} for i, p in enumerate(sorted_by_price)],
-            "total_proposals_evaluated": len(proposals)
-        }
+        logger.warning("Shard ranking failed, using fallback for %d proposals: %s", len(shard), e)
+        return fallback_evaluation(shard)
+
+
+def evaluate_proposals_map_reduce(proposals: list) -> Dict[str, Any]:
+    """
+    Tournament ranking for RFPs whose proposals don't fit into one prompt.
+
+    Shards are ranked in parallel; each shard forwards at most half of its
+    proposals (those placed in any category) to the next round, until the
+    remaining candidates fit into a single final prompt.
+    """
+    shard_size = evaluation_shard_size(proposals)
+    candidates = proposals
+    round_number = 1
+    while len(candidates) > shard_size:
+        shards = split_into_shards(candidates, shard_size)
+        logger.info("Evaluation round %d: %d proposals in %d shards", round_number, len(candidates), len(shards))
+        with ThreadPoolExecutor(max_workers=max(1, EVALUATION_SHARD_WORKERS)) as pool:
+            results = list(pool.map(_rank_shard, shards))
+        winners = round_winners(candidates, shards, results)
+        if winners is None:
+            break
+        candidates = winners
+        round_number += 1
+
+    result = rank_with_llm(candidates)
+    result["total_proposals_evaluated"] = len(proposals)
+    return result
+
+
+def evaluate_proposals(proposals: list, scored: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Rank proposals; `scored` is score_proposals(proposals) when the caller already has it."""
+    if EVALUATION_MODE == "llm":
+        return evaluate_proposals_map_reduce(proposals)
+
+    result = scored if scored is not None else score_proposals(proposals)
+    if EVALUATION_LLM_REASONING and result["overall_best_top3"]:
+        try:
+            apply_llm_reasoning(result, call_ollama(build_reasoning_prompt(result), model=model_tiers("evaluation", MODEL)[0]))
+        except Exception as e:
+            # The ranking stands on its own; keep the generated reasoning
+            logger.warning("AI reasoning failed, keeping scored reasoning: %s", e)
+    return result
+
+
+def fallback_evaluation(proposals: list) -> Dict[str, Any]:
+    """Price-only ranking used when the AI evaluation cannot be used."""
+    def get_price(proposal):
+        extracted = proposal.get('extracted', {})
+        total = extracted.get('total_price')
+        if total is not None:
+            try:
+                return float(total)
+            except (ValueError, TypeError):
+                pass
+        ppp = extracted.get('price_per_piece')
+        if ppp is not None:
+            try:
+                return float(ppp)
+            except (ValueError, TypeError):
+                pass
+        return float('inf')  
+    
+    sorted_by_price = sorted(proposals, key=get_price)[:min(3, len(proposals))]
+    
+    def create_fallback_top3(count=3):
+        result = []
+        for i in range(min(count, len(proposals))):
+            result.append({
+                "proposal": proposals[i],
+                "reasoning": f"Rank {i+1} (fallback - AI evaluation failed)",
+                "scores": {}
+            })
+        return result
+    
+    return {
+        "best_price_top3": [{"proposal": p, "reasoning": f"Rank {i+1} by price (fallback)", "scores": {}} for i, p in enumerate(sorted_by_price)],
+        "best_warranty_top3": create_fallback_top3(),
+        "best_delivery_top3": create_fallback_top3(),
+        "best_quantity_top3": create_fallback_top3(),
+        "overall_best_top3": [{"proposal": p, "reasoning": f"Rank {i+1} by price (fallback)", "scores": {}} for i, p in enumerate(sorted_by_price)],
+        "total_proposals_evaluated": len(proposals)
+    }
@@ -1,10 +1,106 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import os
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import aio_pika
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+
+import metrics
+from metrics import MESSAGES, IN_FLIGHT
+from ai_service import get_router
+from async_consumer import (
+    RABBITMQ_HOST,
+    RABBITMQ_PORT,
+    RABBITMQ_USER,
+    RABBITMQ_PASS,
+    AsyncOllamaClient,
+    SingleFlight,
+    extract
+)
+from idempotency import get_ledger
+from models import (
+    ProcessClientRequestPayload,
+    ProcessVendorProposalPayload,
+    ProcessedRFPResponse,
+    ProcessedProposalResponse
+)
+from queue_consumer import build_client_response, build_vendor_response
+from progress_events import PROGRESS_EXCHANGE, TERMINAL_STAGES, EventBus, format_sse, make_event
+from resilience import CircuitOpenError
+from structured_logging import configure_logging, get_logger, message_context
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# Concurrent model calls made by the REST endpoints
+API_LLM_CONCURRENCY = int(os.getenv("API_LLM_CONCURRENCY", 4))
+# Requests admitted at once (running or waiting for a model slot); the rest get 503
+API_MAX_PENDING = int(os.getenv("API_MAX_PENDING", 64))
+# Label of the REST endpoints' metrics
+CONSUMER_NAME = "api"
+# Comment line sent on idle event streams so proxies don't close them
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", 15))
+
+llm: AsyncOllamaClient = None
+inflight_extractions = SingleFlight()
+pending_requests = 0
+progress_bus = EventBus()
+
+
+async def relay_progress_events():
+    """Feed the events the consumers publish on rfp.progress into progress_bus."""
+    while True:
+        try:
+            connection = await aio_pika.connect_robust(
+                host=RABBITMQ_HOST,
+                port=RABBITMQ_PORT,
+                login=RABBITMQ_USER,
+                password=RABBITMQ_PASS
+            )
+            async with connection:
+                channel = await connection.channel()
+                exchange = await channel.declare_exchange(PROGRESS_EXCHANGE, aio_pika.ExchangeType.FANOUT)
+                queue = await channel.declare_queue(exclusive=True, auto_delete=True)
+                await queue.bind(exchange)
+                async with queue.iterator(no_ack=True) as deliveries:
+                    async for delivery in deliveries:
+                        try:
+                            progress_bus.publish(json.loads(delivery.body))
+                        except ValueError:
+                            continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Only the consumers' events are missing; the REST fast path still reports its own
+            logger.warning("Progress event relay unavailable, retrying: %s", e)
+            await asyncio.sleep(5)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global llm
+    configure_logging()
+    llm = AsyncOllamaClient(API_LLM_CONCURRENCY)
+    relay = asyncio.create_task(relay_progress_events())
+    try:
+        yield
+    finally:
+        relay.cancel()
+        await llm.close()
+
 
 app = FastAPI(
     title="RFP AI Processing API",
     description="Queue-based AI processing for RFP and Proposals",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware for Node.js frontend
@@ -24,18 +120,133 @@ async def health_check():
         "status": "ok",
         "service": "RFP AI Processing API",
         "mode": "queue-based",
-        "message": "AI processing runs via queue_consumer.py listening to ai_request_queue"
+        "message": "AI processing runs via queue_consumer.py listening to ai_request_queue; "
+                   "/api/process-client-request and /api/process-vendor-proposal answer directly",
+        "model_servers": get_router().snapshot()
     }
 
 
-@app.post("/api/process-client-request")
-async def process_client_request_endpoint():
-    raise HTTPException(status_code=501, detail="Use queue_consumer.py instead. Publish to ai_request_queue")
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics of this process"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# REST answers are never published to ai_responses_queue, so they are kept
+# apart from the consumers' ledger entries: a queue delivery of the same
+# messageId must not "re-publish" a response that was never sent
+REST_LEDGER_PREFIX = "rest:"
+REST_LEDGER_QUEUE = "rest"
+
 
+def lookup_rest_response(message_id: Optional[str]) -> Optional[dict]:
+    ledger = get_ledger()
+    if ledger is None or not message_id:
+        return None
+    return ledger.get(REST_LEDGER_PREFIX + message_id)
 
-@app.post("/api/process-vendor-proposal")
-async def process_vendor_proposal_endpoint():
-    raise HTTPException(status_code=501, detail="Use queue_consumer.py instead. Publish to ai_request_queue")
+
+def record_rest_response(message_id: Optional[str], response: dict):
+    ledger = get_ledger()
+    if ledger is None or not message_id:
+        return
+    try:
+        ledger.record(REST_LEDGER_PREFIX + message_id, REST_LEDGER_QUEUE, response)
+    except Exception as e:
+        # The response is already answered; a missing entry only costs a re-run on retry
+        logger.warning("Failed to record messageId in idempotency ledger: %s", e)
+
+
+async def process_request(origin: str, message: dict, build_response) -> dict:
+    """
+    Same extraction as the queue consumers, answered directly.
+
+    Identical texts that are already being extracted share that model call,
+    and a messageId this endpoint already answered returns its recorded response.
+    """
+    global pending_requests
+    if pending_requests >= API_MAX_PENDING:
+        MESSAGES.inc(consumer=CONSUMER_NAME, outcome="rejected")
+        raise HTTPException(status_code=503, detail="Too many requests in progress", headers={"Retry-After": "1"})
+
+    message_id = message.get("messageId") or str(uuid.uuid4())
+    rfp_id = message.get("rfp_id")
+    pending_requests += 1
+    try:
+        with message_context(message_id), IN_FLIGHT.track_inprogress(consumer=CONSUMER_NAME):
+            previous = await asyncio.to_thread(lookup_rest_response, message.get("messageId"))
+            if previous is not None:
+                MESSAGES.inc(consumer=CONSUMER_NAME, outcome="duplicate")
+                return previous["response"]
+
+            text = message["text"]
+            progress_bus.publish(make_event("extracting", message_id, rfp_id))
+            try:
+                structured_data = await inflight_extractions.do((origin, text), lambda: extract(llm, origin, text))
+            except (ConnectionError, TimeoutError, ValueError) as e:
+                MESSAGES.inc(consumer=CONSUMER_NAME, outcome="failed")
+                progress_bus.publish(make_event("failed", message_id, rfp_id, error=f"{type(e).__name__}: {e}"))
+                if isinstance(e, CircuitOpenError):
+                    raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+                if isinstance(e, ConnectionError):
+                    raise HTTPException(status_code=502, detail=str(e))
+                if isinstance(e, TimeoutError):
+                    raise HTTPException(status_code=504, detail=str(e))
+                logger.error("Unparseable model response: %s", e)
+                raise HTTPException(status_code=502, detail="Model returned no usable JSON")
+            progress_bus.publish(make_event("parsed", message_id, rfp_id, extracted=structured_data))
+
+            response = build_response(message, structured_data, message_id)
+            await asyncio.to_thread(record_rest_response, message.get("messageId"), response)
+            MESSAGES.inc(consumer=CONSUMER_NAME, outcome="ok")
+            progress_bus.publish(make_event("completed", message_id, rfp_id))
+            return response
+    finally:
+        pending_requests -= 1
+
+
+@app.post("/api/process-client-request", response_model=ProcessedRFPResponse)
+async def process_client_request_endpoint(payload: ProcessClientRequestPayload):
+    """Extract a structured RFP from client text without going through ai_request_queue"""
+    return await process_request("client", payload.model_dump(), build_client_response)
+
+
+@app.post("/api/process-vendor-proposal", response_model=ProcessedProposalResponse)
+async def process_vendor_proposal_endpoint(payload: ProcessVendorProposalPayload):
+    """Extract proposal data from vendor text without going through ai_request_queue"""
+    return await process_request("vendor", payload.model_dump(), build_vendor_response)
+
+
+async def event_stream(request: Request, message_id: Optional[str], rfp_id: Optional[str]):
+    with progress_bus.subscribe(message_id, rfp_id) as events:
+        while True:
+            try:
+                event = await asyncio.wait_for(events.get(), timeout=SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
+            # An RFP stream stays open for further proposals and evaluations
+            if message_id and event.get("message_id") == message_id and event["stage"] in TERMINAL_STAGES:
+                return
+
+
+@app.get("/api/events")
+async def progress_events_endpoint(request: Request, message_id: Optional[str] = None, rfp_id: Optional[str] = None):
+    """
+    Server-sent events for a messageId and/or rfp_id: pipeline stages
+    (queued, extracting, parsed, evaluating, published, ...) and, with
+    PROGRESS_TOKENS=true on the consumers, the model output as it streams.
+    """
+    if not (message_id or rfp_id):
+        raise HTTPException(status_code=400, detail="message_id or rfp_id is required")
+    return StreamingResponse(
+        event_stream(request, message_id, rfp_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,473 @@
+"""
+Asyncio Consumer: alternative to queue_consumer.py + proposal_evaluator.py
+- Consumes ai_request_queue and proposals_evaluation_queue in one event loop
+- Runs many deliveries concurrently, with a semaphore bounding in-flight Ollama calls
+- Publishes results with publisher confirms without blocking the loop
+
+Prompt building, response parsing and output payloads are shared with the
+synchronous consumers, so both entry points produce identical messages.
+"""
+import asyncio
+import json
+import os
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+import aio_pika
+import httpx
+from dotenv import load_dotenv
+
+from ai_service import (
+    OLLAMA_CONNECT_TIMEOUT,
+    OLLAMA_READ_TIMEOUT,
+    MODEL,
+    Prompt,
+    get_router,
+    build_ollama_payload,
+    parse_ollama_response,
+    build_client_prompt,
+    parse_client_response,
+    build_vendor_prompt,
+    parse_vendor_response,
+    EVALUATION_MODE,
+    EVALUATION_LLM_REASONING,
+    build_evaluation_prompt,
+    parse_evaluation_response,
+    build_reasoning_prompt,
+    apply_llm_reasoning,
+    evaluation_shard_size,
+    split_into_shards,
+    round_winners,
+    fallback_evaluation,
+    lookup_cached_extraction,
+    store_cached_extraction
+)
+from structured_output import extraction_format
+from structured_logging import configure_logging, get_logger, set_message_id
+from metrics import STAGE_SECONDS, MESSAGES, IN_FLIGHT, EVALUATIONS, queue_wait_seconds, start_metrics_server
+from progress_events import emit
+from llm_router import NoEndpointAvailable
+from model_tiers import tiers_for, model_tiers, run_tiers_async
+from resilience import (
+    RETRY_MAX_ATTEMPTS,
+    ERROR_HEADER,
+    RETRY_EXCHANGE,
+    DEAD_LETTER_EXCHANGE,
+    PermanentError,
+    ollama_circuit,
+    next_retry,
+    retry_delay_ms,
+    retry_queue_name,
+    retry_queue_arguments,
+    dead_letter_queue_name
+)
+from queue_consumer import (
+    INPUT_QUEUE,
+    OUTPUT_QUEUE,
+    build_client_response,
+    build_vendor_response,
+    record_processed_message
+)
+from idempotency import get_ledger
+from evaluation_state import get_evaluation_state
+from proposal_scorer import score_proposals
+from proposal_evaluator import (
+    INPUT_QUEUE as EVALUATION_INPUT_QUEUE,
+    OUTPUT_QUEUE as EVALUATION_OUTPUT_QUEUE,
+    build_evaluation_output,
+    ranking_summary
+)
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")
+RABBITMQ_PORT = int(os.getenv("RABBITMQ_PORT", 5672))
+RABBITMQ_USER = os.getenv("RABBITMQ_USER", "guest")
+RABBITMQ_PASS = os.getenv("RABBITMQ_PASS", "guest")
+
+# Deliveries held in flight per queue; most of them are just waiting on the LLM
+ASYNC_PREFETCH = int(os.getenv("ASYNC_PREFETCH", 200))
+# Concurrent requests sent to the model server
+ASYNC_LLM_CONCURRENCY = int(os.getenv("ASYNC_LLM_CONCURRENCY", 4))
+# Label of this consumer's metrics
+CONSUMER_NAME = "async_consumer"
+
+
+def lookup_processed_message(message: dict):
+    """Idempotency ledger entry of the message's messageId, if any."""
+    ledger = get_ledger()
+    return ledger.get(message["messageId"]) if ledger and message.get("messageId") else None
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """httpx counterpart of llm_router.is_endpoint_failure."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, (httpx.NetworkError, httpx.ConnectTimeout, httpx.RemoteProtocolError))
+
+
+class AsyncOllamaClient:
+    """Non-blocking counterpart of ai_service.call_ollama."""
+
+    def __init__(self, concurrency: int = ASYNC_LLM_CONCURRENCY):
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(OLLAMA_READ_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=max(1, concurrency), max_keepalive_connections=max(1, concurrency))
+        )
+
+    async def call(self, prompt: Prompt, response_format: Dict[str, Any] = None, model: str = None) -> str:
+        payload = build_ollama_payload(prompt, response_format=response_format, model=model)
+
+        async def send(url: str) -> httpx.Response:
+            response = await self._client.post(url, json=payload)
+            response.raise_for_status()
+            return response
+
+        async with self._semaphore:
+            # Shares the circuit with call_ollama; waits out an outage instead of failing
+            while (remaining := ollama_circuit.retry_after()) > 0:
+                await asyncio.sleep(min(remaining, 5.0))
+            ollama_circuit.before_call()
+            try:
+                with STAGE_SECONDS.time(stage="llm_call"):
+                    # Same model servers, balancing and failover as call_ollama
+                    response = await get_router().call_async(send, is_endpoint_failure)
+            except NoEndpointAvailable as e:
+                ollama_circuit.record_failure()
+                raise ConnectionError(f"Failed to connect to Ollama: {e}")
+            except httpx.TimeoutException as e:
+                ollama_circuit.record_success()
+                raise TimeoutError(f"Ollama did not answer within {OLLAMA_READ_TIMEOUT}s: {e}")
+            except httpx.HTTPStatusError as e:
+                ollama_circuit.record_success()
+                raise ValueError(f"Ollama rejected the request: {e}")
+            ollama_circuit.record_success()
+        return parse_ollama_response(response.json())
+
+    async def close(self):
+        await self._client.aclose()
+
+
+EXTRACTION_PROMPTS = {
+    "client": (build_client_prompt, parse_client_response),
+    "vendor": (build_vendor_prompt, parse_vendor_response)
+}
+
+
+async def extract(llm: AsyncOllamaClient, origin: str, text: str) -> Dict[str, Any]:
+    """Async counterpart of ai_service.process_client_request / process_vendor_proposal."""
+    # The cache is SQLite; its disk I/O runs off the event loop
+    structured_data = await asyncio.to_thread(lookup_cached_extraction, origin, text)
+    if structured_data is not None:
+        return structured_data
+    build_prompt, parse_response = EXTRACTION_PROMPTS[origin]
+    prompt = build_prompt(text)
+    response_format = extraction_format(origin)
+
+    async def attempt(model: str) -> Dict[str, Any]:
+        return parse_response(
+            await llm.call(prompt, response_format=response_format, model=model),
+            structured=response_format is not None
+        )
+
+    structured_data = await run_tiers_async(origin, tiers_for(origin, MODEL), attempt, text)
+    await asyncio.to_thread(store_cached_extraction, origin, text, structured_data)
+    return structured_data
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts the
+    work, later callers await the same result until it completes.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            logger.debug("Joining in-flight call for the same input")
+        # A caller that disconnects must not cancel the work the others are waiting on
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Hashable, future: asyncio.Future):
+        self._inflight.pop(key, None)
+        if not future.cancelled():
+            # Marks the exception as retrieved when every waiter has gone away
+            future.exception()
+
+
+class AsyncPipeline:
+    def __init__(self, channel: aio_pika.abc.AbstractChannel, llm: AsyncOllamaClient, exchanges: Dict[str, Any] = None):
+        self.channel = channel
+        self.llm = llm
+        # Retry/dead-letter exchanges declared by declare_retry_topology
+        self.exchanges = exchanges or {}
+
+    async def publish(self, queue_name: str, message: Dict[str, Any], exchange=None, headers=None, expiration=None):
+        await (exchange or self.channel.default_exchange).publish(
+            aio_pika.Message(
+                body=json.dumps(message).encode(),
+                content_type="application/json",
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                headers=headers,
+                expiration=expiration
+            ),
+            routing_key=queue_name
+        )
+
+    async def handle_failure(self, delivery: aio_pika.abc.AbstractIncomingMessage, queue_name: str, message, error: Exception):
+        """Async counterpart of queue_consumer.handle_failed_delivery."""
+        MESSAGES.inc(consumer=CONSUMER_NAME, outcome="failed")
+        if message is None:
+            message = delivery.body.decode("utf-8", errors="replace")
+            error = PermanentError(f"Invalid message body: {error}")
+        if not isinstance(message, dict):
+            message = {"body": message}
+        attempt, headers = next_retry(delivery.headers, error)
+        try:
+            if attempt is None:
+                logger.error("Dead-lettering message from %s: %s", queue_name, error)
+                emit("dead_lettered", message.get("messageId"), message.get("rfp_id"), error=headers[ERROR_HEADER])
+                await self.publish(queue_name, message, exchange=self.exchanges[DEAD_LETTER_EXCHANGE], headers=headers)
+            else:
+                delay = retry_delay_ms(attempt)
+                logger.warning("Retrying message from %s in %d ms (attempt %d/%d)", queue_name, delay, attempt, RETRY_MAX_ATTEMPTS)
+                emit("retrying", message.get("messageId"), message.get("rfp_id"), attempt=attempt, delay_ms=delay, error=headers[ERROR_HEADER])
+                await self.publish(
+                    retry_queue_name(queue_name, attempt),
+                    message,
+                    exchange=self.exchanges[RETRY_EXCHANGE],
+                    headers=headers,
+                    expiration=delay / 1000.0
+                )
+        except Exception as e:
+            logger.error("Could not re-publish failed message, requeueing: %s", e)
+            await asyncio.sleep(1)
+            await delivery.nack(requeue=True)
+            return
+        await delivery.ack()
+
+    async def handle_ai_request(self, delivery: aio_pika.abc.AbstractIncomingMessage):
+        message = None
+        try:
+            message = json.loads(delivery.body)
+            origin = message.get("origin")
+            message_id = message.get("messageId") or str(uuid.uuid4())
+            # Each delivery runs in its own task, so this only tags this message's records
+            set_message_id(message_id)
+            text = message.get("text")
+            rfp_id = message.get("rfp_id")
+            emit("queued", message.get("messageId"), rfp_id, origin=origin, waited_ms=delivery_wait_ms(delivery))
+
+            previous = await asyncio.to_thread(lookup_processed_message, message)
+            if previous is not None:
+                await self.publish(previous["queue"], previous["response"])
+                await delivery.ack()
+                MESSAGES.inc(consumer=CONSUMER_NAME, outcome="duplicate")
+                logger.info("Duplicate message answered from idempotency ledger")
+                return
+
+            if origin not in EXTRACTION_PROMPTS:
+                raise PermanentError(f"Unknown origin: {origin}")
+            emit("extracting", message_id, rfp_id)
+            structured_data = await extract(self.llm, origin, text)
+            emit("parsed", message_id, rfp_id, extracted=structured_data)
+            build_response = build_client_response if origin == "client" else build_vendor_response
+            response = build_response(message, structured_data, message_id)
+
+            await self.publish(OUTPUT_QUEUE, response)
+            emit("published", message_id, rfp_id, queue=OUTPUT_QUEUE)
+            await asyncio.to_thread(record_processed_message, message, response)
+            await delivery.ack()
+            MESSAGES.inc(consumer=CONSUMER_NAME, outcome="ok")
+            logger.info("%s message processed and published", origin)
+
+        except Exception as e:
+            logger.error("Error processing message: %s", e)
+            await self.handle_failure(delivery, INPUT_QUEUE, message, e)
+
+    async def rank_with_llm(self, proposals: list) -> Dict[str, Any]:
+        prompt = build_evaluation_prompt(proposals)
+
+        async def attempt(model: str) -> Dict[str, Any]:
+            return parse_evaluation_response(proposals, await self.llm.call(prompt, model=model))
+
+        return await run_tiers_async("evaluation", model_tiers("evaluation", MODEL), attempt)
+
+    async def rank_shard(self, shard: list) -> Dict[str, Any]:
+        try:
+            return await self.rank_with_llm(shard)
+        except Exception as e:
+            logger.warning("Shard ranking failed, using fallback for %d proposals: %s", len(shard), e)
+            return fallback_evaluation(shard)
+
+    async def evaluate_map_reduce(self, proposals: list) -> Dict[str, Any]:
+        """Async counterpart of ai_service.evaluate_proposals_map_reduce."""
+        shard_size = evaluation_shard_size(proposals)
+        candidates = proposals
+        while len(candidates) > shard_size:
+            shards = split_into_shards(candidates, shard_size)
+            results = await asyncio.gather(*(self.rank_shard(shard) for shard in shards))
+            winners = round_winners(candidates, shards, results)
+            if winners is None:
+                break
+            candidates = winners
+        result = await self.rank_with_llm(candidates)
+        result["total_proposals_evaluated"] = len(proposals)
+        return result
+
+    async def evaluate(self, proposals: list, scored: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Async counterpart of ai_service.evaluate_proposals."""
+        if EVALUATION_MODE == "llm":
+            return await self.evaluate_map_reduce(proposals)
+
+        result = scored if scored is not None else score_proposals(proposals)
+        if EVALUATION_LLM_REASONING and result["overall_best_top3"]:
+            try:
+                apply_llm_reasoning(result, await self.llm.call(build_reasoning_prompt(result), model=model_tiers("evaluation", MODEL)[0]))
+            except Exception as e:
+                logger.warning("AI reasoning failed, keeping scored reasoning: %s", e)
+        return result
+
+    async def evaluate_rfp(self, rfp_id, proposals: list) -> Dict[str, Any]:
+        """Async counterpart of proposal_evaluator.evaluate_rfp."""
+        state = get_evaluation_state()
+        if state is None or not rfp_id:
+            EVALUATIONS.inc(result="ranked")
+            return await self.evaluate(proposals)
+
+        plan = await asyncio.to_thread(state.plan, rfp_id, proposals)
+        result = plan.reuse(EVALUATION_MODE == "llm", EVALUATION_LLM_REASONING)
+        if result is None:
+            result = await self.evaluate(proposals, scored=plan.scored)
+            EVALUATIONS.inc(result="ranked")
+        else:
+            EVALUATIONS.inc(result="rescored" if plan.changed else "unchanged")
+        await asyncio.to_thread(state.save, plan, result)
+        return result
+
+    async def handle_evaluation(self, delivery: aio_pika.abc.AbstractIncomingMessage):
+        message = None
+        try:
+            message = json.loads(delivery.body)
+            set_message_id(message.get("messageId") or message.get("rfp_id"))
+            proposals = message.get("proposals", [])
+            emit("queued", message.get("messageId"), message.get("rfp_id"), waited_ms=delivery_wait_ms(delivery))
+            if len(proposals) == 0:
+                await delivery.ack()
+                return
+
+            emit("evaluating", message.get("messageId"), message.get("rfp_id"), proposals=len(proposals))
+
+            try:
+                evaluation_result = await self.evaluate_rfp(message.get("rfp_id"), proposals)
+            except Exception as e:
+                logger.error("Evaluation failed for RFP %s: %s", message.get("rfp_id"), e)
+                evaluation_result = fallback_evaluation(proposals)
+
+            await self.publish(EVALUATION_OUTPUT_QUEUE, build_evaluation_output(message, evaluation_result))
+            emit("published", message.get("messageId"), message.get("rfp_id"), queue=EVALUATION_OUTPUT_QUEUE, evaluation=ranking_summary(evaluation_result))
+            await delivery.ack()
+            MESSAGES.inc(consumer=CONSUMER_NAME, outcome="ok")
+            logger.info("Evaluation for RFP %s published", message.get("rfp_id"))
+
+        except Exception as e:
+            logger.error("Error processing evaluation: %s", e)
+            await self.handle_failure(delivery, EVALUATION_INPUT_QUEUE, message, e)
+
+
+async def declare_retry_topology(channel: aio_pika.abc.AbstractChannel, queue_names) -> Dict[str, Any]:
+    """Async counterpart of resilience.declare_retry_topology; returns the exchanges by name."""
+    retry_exchange = await channel.declare_exchange(RETRY_EXCHANGE, aio_pika.ExchangeType.DIRECT, durable=True)
+    dead_letter_exchange = await channel.declare_exchange(DEAD_LETTER_EXCHANGE, aio_pika.ExchangeType.DIRECT, durable=True)
+    for queue_name in queue_names:
+        for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+            name = retry_queue_name(queue_name, attempt)
+            retry_queue = await channel.declare_queue(name, durable=True, arguments=retry_queue_arguments(queue_name))
+            await retry_queue.bind(retry_exchange, routing_key=name)
+        dead_queue = await channel.declare_queue(dead_letter_queue_name(queue_name), durable=True)
+        await dead_queue.bind(dead_letter_exchange, routing_key=queue_name)
+    return {RETRY_EXCHANGE: retry_exchange, DEAD_LETTER_EXCHANGE: dead_letter_exchange}
+
+
+def delivery_wait(delivery: aio_pika.abc.AbstractIncomingMessage):
+    return queue_wait_seconds(delivery.headers, delivery.timestamp.timestamp() if delivery.timestamp else None)
+
+
+def delivery_wait_ms(delivery: aio_pika.abc.AbstractIncomingMessage):
+    wait = delivery_wait(delivery)
+    return None if wait is None else int(wait * 1000)
+
+
+async def instrumented(consumer_name: str, handler, delivery: aio_pika.abc.AbstractIncomingMessage):
+    """Run a handler with the same queue-wait / in-flight metrics as the sync consumers."""
+    wait = delivery_wait(delivery)
+    if wait is not None:
+        STAGE_SECONDS.observe(wait, stage="queue_wait")
+    with IN_FLIGHT.track_inprogress(consumer=consumer_name):
+        await handler(delivery)
+
+
+async def consume(queue: aio_pika.abc.AbstractQueue, handler):
+    """Spawn one task per delivery; prefetch bounds how many run at once."""
+    tasks = set()
+    async with queue.iterator() as deliveries:
+        async for delivery in deliveries:
+            task = asyncio.create_task(instrumented(CONSUMER_NAME, handler, delivery))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+
+async def main():
+    configure_logging()
+    connection = await aio_pika.connect_robust(
+        host=RABBITMQ_HOST,
+        port=RABBITMQ_PORT,
+        login=RABBITMQ_USER,
+        password=RABBITMQ_PASS
+    )
+    llm = AsyncOllamaClient()
+    try:
+        channel = await connection.channel(publisher_confirms=True)
+        await channel.set_qos(prefetch_count=max(1, ASYNC_PREFETCH))
+
+        ai_queue = await channel.declare_queue(INPUT_QUEUE, durable=True)
+        evaluation_queue = await channel.declare_queue(EVALUATION_INPUT_QUEUE, durable=True)
+        await channel.declare_queue(OUTPUT_QUEUE, durable=True)
+        await channel.declare_queue(EVALUATION_OUTPUT_QUEUE, durable=True)
+
+        exchanges = await declare_retry_topology(channel, [INPUT_QUEUE, EVALUATION_INPUT_QUEUE])
+        pipeline = AsyncPipeline(channel, llm, exchanges)
+
+        logger.info(
+            "Starting asyncio consumer: inputs=%s,%s rabbitmq=%s:%s prefetch=%d llm_concurrency=%d",
+            INPUT_QUEUE, EVALUATION_INPUT_QUEUE, RABBITMQ_HOST, RABBITMQ_PORT, ASYNC_PREFETCH, ASYNC_LLM_CONCURRENCY
+        )
+        start_metrics_server()
+
+        await asyncio.gather(
+            consume(ai_queue, pipeline.handle_ai_request),
+            consume(evaluation_queue, pipeline.handle_evaluation)
+        )
+    finally:
+        await llm.close()
+        await connection.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Consumer stopped")
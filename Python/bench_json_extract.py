@@ -0,0 +1,173 @@
+"""
+Fuzz + benchmark corpus for extract_json_from_response.
+
+Compares the current single-pass extractor against the original nested-loop
+find_balanced_json implementation on:
+- realistic deepseek-r1 outputs (think preamble, fences, trailing prose)
+- large outputs (long reasoning containing many braces)
+- adversarial inputs (unclosed brackets, deep nesting, many invalid spans,
+  invalid spans nested inside each other)
+- random fuzz mutations of the realistic corpus
+
+    python bench_json_extract.py --size 20000 --fuzz 2000
+"""
+import argparse
+import json
+import random
+import re
+import time
+
+from ai_service import extract_json_from_response
+
+RFP_JSON = json.dumps({
+    "title": "Office laptops", "description": "Laptops for the {new} team", "budget": "$50,000",
+    "items": [{"name": "Laptop", "quantity": 20, "specs": "16GB RAM, 512GB SSD"}],
+    "delivery_time": "30 days", "payment_terms": "Net 30", "warranty": "1 year"
+}, indent=2)
+PROPOSAL_JSON = json.dumps({
+    "price_per_piece": 45, "total_price": 9000, "quantity": 200,
+    "terms": "50% upfront", "warranty": "1 year", "delivery_time": "10 days"
+})
+
+
+def legacy_extract(text):
+    """The original implementation, kept for comparison."""
+    if not text:
+        raise ValueError("Empty response from AI")
+    text = re.sub(r'<\/?think>', '', text, flags=re.IGNORECASE).strip()
+    text = re.sub(r'<[^>]+>', '', text).strip()
+    for marker, skip in (("```json", 7), ("```", 3)):
+        if marker in text:
+            start = text.find(marker) + skip
+            end = text.find("```", start)
+            if end != -1:
+                try:
+                    return json.loads(text[start:end].strip())
+                except json.JSONDecodeError:
+                    pass
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    length = len(text)
+    for i, ch in enumerate(text):
+        if ch in '{[':
+            close = '}' if ch == '{' else ']'
+            depth = 0
+            for j in range(i, length):
+                if text[j] == ch:
+                    depth += 1
+                elif text[j] == close:
+                    depth -= 1
+                    if depth == 0:
+                        try:
+                            return json.loads(text[i:j + 1])
+                        except json.JSONDecodeError:
+                            break
+    brace_start = text.find('{')
+    brace_end = text.rfind('}')
+    if brace_start != -1 and brace_end > brace_start:
+        try:
+            return json.loads(text[brace_start:brace_end + 1])
+        except json.JSONDecodeError:
+            pass
+    raise ValueError("Could not parse JSON from AI response")
+
+
+def realistic_corpus():
+    think = "<think>\nThe user wants the fields {title, budget}. The quantity is [20] units.\n</think>\n\n"
+    return {
+        "plain": PROPOSAL_JSON,
+        "think+json": think + RFP_JSON,
+        "think+fenced": think + "```json\n" + RFP_JSON + "\n```\nHope this helps!",
+        "fenced-no-lang": "```\n" + PROPOSAL_JSON + "\n```",
+        "prose-around": "Sure! Here is the data: " + PROPOSAL_JSON + " Let me know {if} you need more.",
+        "list": think + json.dumps([{"proposal_index": 0, "reasoning": "cheapest"}]),
+        "brace-in-string": think + json.dumps({"terms": "pay in {2} parts ]"}),
+    }
+
+
+def large_corpus(size):
+    sentence = "Consider the set {a, b} and the range [0, 5]; the vendor said {maybe}. "
+    reasoning = (sentence * (size // len(sentence) + 1))[:size]
+    return {
+        f"long-reasoning-{size}": "<think>\n" + reasoning + "\n</think>\n" + RFP_JSON,
+        f"long-prose-{size}": reasoning + PROPOSAL_JSON,
+    }
+
+
+def adversarial_corpus(size):
+    return {
+        f"unclosed-braces-{size}": "{" * size + PROPOSAL_JSON,
+        f"unclosed-brackets-{size}": "[" * size + "1",
+        f"deep-nesting-{size // 2}": "[" * (size // 2) + "]" * (size // 2),
+        f"invalid-spans-{size}": "{x} " * (size // 4) + PROPOSAL_JSON,
+        f"nested-invalid-{size // 8}": '{"a": ' * (size // 8) + "x" + "}" * (size // 8) + " " + PROPOSAL_JSON,
+        f"unterminated-array-{size}": "[" + "1," * (size // 2),
+    }
+
+
+def timed(fn, text, repeat):
+    result = error = None
+    start = time.perf_counter()
+    for _ in range(repeat):
+        try:
+            result = fn(text)
+        except (ValueError, RecursionError) as e:
+            error = type(e).__name__
+    return (time.perf_counter() - start) / repeat, result, error
+
+
+def mutate(text, rng):
+    chars = list(text)
+    for _ in range(rng.randint(1, 6)):
+        op = rng.random()
+        pos = rng.randrange(len(chars) + 1)
+        if op < 0.4:
+            chars.insert(pos, rng.choice('{}[]"\\,: x\n'))
+        elif op < 0.8 and chars:
+            del chars[min(pos, len(chars) - 1)]
+        else:
+            chars.insert(pos, rng.choice(["<think>", "</think>", "```", "```json"]))
+    return "".join(chars)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--fuzz", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    corpus = {}
+    corpus.update(realistic_corpus())
+    corpus.update(large_corpus(args.size))
+    corpus.update(adversarial_corpus(args.size))
+
+    print(f"{'case':<28} {'legacy ms':>10} {'new ms':>10} {'speedup':>8}  agree")
+    for name, text in corpus.items():
+        repeat = 50 if len(text) < 2000 else 1
+        old_t, old_r, old_e = timed(legacy_extract, text, repeat)
+        new_t, new_r, new_e = timed(extract_json_from_response, text, repeat)
+        agree = "yes" if (old_r, old_e) == (new_r, new_e) else f"no (legacy={old_e or 'ok'}, new={new_e or 'ok'})"
+        print(f"{name:<28} {old_t * 1000:>10.3f} {new_t * 1000:>10.3f} {old_t / new_t:>7.1f}x  {agree}")
+
+    rng = random.Random(args.seed)
+    seeds = list(realistic_corpus().values())
+    legacy_only = new_only = both = 0
+    for _ in range(args.fuzz):
+        text = mutate(rng.choice(seeds), rng)
+        _, old_r, old_e = timed(legacy_extract, text, 1)
+        _, new_r, new_e = timed(extract_json_from_response, text, 1)
+        if old_e is None and new_e is None:
+            both += 1
+        elif old_e is None:
+            legacy_only += 1
+        elif new_e is None:
+            new_only += 1
+    print(f"\nfuzz: {args.fuzz} mutations, parsed by both={both}, "
+          f"only legacy={legacy_only}, only new={new_only}")
+
+
+if __name__ == "__main__":
+    main()
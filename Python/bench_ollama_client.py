@@ -0,0 +1,99 @@
+"""
+Benchmark: per-call overhead of call_ollama with and without connection reuse.
+
+Starts a local stub HTTP server that answers like Ollama's /api/chat
+(non-streaming) with no model latency, so the numbers isolate connection setup
+and HTTP handling.
+
+    python bench_ollama_client.py --calls 500 --threads 4
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import ai_service
+
+STUB_REPLY = json.dumps({
+    "model": ai_service.MODEL,
+    "message": {"role": "assistant", "content": '{"price_per_piece": 45, "quantity": 200}'},
+    "done": True
+}).encode()
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Go's net/http (Ollama) disables Nagle too; without this keep-alive hits delayed-ACK stalls
+    disable_nagle_algorithm = True
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        StubOllamaHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(STUB_REPLY)))
+        self.end_headers()
+        self.wfile.write(STUB_REPLY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def legacy_call(prompt):
+    """The original session-less implementation, kept for comparison."""
+    response = requests.post(
+        ai_service.OLLAMA_API_URL,
+        json=ai_service.build_ollama_payload(prompt),
+        headers={"Content-Type": "application/json"},
+        timeout=300
+    )
+    response.raise_for_status()
+    return ai_service.parse_ollama_response(response.json())
+
+
+def run(label, call, calls, threads):
+    StubOllamaHandler.connections = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: call("Extract structured proposal"), range(calls)))
+    elapsed = time.perf_counter() - start
+    per_call_us = elapsed / calls * 1e6
+    print(f"{label:<10} {calls:>6} calls  {elapsed:8.3f}s  {per_call_us:10.1f} us/call  "
+          f"tcp_connections={StubOllamaHandler.connections}")
+    return per_call_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    ai_service.OLLAMA_API_URL = f"http://127.0.0.1:{server.server_address[1]}/api/chat"
+    try:
+        before = run("legacy", legacy_call, args.calls, args.threads)
+        after = run("pooled", ai_service.call_ollama, args.calls, args.threads)
+    finally:
+        server.shutdown()
+
+    print(f"\nper-call overhead reduced {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Offline pipeline benchmark: replays recorded queue messages through
+queue_consumer.process_message and proposal_evaluator.process_evaluation_message
+with an in-process fake broker and a stub model server. No RabbitMQ or
+Ollama is needed.
+
+1. All ai_request_queue messages are enqueued at once and consumed by
+   --workers threads (like CONSUMER_WORKERS).
+2. The vendor proposals published to ai_responses_queue are grouped per
+   rfp_id into evaluation requests, the way the Node backend builds them,
+   and replayed through the evaluator.
+
+Reports p50/p95/p99 per stage (from the metrics.py instrumentation), end to
+end latency and messages/sec. --json writes the report; --baseline compares
+against an earlier report and exits non-zero on regressions, for CI.
+
+Input (--input) is JSONL. Each line is either a recorded message
+({"queue": "...", "message": {...}}), a bare ai_request_queue message
+(with "origin"), or a bare evaluation request (with "proposals"). Lines with
+only a free "text"/"body" field (such as the repo's requests.jsonl) are
+replayed as alternating vendor/client texts. Without --input a seeded
+synthetic workload is generated.
+
+    python bench_pipeline.py --messages 400 --workers 8 --llm-ms 20
+    python bench_pipeline.py --input ../requests.jsonl --json report.json
+    python bench_pipeline.py --baseline report.json --tolerance 0.25
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import types
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ai_service
+import metrics
+import model_tiers
+import queue_publisher
+import queue_consumer
+import proposal_evaluator
+import progress_events
+import evaluation_state
+import resilience
+from structured_logging import configure_logging
+
+VENDOR_REPLY = '<think>\nThe vendor states a unit price.\n</think>\n{{"price_per_piece": {price}, "total_price": null, "quantity": {quantity}, "terms": "Net 30", "warranty": "{warranty} year", "delivery_time": "{days} days"}}'
+CLIENT_REPLY = '{"title": "Office laptops", "description": "Laptops for the new team", "budget": "$50,000", "items": [{"name": "Laptop", "quantity": 20, "specs": "16GB RAM"}], "delivery_time": "30 days", "payment_terms": "Net 30", "warranty": "1 year"}'
+RANKING_REPLY = '{"overall_best": [{"proposal_index": 0, "reasoning": "best"}]}'
+
+
+class StubModelHandler(BaseHTTPRequestHandler):
+    """Answers /api/chat after --llm-ms (+/- jitter) with a reply matching the prompt's task."""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency_s = 0.02
+    jitter = 0.25
+    rng = random.Random(7)
+    lock = threading.Lock()
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        prompt = " ".join(m["content"] for m in payload["messages"])
+        with StubModelHandler.lock:
+            rng = StubModelHandler.rng
+            delay = self.latency_s * (1 + rng.uniform(-self.jitter, self.jitter))
+            values = dict(price=rng.randint(20, 90), quantity=rng.randint(10, 500), warranty=rng.randint(1, 3), days=rng.randint(3, 30))
+        if "vendor proposal" in prompt:
+            content = VENDOR_REPLY.format(**values)
+        elif "structured RFP" in prompt:
+            content = CLIENT_REPLY
+        else:
+            content = RANKING_REPLY
+        time.sleep(max(0.0, delay))
+        reply = json.dumps({"model": payload["model"], "message": {"role": "assistant", "content": content}, "done": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeBroker:
+    """In-memory stand-in for QueuePublisher: keeps every published message per queue."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queues = defaultdict(list)
+
+    def publish(self, queue_name, message, headers=None, exchange='', expiration=None) -> bool:
+        with metrics.STAGE_SECONDS.time(stage="publish"):
+            body = json.dumps(message)
+            with self.lock:
+                self.queues[f"{exchange}/{queue_name}" if exchange else queue_name].append(body)
+        return True
+
+    def close(self):
+        pass
+
+
+class FakeChannel:
+    """Records acks/nacks the way the broker would see them."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.acked = 0
+        self.nacked = 0
+        self.connection = types.SimpleNamespace(sleep=time.sleep)
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        with self.lock:
+            self.acked += 1
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        with self.lock:
+            self.nacked += 1
+
+
+def delivery(body: bytes, tag: int):
+    method = types.SimpleNamespace(delivery_tag=tag)
+    properties = types.SimpleNamespace(headers={"x-published-at": int(time.time() * 1000)}, timestamp=None)
+    return method, properties, body
+
+
+def synthetic_workload(count: int, rfps: int, seed: int):
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        if i % 5 == 0:
+            text = f"We need {rng.randint(5, 50)} laptops with 16GB RAM within 30 days, budget ${rng.randint(10, 90)},000."
+            messages.append({"origin": "client", "text": text, "client_email": "client@example.com",
+                             "vendor_email": "vendor@example.com", "messageId": f"bench-{i}"})
+        else:
+            text = f"Quote: {rng.randint(10, 500)} units at ${rng.randint(20, 90)} each, delivery {rng.randint(3, 30)} days."
+            messages.append({"origin": "vendor", "text": text, "client_email": "client@example.com",
+                             "vendor_email": f"vendor{i}@example.com", "messageId": f"bench-{i}",
+                             "rfp_id": f"rfp-{i % rfps}", "vendor_id": f"v{i}"})
+    return messages, []
+
+
+def load_recorded(path: str, rfps: int):
+    ai_messages, evaluation_messages = [], []
+    with open(path) as f:
+        for n, line in enumerate(f):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "queue" in record and "message" in record:
+                target = evaluation_messages if record["queue"] == proposal_evaluator.INPUT_QUEUE else ai_messages
+                target.append(record["message"])
+            elif "origin" in record:
+                ai_messages.append(record)
+            elif "proposals" in record:
+                evaluation_messages.append(record)
+            else:
+                text = record.get("text") or record.get("body") or json.dumps(record)
+                origin = "vendor" if n % 2 == 0 else "client"
+                ai_messages.append({"origin": origin, "text": text, "client_email": "client@example.com",
+                                    "vendor_email": f"vendor{n}@example.com",
+                                    "messageId": str(record.get("request_id") or f"replay-{n}"),
+                                    "rfp_id": f"rfp-{n % rfps}", "vendor_id": f"v{n}"})
+    return ai_messages, evaluation_messages
+
+
+def evaluation_requests(published: list):
+    """Group vendor responses per rfp_id like vendorController.aiEvaluationHandler."""
+    by_rfp = defaultdict(list)
+    for body in published:
+        response = json.loads(body)
+        if response.get("origin") == "vendor" and response.get("rfp_id"):
+            by_rfp[response["rfp_id"]].append({
+                "_id": response["messageId"], "vendor_id": response.get("vendor_id"),
+                "vendor_email": response.get("vendor_email"), "extracted": response.get("extracted")
+            })
+    return [
+        {"rfp_id": rfp_id, "proposals": proposals, "client_email": "client@example.com", "trigger": "manual"}
+        for rfp_id, proposals in by_rfp.items()
+    ]
+
+
+def replay(handler, messages, workers: int):
+    channel = FakeChannel()
+    latencies = []
+    lock = threading.Lock()
+    deliveries = [delivery(json.dumps(m).encode(), i) for i, m in enumerate(messages)]
+
+    def run(args):
+        start = time.perf_counter()
+        handler(channel, *args)
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(run, deliveries))
+    return time.perf_counter() - start, latencies, channel
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {"count": len(ordered), "p50_ms": round(pick(0.50), 3), "p95_ms": round(pick(0.95), 3), "p99_ms": round(pick(0.99), 3)}
+
+
+def compare(report, baseline, tolerance: float):
+    """Regressions of p95 latency / throughput beyond `tolerance` (fraction)."""
+    problems = []
+    for section in ("stages", "end_to_end"):
+        for name, current in report[section].items():
+            previous = baseline.get(section, {}).get(name)
+            if current and previous and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+                problems.append(f"{section}.{name} p95 {current['p95_ms']} ms > baseline {previous['p95_ms']} ms")
+    for name, current in report["throughput_msgs_per_s"].items():
+        previous = baseline.get("throughput_msgs_per_s", {}).get(name)
+        if previous and current < previous * (1 - tolerance):
+            problems.append(f"{name} throughput {current} msg/s < baseline {previous} msg/s")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", help="JSONL of recorded messages; default is a synthetic workload")
+    parser.add_argument("--messages", type=int, default=400, help="synthetic ai_request_queue messages")
+    parser.add_argument("--rfps", type=int, default=20, help="RFPs the vendor proposals are spread over")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--llm-ms", type=float, default=20.0, help="stub model latency per call")
+    parser.add_argument("--llm-jitter", type=float, default=0.25, help="+/- fraction of --llm-ms")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="earlier --json report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    configure_logging(level="WARNING")
+
+    StubModelHandler.latency_s = args.llm_ms / 1000.0
+    StubModelHandler.jitter = args.llm_jitter
+    StubModelHandler.rng = random.Random(args.seed)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubModelHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ai_service.OLLAMA_API_URL = f"http://127.0.0.1:{server.server_address[1]}/api/chat"
+
+    # Every message must reach the model and no state may leak between runs
+    broker = FakeBroker()
+    queue_publisher._publisher = broker
+    resilience.get_publisher = lambda: broker
+    queue_consumer.get_ledger = lambda: None
+    progress_events.PROGRESS_EVENTS = False
+    evaluation_state._store = evaluation_state.EvaluationStateStore(":memory:")
+    ai_service.get_llm_cache = lambda: None
+    # Vendor texts skip the "rules" tier, which would answer simple quotes without a model call
+    os.environ["MODEL_TIERS_VENDOR"] = ",".join(model_tiers.model_tiers("vendor", ai_service.MODEL))
+
+    stage_samples = defaultdict(list)
+    observe = metrics.STAGE_SECONDS.observe
+
+    def recording_observe(value, **labels):
+        stage_samples[labels["stage"]].append(value)
+        observe(value, **labels)
+
+    metrics.STAGE_SECONDS.observe = recording_observe
+
+    if args.input:
+        ai_messages, evaluation_messages = load_recorded(args.input, args.rfps)
+    else:
+        ai_messages, evaluation_messages = synthetic_workload(args.messages, args.rfps, args.seed)
+
+    ai_elapsed, ai_latencies, ai_channel = replay(queue_consumer.process_message, ai_messages, args.workers)
+    evaluation_messages = evaluation_messages + evaluation_requests(broker.queues[queue_consumer.OUTPUT_QUEUE])
+    # The evaluator consumes with prefetch 1, i.e. one message at a time
+    ev_elapsed, ev_latencies, ev_channel = replay(proposal_evaluator.process_evaluation_message, evaluation_messages, 1)
+    server.shutdown()
+
+    report = {
+        "config": vars(args),
+        "messages": {"ai_request_queue": len(ai_messages), "proposals_evaluation_queue": len(evaluation_messages)},
+        "acked": {"ai_request_queue": ai_channel.acked, "proposals_evaluation_queue": ev_channel.acked},
+        "retried_or_dead": sum(len(v) for k, v in broker.queues.items() if k.startswith(resilience.RETRY_EXCHANGE) or k.startswith(resilience.DEAD_LETTER_EXCHANGE)),
+        "throughput_msgs_per_s": {
+            "ai_request_queue": round(len(ai_messages) / ai_elapsed, 2) if ai_messages else 0,
+            "proposals_evaluation_queue": round(len(evaluation_messages) / ev_elapsed, 2) if evaluation_messages else 0,
+        },
+        "end_to_end": {"ai_request_queue": percentiles(ai_latencies), "proposals_evaluation_queue": percentiles(ev_latencies)},
+        "stages": {stage: percentiles(samples) for stage, samples in sorted(stage_samples.items())},
+    }
+
+    print(f"{'':<38} {'count':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for section, label in (("stages", "stage"), ("end_to_end", "end-to-end")):
+        for name, row in report[section].items():
+            if row:
+                print(f"{label + ':' + name:<38} {row['count']:>6} {row['p50_ms']:>10.3f} {row['p95_ms']:>10.3f} {row['p99_ms']:>10.3f}")
+    for name, rate in report["throughput_msgs_per_s"].items():
+        print(f"throughput {name}: {rate} msg/s")
+    print(f"acked: {report['acked']}, retried/dead-lettered: {report['retried_or_dead']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(report, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark: time-to-first-token with the old and the new prompt layout.
+
+Starts a local stub that answers like Ollama's /api/chat and simulates its
+prompt cache: the model keeps the KV state of the previous prompt, so only
+the characters after the longest common prefix with that prompt have to be
+evaluated (cost per character set with --us-per-char). Both layouts are sent
+the same vendor texts:
+
+- legacy: one user message with the vendor text first and the instructions after it
+- template: fixed system message (prompt_templates) followed by the text
+
+    python bench_prompt_prefix.py --calls 200 --us-per-char 20
+"""
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ai_service
+from prompt_templates import VENDOR_JSON_EXAMPLE
+
+STUB_REPLY = json.dumps({
+    "model": ai_service.MODEL,
+    "message": {"role": "assistant", "content": '{"price_per_piece": 45, "quantity": 200}'},
+    "done": True
+}).encode()
+
+
+def legacy_vendor_prompt(text):
+    """The original single-message layout, kept for comparison."""
+    return f"""Extract structured proposal from this text:
+
+"{text}"
+
+Return ONLY a JSON object in this exact format (no markdown, no code blocks, no extra text):
+{VENDOR_JSON_EXAMPLE}
+
+Notes:
+- If vendor provides only a single price, prefer returning it as `price_per_piece`.
+- `total_price` is the overall total (price_per_piece * quantity) if provided or calculable.
+"""
+
+
+def common_prefix(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    us_per_char = 20.0
+    lock = threading.Lock()
+    cached_prompt = ""
+    evaluated_chars = 0
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        prompt = "".join(f"<{m['role']}>{m['content']}" for m in payload["messages"])
+        with StubOllamaHandler.lock:
+            uncached = len(prompt) - common_prefix(prompt, StubOllamaHandler.cached_prompt)
+            StubOllamaHandler.cached_prompt = prompt
+            StubOllamaHandler.evaluated_chars += uncached
+            # Prompt evaluation is serialized on the model, like a single Ollama runner
+            time.sleep(uncached * StubOllamaHandler.us_per_char / 1e6)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(STUB_REPLY)))
+        self.end_headers()
+        self.wfile.write(STUB_REPLY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def vendor_texts(calls, seed):
+    rng = random.Random(seed)
+    return [
+        f"We can supply {rng.randint(10, 500)} units at ${rng.randint(20, 90)} each, "
+        f"delivery in {rng.randint(3, 30)} days, {rng.randint(1, 3)} year warranty, "
+        f"{rng.choice(['Net 30', '50% upfront', 'Net 45'])}."
+        for _ in range(calls)
+    ]
+
+
+def run(label, build_prompt, texts):
+    StubOllamaHandler.cached_prompt = ""
+    StubOllamaHandler.evaluated_chars = 0
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        ai_service.call_ollama(build_prompt(text), stream=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<10} p50={statistics.median(latencies):7.2f} ms  p95={p95:7.2f} ms  "
+          f"evaluated_chars/call={StubOllamaHandler.evaluated_chars / len(texts):7.1f}")
+    return statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--us-per-char", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    StubOllamaHandler.us_per_char = args.us_per_char
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ai_service.OLLAMA_API_URL = f"http://127.0.0.1:{server.server_address[1]}/api/chat"
+
+    texts = vendor_texts(args.calls, args.seed)
+    legacy = run("legacy", legacy_vendor_prompt, texts)
+    template = run("template", ai_service.build_vendor_prompt, texts)
+    print(f"\nmedian time-to-first-token speedup: {legacy / template:.1f}x")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark: connect-per-message publishing vs the pooled QueuePublisher.
+
+Runs against an in-process broker stand-in that replaces pika.BlockingConnection
+and charges a configurable latency for the TCP + AMQP handshake and for each
+publish/confirm round trip, so no RabbitMQ server is needed.
+
+    python bench_publisher.py --messages 500 --handshake-ms 8 --publish-ms 0.3
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pika
+
+import queue_publisher
+
+
+class StubChannel:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+
+    def confirm_delivery(self):
+        pass
+
+    def queue_declare(self, queue, durable=False):
+        time.sleep(self.broker.publish_s)
+        self.broker.declares += 1
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        time.sleep(self.broker.publish_s)
+        self.broker.published += 1
+
+
+class StubConnection:
+    def __init__(self, broker):
+        time.sleep(broker.handshake_s)
+        broker.connections += 1
+        self.broker = broker
+        self.is_open = True
+
+    def channel(self):
+        return StubChannel(self.broker)
+
+    def process_data_events(self, time_limit=0):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+class StubBroker:
+    def __init__(self, handshake_ms: float, publish_ms: float):
+        self.handshake_s = handshake_ms / 1000.0
+        self.publish_s = publish_ms / 1000.0
+        self.connections = 0
+        self.declares = 0
+        self.published = 0
+
+    def connection_factory(self, parameters=None):
+        return StubConnection(self)
+
+
+def legacy_publish(queue_name, message):
+    """The original connect-per-message implementation, kept for comparison."""
+    credentials = pika.PlainCredentials(queue_publisher.RABBITMQ_USER, queue_publisher.RABBITMQ_PASS)
+    connection = pika.BlockingConnection(
+        pika.ConnectionParameters(
+            host=queue_publisher.RABBITMQ_HOST,
+            port=queue_publisher.RABBITMQ_PORT,
+            credentials=credentials,
+            heartbeat=600,
+            blocked_connection_timeout=300
+        )
+    )
+    channel = connection.channel()
+    channel.queue_declare(queue=queue_name, durable=True)
+    channel.basic_publish(
+        exchange='',
+        routing_key=queue_name,
+        body=json.dumps(message),
+        properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent)
+    )
+    connection.close()
+    return True
+
+
+def run(label, publish, messages, threads, broker):
+    payload = {"origin": "vendor", "messageId": "bench", "extracted": {"price_per_piece": 45.0, "quantity": 200}}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda _: publish("ai_responses_queue", payload), range(messages)))
+    elapsed = time.perf_counter() - start
+    ok = sum(1 for r in results if r)
+    print(f"{label:<10} {ok:>6} msgs  {elapsed:8.3f}s  {ok / elapsed:10.1f} msg/s  "
+          f"connections={broker.connections} declares={broker.declares}")
+    return ok / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--handshake-ms", type=float, default=8.0)
+    parser.add_argument("--publish-ms", type=float, default=0.3)
+    args = parser.parse_args()
+
+    original = pika.BlockingConnection
+    try:
+        broker = StubBroker(args.handshake_ms, args.publish_ms)
+        pika.BlockingConnection = broker.connection_factory
+        before = run("legacy", legacy_publish, args.messages, args.threads, broker)
+
+        broker = StubBroker(args.handshake_ms, args.publish_ms)
+        pika.BlockingConnection = broker.connection_factory
+        publisher = queue_publisher.QueuePublisher(pool_size=args.threads)
+        after = run("pooled", publisher.publish, args.messages, args.threads, broker)
+        publisher.close()
+    finally:
+        pika.BlockingConnection = original
+
+    print(f"\nspeedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
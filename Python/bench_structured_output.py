@@ -0,0 +1,129 @@
+"""
+Benchmark: free-form vs structured (JSON schema `format`) vendor extraction.
+
+Sends the same vendor texts through process_vendor_proposal in both modes and
+reports the parse-failure rate and latency of each. By default a local stub
+answers like Ollama's /api/chat: free-form replies are deepseek-style output
+(<think> block, code fences, trailing prose, and a share of malformed JSON
+set with --malformed), structured replies are plain JSON matching the schema.
+Reply time is simulated as --us-per-char per generated character. Pass --url
+to run against a real Ollama server instead.
+
+    python bench_structured_output.py --calls 300
+    python bench_structured_output.py --url http://localhost:11434/api/chat --calls 20
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ai_service
+import model_tiers
+import structured_output
+
+
+def proposal_json(rng):
+    quantity = rng.randint(10, 500)
+    return json.dumps({
+        "price_per_piece": rng.randint(20, 90), "total_price": None, "quantity": quantity,
+        "terms": rng.choice(["Net 30", "50% upfront"]), "warranty": f"{rng.randint(1, 3)} year",
+        "delivery_time": f"{rng.randint(3, 30)} days"
+    })
+
+
+def free_form_reply(rng, malformed):
+    body = proposal_json(rng)
+    if rng.random() < malformed:
+        # Typical failures: truncated object, single quotes, or no JSON at all
+        body = rng.choice([body[:len(body) // 2], body.replace('"', "'"), "The vendor offers a good price."])
+    think = "<think>\nThe vendor mentions a unit price and {quantity}; total is price * quantity.\n" * 4 + "</think>\n\n"
+    return think + rng.choice(["```json\n" + body + "\n```", body + "\n\nLet me know if you need anything else.", body])
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    us_per_char = 50.0
+    malformed = 0.05
+    rng = random.Random(7)
+    lock = threading.Lock()
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        with StubOllamaHandler.lock:
+            rng = StubOllamaHandler.rng
+            content = proposal_json(rng) if payload.get("format") else free_form_reply(rng, StubOllamaHandler.malformed)
+        time.sleep(len(content) * StubOllamaHandler.us_per_char / 1e6)
+        reply = json.dumps({"model": payload["model"], "message": {"role": "assistant", "content": content}, "done": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def vendor_texts(calls, seed):
+    rng = random.Random(seed)
+    return [
+        f"Quote #{i}: {rng.randint(10, 500)} units at ${rng.randint(20, 90)} each, "
+        f"delivery in {rng.randint(3, 30)} days, {rng.randint(1, 3)} year warranty."
+        for i in range(calls)
+    ]
+
+
+def run(label, structured, texts):
+    structured_output.OLLAMA_STRUCTURED_OUTPUT = structured
+    latencies, failures = [], 0
+    for text in texts:
+        start = time.perf_counter()
+        try:
+            ai_service.process_vendor_proposal(text)
+        except ValueError:
+            failures += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"{label:<11} parse failures {failures:>4}/{len(texts)} ({failures / len(texts):6.1%})  "
+          f"p50={statistics.median(latencies):8.2f} ms  p95={p95:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--url", help="real Ollama /api/chat URL; default is a local stub")
+    parser.add_argument("--us-per-char", type=float, default=50.0)
+    parser.add_argument("--malformed", type=float, default=0.05, help="share of malformed free-form replies (stub only)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    # Every text must reach the model in both modes: no cache, no rule-extracted quotes
+    ai_service.get_llm_cache = lambda: None
+    os.environ["MODEL_TIERS_VENDOR"] = ",".join(model_tiers.model_tiers("vendor", ai_service.MODEL))
+
+    server = None
+    if args.url:
+        ai_service.OLLAMA_API_URL = args.url
+    else:
+        StubOllamaHandler.us_per_char = args.us_per_char
+        StubOllamaHandler.malformed = args.malformed
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        ai_service.OLLAMA_API_URL = f"http://127.0.0.1:{server.server_address[1]}/api/chat"
+
+    texts = vendor_texts(args.calls, args.seed)
+    run("free-form", False, texts)
+    run("structured", True, texts)
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Duration normalizer for free-text delivery_time / warranty values.
+
+Turns strings like "5 days", "2-3 weeks", "within 10 business days",
+"two years", "twenty-one days" or "48 hours" into canonical numbers (days for delivery, months for
+warranty) so proposals can be ranked and filtered with plain arithmetic.
+All patterns are compiled once and parsed strings are memoized, since the same
+handful of phrasings repeat across thousands of proposals.
+"""
+import re
+from functools import lru_cache
+from typing import Any, Optional
+
+DAYS_PER_MONTH = 365.0 / 12.0
+DAYS_PER_UNIT = {
+    "hour": 1 / 24.0,
+    "day": 1.0,
+    "business day": 7 / 5.0,
+    "working day": 7 / 5.0,
+    "week": 7.0,
+    "month": DAYS_PER_MONTH,
+    "quarter": 3 * DAYS_PER_MONTH,
+    "year": 365.0,
+}
+
+_UNIT_ALIASES = {
+    "h": "hour", "hr": "hour", "hrs": "hour", "hour": "hour",
+    "d": "day", "day": "day",
+    "business day": "business day", "working day": "working day",
+    "w": "week", "wk": "week", "wks": "week", "week": "week",
+    "mo": "month", "mos": "month", "mth": "month", "mths": "month", "month": "month",
+    "quarter": "quarter",
+    "y": "year", "yr": "year", "yrs": "year", "year": "year",
+}
+
+_ONES = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9}
+_TENS = {"twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90}
+_WORD_NUMBERS = {
+    "a": 1, "an": 1, **_ONES, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14,
+    "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19, **_TENS, "half a": 0.5,
+}
+
+
+def _alternation(words) -> str:
+    return r'(?:' + '|'.join(sorted((re.escape(w) for w in words), key=len, reverse=True)) + r')'
+
+
+_DIGITS = r'\d+(?:\.\d+)?'
+_WORD_SEPARATOR = r'(?:\s*-\s*|\s+)'
+# "twenty-one", "twenty one"; a tens word followed by a ones word is never read
+# on its own, so "twenty-one days" can't turn into the range 20 to 1
+_COMPOUND = _alternation(_TENS) + _WORD_SEPARATOR + _alternation(_ONES) + r'\b'
+_WORDS = (
+    r'(?:' + _COMPOUND
+    + r'|' + _alternation(_TENS) + r'(?!' + _WORD_SEPARATOR + _alternation(_ONES) + r'\b)'
+    + r'|' + _alternation(set(_WORD_NUMBERS) - set(_TENS)) + r')'
+)
+_UNIT_WORDS = r'(?:business\s+days?|working\s+days?|hours?|hrs?|days?|weeks?|wks?|months?|mos?|mths?|quarters?|years?|yrs?)'
+# One-letter units ("48h", "10d") only count right after digits, so "any"
+# or "and" don't read as "an y(ear)" / "an d(ay)"
+_UNIT_LETTERS = r'[dhwy]'
+# "10 days", "10-day", "48h": any unit; "two years", "two-year": a spelled-out unit
+_NUMBER_UNIT = (
+    r'(?:(' + _DIGITS + r')\s*-?\s*(' + _UNIT_WORDS + r'|' + _UNIT_LETTERS + r')'
+    r'|(' + _WORDS + r')(?:\s+|\s*-\s*)(' + _UNIT_WORDS + r'))\b'
+)
+
+# "2-3 weeks", "2 to 3 weeks"
+_RANGE_RE = re.compile(r'\b(' + _DIGITS + r'|' + _WORDS + r'\b)\s*(?:-|–|to)\s*' + _NUMBER_UNIT, re.IGNORECASE)
+# "10 days", "two years", "12mo"
+_SINGLE_RE = re.compile(r'\b' + _NUMBER_UNIT, re.IGNORECASE)
+_BARE_NUMBER_RE = re.compile(r'^' + _DIGITS + r'$')
+# One duration phrase, single or range, for other modules' patterns (e.g. rule_extractor)
+DURATION_PATTERN = r'\b(?:(?:' + _DIGITS + r'|' + _WORDS + r'\b)\s*(?:-|–|to)\s*)?' + _NUMBER_UNIT
+_IMMEDIATE_RE = re.compile(r'\b(immediate(?:ly)?|same[\s-]day|in stock|ex[\s-]stock)\b', re.IGNORECASE)
+_NEXT_DAY_RE = re.compile(r'\b(next[\s-]day|overnight)\b', re.IGNORECASE)
+_LIFETIME_RE = re.compile(r'\blifetime\b', re.IGNORECASE)
+_NONE_RE = re.compile(r'^\s*(none|no warranty|n/?a|not specified|none specified|unknown|-)?\s*$', re.IGNORECASE)
+
+# Lifetime warranties are treated as 10 years so they still sort above finite ones
+LIFETIME_DAYS = 3650.0
+
+
+def _number(token: str) -> float:
+    token = token.lower()
+    if token in _WORD_NUMBERS:
+        return float(_WORD_NUMBERS[token])
+    words = re.split(r'[\s-]+', token)
+    if len(words) == 2 and words[0] in _TENS and words[1] in _ONES:
+        return float(_TENS[words[0]] + _ONES[words[1]])
+    return float(token)
+
+
+def _number_and_unit(match: re.Match, skip: int = 0):
+    """(number token, unit token) of a _NUMBER_UNIT match, after `skip` leading groups."""
+    number, unit = (group for group in match.groups()[skip:] if group is not None)
+    return number, unit
+
+
+def _unit_days(token: str) -> float:
+    unit = re.sub(r'\s+', ' ', token.lower())
+    if unit.endswith("s") and unit not in _UNIT_ALIASES:
+        unit = unit[:-1]
+    return DAYS_PER_UNIT[_UNIT_ALIASES[unit]]
+
+
+@lru_cache(maxsize=4096)
+def _parse_days(text: str, take_upper: bool) -> Optional[float]:
+    if _NONE_RE.match(text):
+        return None
+    if _BARE_NUMBER_RE.match(text):
+        return float(text)
+    match = _RANGE_RE.search(text)
+    if match:
+        high, unit = _number_and_unit(match, skip=1)
+        low, high = _number(match.group(1)), _number(high)
+        return (high if take_upper else low) * _unit_days(unit)
+    match = _SINGLE_RE.search(text)
+    if match:
+        number, unit = _number_and_unit(match)
+        return _number(number) * _unit_days(unit)
+    if _IMMEDIATE_RE.search(text):
+        return 0.0
+    if _NEXT_DAY_RE.search(text):
+        return 1.0
+    if _LIFETIME_RE.search(text):
+        return LIFETIME_DAYS
+    return None
+
+
+def parse_duration_days(value: Any, take_upper: bool = True) -> Optional[float]:
+    """
+    Duration in days, or None if it can't be determined.
+
+    Bare numbers (also as strings, e.g. "10") are taken as days. For ranges ("2-3 weeks") the upper bound is
+    returned unless take_upper is False.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    return _parse_days(value.strip(), take_upper)
+
+
+def delivery_days(value: Any) -> Optional[float]:
+    """Delivery time in days; ranges count as their slowest end."""
+    days = parse_duration_days(value, take_upper=True)
+    return None if days is None else round(days, 2)
+
+
+def warranty_months(value: Any) -> Optional[float]:
+    """
+    Warranty length in months; ranges count as their shortest guaranteed end.
+    Bare numbers are taken as months.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str) and _BARE_NUMBER_RE.match(value.strip()):
+        return float(value.strip())
+    days = parse_duration_days(value, take_upper=False)
+    return None if days is None else round(days / DAYS_PER_MONTH, 2)
+
+
+def cache_info():
+    return _parse_days.cache_info()
@@ -0,0 +1,212 @@
+"""
+Persistent per-RFP evaluation state for proposal_evaluator.
+
+Every evaluation request carries the RFP's full proposal list. The store
+keeps, per RFP, each proposal's fingerprint and scoring features plus the
+last published ranking, so a new request only has to:
+
+- extract features for the proposals that are new or whose extracted data
+  changed (the rest come from the store),
+- re-score the feature columns (vectorized, no parsing), and
+- run the expensive part (LLM ranking or LLM reasoning) only when the
+  deterministic top-k of some category actually changed.
+
+Scores are min-max normalized over the whole RFP, so a new proposal can
+shift everyone's score; that's why the columns are re-scored every time
+rather than merged into fixed heaps. Backed by SQLite like the idempotency
+ledger.
+"""
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from proposal_scorer import extract_features, rank_features
+
+load_dotenv()
+
+EVALUATION_STATE_ENABLED = os.getenv("EVALUATION_STATE_ENABLED", "true").lower() == "true"
+EVALUATION_STATE_DB = os.getenv("EVALUATION_STATE_DB", "evaluation_state.sqlite3")
+# RFPs not evaluated for this long are dropped
+EVALUATION_STATE_TTL = float(os.getenv("EVALUATION_STATE_TTL", 30 * 24 * 3600))
+
+_FEATURES = ("price", "total_price", "price_per_piece", "quantity", "warranty_months", "delivery_days")
+_CATEGORIES = ("best_price_top3", "best_warranty_top3", "best_delivery_top3", "best_quantity_top3", "overall_best_top3")
+_PRUNE_INTERVAL = 256
+
+
+def proposal_key(proposal: Dict[str, Any]) -> str:
+    """Stable identity of a proposal within its RFP."""
+    for field in ("_id", "vendor_id", "vendor_email"):
+        if proposal.get(field):
+            return f"{field}:{proposal[field]}"
+    return "hash:" + proposal_fingerprint(proposal)
+
+
+def proposal_fingerprint(proposal: Dict[str, Any]) -> str:
+    """Changes whenever anything the ranking can see changes."""
+    return hashlib.sha256(json.dumps(proposal, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+
+def ranking_signature(result: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Fingerprints of the proposals per ranking category, best first."""
+    return {
+        category: [proposal_fingerprint(entry.get("proposal") or {}) for entry in result.get(category, [])]
+        for category in _CATEGORIES
+    }
+
+
+def copy_reasoning(previous: Dict[str, Any], result: Dict[str, Any]):
+    """Carry LLM-written reasoning over to a re-scored result with the same ranking."""
+    for category in _CATEGORIES:
+        for old, new in zip(previous.get(category, []), result.get(category, [])):
+            if old.get("reasoning"):
+                new["reasoning"] = old["reasoning"]
+
+
+class EvaluationPlan:
+    """What changed for an RFP since its last evaluation, and the fresh deterministic ranking."""
+
+    def __init__(self, rfp_id: str, proposals: list, fingerprints: Dict[str, str], rows: Dict[str, list],
+                 scored: Dict[str, Any], previous: Optional[Dict[str, Any]], changed: bool, delta: int):
+        self.rfp_id = rfp_id
+        self.proposals = proposals
+        self.fingerprints = fingerprints
+        # Feature values per proposal key, as stored
+        self.rows = rows
+        self.scored = scored
+        self.signature = ranking_signature(scored)
+        self.previous = previous
+        self.changed = changed
+        # Proposals that had to be (re-)extracted
+        self.delta = delta
+
+    @property
+    def ranking_changed(self) -> bool:
+        return self.previous is None or self.previous["signature"] != self.signature
+
+    def reuse(self, llm_mode: bool, llm_reasoning: bool) -> Optional[Dict[str, Any]]:
+        """
+        The result to publish without calling the model, or None when the
+        ranking has to be (re-)done.
+        """
+        if self.previous is not None and not self.changed:
+            return self.previous["result"]
+        if llm_mode:
+            if self.ranking_changed:
+                return None
+            result = dict(self.previous["result"])
+            result["total_proposals_evaluated"] = len(self.proposals)
+            return result
+        if not llm_reasoning:
+            return self.scored
+        if self.ranking_changed:
+            return None
+        copy_reasoning(self.previous["result"], self.scored)
+        return self.scored
+
+
+class EvaluationStateStore:
+    def __init__(self, db_path: str = EVALUATION_STATE_DB, ttl: float = EVALUATION_STATE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rfp_proposals ("
+            "rfp_id TEXT NOT NULL, proposal_key TEXT NOT NULL, fingerprint TEXT NOT NULL, features TEXT NOT NULL, "
+            "PRIMARY KEY (rfp_id, proposal_key))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rfp_rankings ("
+            "rfp_id TEXT PRIMARY KEY, signature TEXT NOT NULL, result TEXT NOT NULL, "
+            "evaluated_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def _load(self, rfp_id: str):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT proposal_key, fingerprint, features FROM rfp_proposals WHERE rfp_id = ?", (rfp_id,)
+            ).fetchall()
+            ranking = self._db.execute(
+                "SELECT signature, result FROM rfp_rankings WHERE rfp_id = ? AND expires_at > ?", (rfp_id, time.time())
+            ).fetchone()
+        stored = {key: (fingerprint, json.loads(features)) for key, fingerprint, features in rows}
+        previous = None if ranking is None else {"signature": json.loads(ranking[0]), "result": json.loads(ranking[1])}
+        return stored, previous
+
+    def plan(self, rfp_id: str, proposals: list, requested_quantity: Optional[float] = None) -> EvaluationPlan:
+        stored, previous = self._load(rfp_id)
+        keys = [proposal_key(p) for p in proposals]
+        fingerprints = {key: proposal_fingerprint(p) for key, p in zip(keys, proposals)}
+
+        rows = [None] * len(proposals)
+        delta = []
+        for i, key in enumerate(keys):
+            entry = stored.get(key)
+            if entry is not None and entry[0] == fingerprints[key]:
+                rows[i] = entry[1]
+            else:
+                delta.append(i)
+        if delta:
+            extracted = extract_features([proposals[i] for i in delta])
+            for j, i in enumerate(delta):
+                rows[i] = [None if math.isnan(extracted[name][j]) else float(extracted[name][j]) for name in _FEATURES]
+        features = {
+            name: np.array([np.nan if row[col] is None else row[col] for row in rows], dtype=float)
+            for col, name in enumerate(_FEATURES)
+        }
+
+        changed = bool(delta) or set(stored) != set(keys)
+        scored = rank_features(proposals, features, requested_quantity)
+        return EvaluationPlan(rfp_id, proposals, fingerprints, dict(zip(keys, rows)), scored, previous, changed, len(delta))
+
+    def save(self, plan: EvaluationPlan, result: Dict[str, Any]):
+        """Store the proposals' features and the published ranking of an RFP."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("DELETE FROM rfp_proposals WHERE rfp_id = ?", (plan.rfp_id,))
+            self._db.executemany(
+                "INSERT INTO rfp_proposals (rfp_id, proposal_key, fingerprint, features) VALUES (?, ?, ?, ?)",
+                [(plan.rfp_id, key, plan.fingerprints[key], json.dumps(row)) for key, row in plan.rows.items()]
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO rfp_rankings (rfp_id, signature, result, evaluated_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (plan.rfp_id, json.dumps(plan.signature), json.dumps(result, default=str), now, now + self.ttl)
+            )
+            self._writes += 1
+            if self._writes % _PRUNE_INTERVAL == 0:
+                self._db.execute(
+                    "DELETE FROM rfp_proposals WHERE rfp_id IN (SELECT rfp_id FROM rfp_rankings WHERE expires_at <= ?)", (now,)
+                )
+                self._db.execute("DELETE FROM rfp_rankings WHERE expires_at <= ?", (now,))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_store: Optional[EvaluationStateStore] = None
+_store_lock = threading.Lock()
+
+
+def get_evaluation_state() -> Optional[EvaluationStateStore]:
+    """Process-wide store, or None when EVALUATION_STATE_ENABLED=false."""
+    global _store
+    if not EVALUATION_STATE_ENABLED:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = EvaluationStateStore()
+    return _store
@@ -0,0 +1,82 @@
+"""
+Idempotency ledger for ai_request_queue messages.
+
+Records every messageId that was processed together with the response that was
+published for it. Redelivered or duplicated messages are answered by
+re-publishing the stored response instead of calling the model again.
+Backed by SQLite so the ledger survives consumer restarts.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "true").lower() == "true"
+IDEMPOTENCY_DB = os.getenv("IDEMPOTENCY_DB", "idempotency.sqlite3")
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", 7 * 24 * 3600))
+
+_PRUNE_INTERVAL = 256
+
+
+class IdempotencyLedger:
+    def __init__(self, db_path: str = IDEMPOTENCY_DB, ttl: float = IDEMPOTENCY_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS processed_messages ("
+            "message_id TEXT PRIMARY KEY, queue TEXT NOT NULL, response TEXT NOT NULL, "
+            "processed_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, message_id: str) -> Optional[Dict[str, Any]]:
+        """Return {"queue": ..., "response": {...}} for an already processed message."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT queue, response FROM processed_messages WHERE message_id = ? AND expires_at > ?",
+                (message_id, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        return {"queue": row[0], "response": json.loads(row[1])}
+
+    def record(self, message_id: str, queue_name: str, response: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO processed_messages (message_id, queue, response, processed_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (message_id, queue_name, json.dumps(response), now, now + self.ttl)
+            )
+            self._writes += 1
+            if self._writes % _PRUNE_INTERVAL == 0:
+                self._db.execute("DELETE FROM processed_messages WHERE expires_at <= ?", (now,))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_ledger: Optional[IdempotencyLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> Optional[IdempotencyLedger]:
+    """Process-wide ledger, or None when IDEMPOTENCY_ENABLED=false."""
+    global _ledger
+    if not IDEMPOTENCY_ENABLED:
+        return None
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                _ledger = IdempotencyLedger()
+    return _ledger
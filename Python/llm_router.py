@@ -0,0 +1,246 @@
+"""
+Routing of model calls across several Ollama servers.
+
+- Least outstanding requests: each call goes to the available endpoint with
+  the fewest calls in flight (ties: the one that has served the fewest).
+- Per-endpoint concurrency cap: when every endpoint is at its cap, callers
+  wait for a slot instead of overloading a server (Ollama queues requests
+  internally, which only adds latency).
+- Failover: an unreachable server, a dropped connection or a 5xx answer
+  moves the call to another endpoint. Each endpoint has its own
+  CircuitBreaker, so a failing server is skipped until its reset timeout lets
+  a probe call through. A 4xx (bad request, unknown model) or a read timeout
+  (slow generation) is the request's problem, not the server's: it is raised
+  to the caller without failover and without counting against the endpoint.
+- Health probing: with more than one endpoint, a background thread checks
+  GET /api/tags on every endpoint and takes unreachable ones out of rotation
+  until they answer again.
+
+The process-wide ollama_circuit still describes "no model server is
+reachable": it only counts calls that failed on every endpoint.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+from metrics import LLM_ENDPOINT_OUTSTANDING, LLM_ENDPOINT_REQUESTS
+from resilience import CircuitBreaker, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+
+class NoEndpointAvailable(ConnectionError):
+    """Every model server is down, unhealthy or already failed this call."""
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """Whether a requests error means the server itself is unusable (see module docstring)."""
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    if isinstance(error, requests.ConnectionError):
+        # requests reports a read timeout while streaming as a ConnectionError
+        return not (error.args and isinstance(error.args[0], ReadTimeoutError))
+    return False
+
+
+class Endpoint:
+    def __init__(self, url: str, max_concurrency: int, circuit: CircuitBreaker = None):
+        self.url = url
+        self.max_concurrency = max(1, max_concurrency)
+        self.circuit = circuit or CircuitBreaker(name=f"Model server {url}")
+        self.outstanding = 0
+        self.served = 0
+        self.healthy = True
+
+    @property
+    def health_url(self) -> str:
+        parts = urlsplit(self.url)
+        return urlunsplit((parts.scheme, parts.netloc, "/api/tags", "", ""))
+
+    def available(self) -> bool:
+        return self.healthy and self.circuit.retry_after() <= 0
+
+    def snapshot(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit": self.circuit.state,
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "served": self.served,
+        }
+
+
+class LLMRouter:
+    def __init__(self, urls: Iterable[str], max_concurrency: int, health_interval: float = 10.0, health_timeout: float = 2.0):
+        self.endpoints: List[Endpoint] = [Endpoint(url, max_concurrency) for url in dict.fromkeys(urls)]
+        if not self.endpoints:
+            raise ValueError("LLMRouter needs at least one endpoint")
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self._condition = threading.Condition()
+        self._health_thread = None
+
+    def try_acquire(self, exclude: Tuple[Endpoint, ...] = ()) -> Optional[Endpoint]:
+        """
+        Reserve a slot on the least loaded available endpoint. Returns None
+        when all available endpoints are at their cap, and raises
+        NoEndpointAvailable when none is available at all.
+        """
+        with self._condition:
+            candidates = [e for e in self.endpoints if e not in exclude and e.available()]
+            if not candidates:
+                raise NoEndpointAvailable("No model server available")
+            for endpoint in sorted(candidates, key=lambda e: (e.outstanding, e.served)):
+                if endpoint.outstanding >= endpoint.max_concurrency:
+                    continue
+                if endpoint.circuit.state == "half-open":
+                    try:
+                        # This call is the endpoint's probe; others skip it until it returns
+                        endpoint.circuit.before_call()
+                    except CircuitOpenError:
+                        continue
+                endpoint.outstanding += 1
+                endpoint.served += 1
+                LLM_ENDPOINT_OUTSTANDING.inc(endpoint=endpoint.url)
+                return endpoint
+            return None
+
+    def acquire(self, exclude: Tuple[Endpoint, ...] = ()) -> Endpoint:
+        """Blocking try_acquire: waits for a free slot."""
+        self._start_health_checks()
+        with self._condition:
+            while True:
+                endpoint = self.try_acquire(exclude)
+                if endpoint is not None:
+                    return endpoint
+                # Re-checks periodically as well, since endpoints can also come back via probes
+                self._condition.wait(timeout=1.0)
+
+    def release(self, endpoint: Endpoint, outcome: str = "ok"):
+        """
+        Return the slot. outcome: ok, failed (the server could not be reached
+        or failed) or error (the server answered, but the request failed).
+        """
+        if outcome == "failed":
+            endpoint.circuit.record_failure()
+        else:
+            endpoint.circuit.record_success()
+        LLM_ENDPOINT_REQUESTS.inc(endpoint=endpoint.url, outcome=outcome)
+        LLM_ENDPOINT_OUTSTANDING.dec(endpoint=endpoint.url)
+        with self._condition:
+            endpoint.outstanding -= 1
+            self._condition.notify()
+
+    def call(
+        self,
+        send: Callable[[str], Any],
+        endpoint_failure: Callable[[BaseException], bool] = is_endpoint_failure
+    ) -> Any:
+        """
+        Run send(url) on the best endpoint, failing over to the others on
+        errors for which endpoint_failure() is true; other errors are raised.
+        """
+        tried: Tuple[Endpoint, ...] = ()
+        last_error = None
+        while len(tried) < len(self.endpoints):
+            try:
+                endpoint = self.acquire(tried)
+            except NoEndpointAvailable:
+                break
+            outcome = "ok"
+            try:
+                return send(endpoint.url)
+            except Exception as e:
+                if not endpoint_failure(e):
+                    outcome = "error"
+                    raise
+                outcome = "failed"
+                last_error = e
+                tried += (endpoint,)
+                self._log_failover(endpoint, e, len(tried))
+            finally:
+                self.release(endpoint, outcome)
+        raise NoEndpointAvailable(f"No model server could answer: {last_error}")
+
+    async def call_async(
+        self,
+        send: Callable[[str], Awaitable[Any]],
+        endpoint_failure: Callable[[BaseException], bool]
+    ) -> Any:
+        """Async counterpart of call(); polls for a slot instead of blocking the loop."""
+        self._start_health_checks()
+        tried: Tuple[Endpoint, ...] = ()
+        last_error = None
+        while len(tried) < len(self.endpoints):
+            try:
+                endpoint = self.try_acquire(tried)
+            except NoEndpointAvailable:
+                break
+            if endpoint is None:
+                await asyncio.sleep(0.01)
+                continue
+            outcome = "ok"
+            try:
+                return await send(endpoint.url)
+            except Exception as e:
+                if not endpoint_failure(e):
+                    outcome = "error"
+                    raise
+                outcome = "failed"
+                last_error = e
+                tried += (endpoint,)
+                self._log_failover(endpoint, e, len(tried))
+            finally:
+                self.release(endpoint, outcome)
+        raise NoEndpointAvailable(f"No model server could answer: {last_error}")
+
+    def _log_failover(self, endpoint: Endpoint, error: BaseException, attempts: int):
+        if attempts < len(self.endpoints):
+            logger.warning("Model server %s failed, trying another: %s", endpoint.url, error)
+
+    def probe(self, endpoint: Endpoint) -> bool:
+        try:
+            requests.get(endpoint.health_url, timeout=self.health_timeout).raise_for_status()
+            return True
+        except requests.RequestException:
+            return False
+
+    def check_health(self):
+        for endpoint in self.endpoints:
+            healthy = self.probe(endpoint)
+            if healthy != endpoint.healthy:
+                logger.warning("Model server %s is %s", endpoint.url, "back up" if healthy else "unreachable")
+            with self._condition:
+                endpoint.healthy = healthy
+                if healthy and endpoint.circuit.state != "closed" and endpoint.outstanding == 0:
+                    # Reachable again; don't wait out the rest of the reset timeout
+                    endpoint.circuit.record_success()
+                self._condition.notify_all()
+
+    def _start_health_checks(self):
+        # A single endpoint has nothing to fail over to; the circuit breakers cover it
+        if self._health_thread is not None or len(self.endpoints) < 2 or self.health_interval <= 0:
+            return
+        with self._condition:
+            if self._health_thread is None:
+                self._health_thread = threading.Thread(target=self._health_loop, name="llm-health", daemon=True)
+                self._health_thread.start()
+
+    def _health_loop(self):
+        while True:
+            time.sleep(self.health_interval)
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.warning("Model server health check failed: %s", e)
+
+    def snapshot(self) -> List[dict]:
+        with self._condition:
+            return [endpoint.snapshot() for endpoint in self.endpoints]
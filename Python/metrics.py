@@ -0,0 +1,252 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms for the hot paths of the consumers (queue
+wait, LLM call, JSON extraction, publish, evaluation), in-flight messages,
+LLM cache hits and parse failures. app.py serves them on /metrics; the
+consumer processes can serve them themselves with start_metrics_server
+(METRICS_PORT). Everything is thread-safe and dependency-free.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Port of the standalone exporter started by the consumers; 0 disables it
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans header parsing (ms) up to slow model calls (minutes)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[Any, ...], Any] = {}
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[Any, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        lines = []
+        inf = 'le="+Inf"'
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, inf)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "rfp_stage_duration_seconds",
+    "Time spent per processing stage (queue_wait, llm_call, json_extraction, publish, evaluation)",
+    ["stage"]
+)
+MESSAGES = Counter(
+    "rfp_messages_total",
+    "Messages handled per consumer and outcome (ok, duplicate, coalesced, rejected, failed); rate() gives messages per second",
+    ["consumer", "outcome"]
+)
+IN_FLIGHT = Gauge("rfp_messages_in_flight", "Messages currently being processed", ["consumer"])
+CACHE_REQUESTS = Counter("rfp_llm_cache_requests_total", "LLM response cache lookups by result (hit, miss)", ["result"])
+EVALUATIONS = Counter(
+    "rfp_evaluations_total",
+    "Evaluation requests by how they were answered (unchanged, rescored, ranked)",
+    ["result"]
+)
+LLM_ENDPOINT_OUTSTANDING = Gauge("rfp_llm_endpoint_outstanding", "Model calls in flight per model server", ["endpoint"])
+LLM_ENDPOINT_REQUESTS = Counter(
+    "rfp_llm_endpoint_requests_total",
+    "Model calls per model server and outcome (ok, failed, error: answered but the request failed)",
+    ["endpoint", "outcome"]
+)
+TIER_REQUESTS = Counter(
+    "rfp_model_tier_requests_total",
+    "Requests per task and model tier by outcome (served, escalated, failed)",
+    ["task", "tier", "outcome"]
+)
+PARSE_FAILURES = Counter(
+    "rfp_parse_failures_total",
+    "Model responses that could not be parsed, by task and mode (free_form, structured)",
+    ["task", "mode"]
+)
+
+
+def queue_wait_seconds(headers: Optional[Dict[str, Any]], timestamp: Optional[int] = None) -> Optional[float]:
+    """
+    Time a message sat in the broker, from the publisher's x-published-at
+    header (epoch ms) or, failing that, the AMQP timestamp (epoch seconds).
+    """
+    published_at = (headers or {}).get("x-published-at")
+    try:
+        if published_at is not None:
+            return max(0.0, time.time() - float(published_at) / 1000.0)
+        if timestamp:
+            return max(0.0, time.time() - float(timestamp))
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def observe_queue_wait(properties) -> Optional[float]:
+    """Record (and return) the queue wait of a pika delivery."""
+    if properties is None:
+        return None
+    wait = queue_wait_seconds(getattr(properties, "headers", None), getattr(properties, "timestamp", None))
+    if wait is not None:
+        STAGE_SECONDS.observe(wait, stage="queue_wait")
+    return wait
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics from a daemon thread; returns None when port is 0."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+    logging.getLogger(__name__).info("Metrics exporter listening on :%d/metrics", server.server_address[1])
+    return server
@@ -0,0 +1,163 @@
+"""
+Model tiers: per-task model selection with escalation.
+
+Each task (client, vendor, evaluation) has an ordered list of tiers, cheapest
+first. A tier is either an Ollama model name or the name of a local
+extractor registered with register_extractor (no model call at all). A
+request starts at the first tier; when its answer doesn't validate against
+the task's pydantic model (or a local extractor isn't confident), it is
+escalated to the next tier. The last tier's failure is the request's failure.
+
+    MODEL_TIERS_VENDOR=qwen2.5:0.5b,deepseek-r1:1.5b
+
+Without configuration every task has the single tier OLLAMA_MODEL, i.e. the
+previous behaviour. rfp_model_tier_requests_total{task, tier, outcome}
+reports how many requests each tier served or escalated.
+"""
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from pydantic import ValidationError
+
+from metrics import TIER_REQUESTS
+from models import ExtractedData, RFPExtraction
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+_VALIDATORS = {"client": RFPExtraction, "vendor": ExtractedData}
+# Extractions that validate but carry none of these are treated as failed
+_REQUIRED_ANY = {
+    "client": ("items", "budget", "delivery_time"),
+    "vendor": ("price_per_piece", "total_price", "quantity", "delivery_time", "warranty"),
+}
+_EMPTY = (None, "", [], "None specified", "Not yet decided")
+
+# name -> (task, extractor); an extractor returns the structured data, or
+# None when it can't extract the text confidently
+_EXTRACTORS: Dict[str, tuple] = {}
+# Extractors placed in front of OLLAMA_MODEL when MODEL_TIERS_<TASK> is unset
+_DEFAULT_TIERS: Dict[str, List[str]] = {}
+
+
+def register_extractor(name: str, task: str, extractor: Callable[[str], Optional[Dict[str, Any]]], default: bool = False):
+    """
+    Make `name` usable as a tier of `task` that runs `extractor` instead of a
+    model. With `default`, the tier is also used when the task's tiers aren't
+    configured.
+    """
+    _EXTRACTORS[name] = (task, extractor)
+    if default and name not in _DEFAULT_TIERS.setdefault(task, []):
+        _DEFAULT_TIERS[task].append(name)
+
+
+def local_extractor(tier: str, task: str) -> Optional[Callable[[str], Optional[Dict[str, Any]]]]:
+    entry = _EXTRACTORS.get(tier)
+    return entry[1] if entry and entry[0] == task else None
+
+
+def tiers_for(task: str, default_model: str) -> List[str]:
+    """Tiers of a task, cheapest first."""
+    value = os.getenv(f"MODEL_TIERS_{task.upper()}", "")
+    return [tier.strip() for tier in value.split(",") if tier.strip()] or _DEFAULT_TIERS.get(task, []) + [default_model]
+
+
+def run_local_tiers(task: str, text: str, default_model: str) -> Optional[Dict[str, Any]]:
+    """
+    Answer from the task's local extractors alone, or None when the text has
+    to go to a model (for batches, which call the model only for the rest).
+    """
+    local_tiers = [tier for tier in tiers_for(task, default_model) if local_extractor(tier, task) is not None]
+    for tier in local_tiers:
+        try:
+            result = _local_attempt(task, tier, text)
+            validate_extraction(task, result)
+        except ValueError:
+            record_tier(task, tier, "escalated")
+            continue
+        record_tier(task, tier, "served")
+        return result
+    return None
+
+
+def model_tiers(task: str, default_model: str) -> List[str]:
+    """Only the model tiers of a task, for calls a local extractor can't serve (batches, reasoning)."""
+    return [tier for tier in tiers_for(task, default_model) if local_extractor(tier, task) is None] or [default_model]
+
+
+def validate_extraction(task: str, data: Any):
+    """Raise ValueError unless `data` is a usable extraction for `task`."""
+    validator = _VALIDATORS.get(task)
+    if validator is None:
+        return
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object for {task} extraction, got {type(data).__name__}")
+    try:
+        validator.model_validate(data)
+    except ValidationError as e:
+        raise ValueError(f"Invalid {task} extraction: {e.error_count()} field error(s)") from e
+    if not any(data.get(field) not in _EMPTY for field in _REQUIRED_ANY[task]):
+        raise ValueError(f"Empty {task} extraction")
+
+
+def record_tier(task: str, tier: str, outcome: str):
+    """outcome: served, escalated or failed (the last tier could not answer either)."""
+    TIER_REQUESTS.inc(task=task, tier=tier, outcome=outcome)
+
+
+def _escalate(task: str, tier: str, is_last: bool, error: ValueError):
+    if is_last:
+        record_tier(task, tier, "failed")
+        raise error
+    record_tier(task, tier, "escalated")
+    logger.info("Tier %s could not answer the %s request, escalating: %s", tier, task, error)
+
+
+def _local_attempt(task: str, tier: str, text: Optional[str]):
+    extractor = local_extractor(tier, task)
+    data = extractor(text)
+    if data is None:
+        raise ValueError(f"{tier} is not confident about this {task} text")
+    return data
+
+
+def run_tiers(task: str, tiers: List[str], attempt: Callable[[str], Any], text: Optional[str] = None) -> Any:
+    """
+    attempt(model) for each tier until one answers with a valid result.
+
+    ValueError (unparseable or invalid answer) escalates to the next tier;
+    anything else, e.g. ConnectionError, propagates right away.
+    """
+    for i, tier in enumerate(tiers):
+        try:
+            if local_extractor(tier, task) is not None:
+                result = _local_attempt(task, tier, text)
+            else:
+                result = attempt(tier)
+            validate_extraction(task, result)
+        except ValueError as e:
+            _escalate(task, tier, i == len(tiers) - 1, e)
+            continue
+        record_tier(task, tier, "served")
+        return result
+    raise ValueError(f"No tiers configured for {task}")
+
+
+async def run_tiers_async(task: str, tiers: List[str], attempt: Callable[[str], Awaitable[Any]], text: Optional[str] = None) -> Any:
+    """Async counterpart of run_tiers."""
+    for i, tier in enumerate(tiers):
+        try:
+            if local_extractor(tier, task) is not None:
+                result = _local_attempt(task, tier, text)
+            else:
+                result = await attempt(tier)
+            validate_extraction(task, result)
+        except ValueError as e:
+            _escalate(task, tier, i == len(tiers) - 1, e)
+            continue
+        record_tier(task, tier, "served")
+        return result
+    raise ValueError(f"No tiers configured for {task}")
@@ -16,6 +16,8 @@ class ExtractedData(BaseModel):
     terms: Optional[str] = None
     warranty: Optional[str] = None
     delivery_time: Optional[str] = None
+    delivery_days: Optional[float] = None
+    warranty_months: Optional[float] = None
 
 
 class Item(BaseModel):
@@ -24,6 +26,16 @@ class Item(BaseModel):
     specs: Optional[str] = None
 
 
+class RFPExtraction(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+    budget: Optional[float] = None
+    items: List[Item] = []
+    delivery_time: Optional[str] = None
+    payment_terms: Optional[str] = None
+    warranty: Optional[str] = None
+
+
 class ProcessClientRequestPayload(BaseModel):
     text: str = Field(..., description="Unstructured paragraph/text from client")
     client_email: str = Field(..., description="Client email address")
@@ -0,0 +1,251 @@
+"""
+Pipeline progress events for the SSE endpoint in app.py.
+
+The consumers call emit() as a message moves through the pipeline:
+
+    queued       picked up from the queue (waited_ms: time spent queued)
+    extracting   model call started
+    token        streamed model output (PROGRESS_TOKENS=true only)
+    parsed       extraction finished (extracted: the structured data)
+    evaluating   ranking started for an RFP
+    published    result published (queue: where to)
+    retrying     failed; attempt/delay_ms/error
+    dead_lettered  failed for good; error
+    completed    REST fast path answered (app.py only)
+    failed       REST fast path failed; error (app.py only)
+
+Events are best-effort. emit() only puts the event on an in-memory queue; a
+background thread publishes it, non-persistent and unconfirmed, to the
+rfp.progress fanout exchange on its own connection. A broker hiccup drops
+progress events and never slows down or fails message processing. app.py
+binds a temporary queue to the exchange and fans the events out to
+subscribers through an EventBus.
+"""
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import pika
+from dotenv import load_dotenv
+
+from queue_publisher import connection_parameters
+from structured_logging import get_logger
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+PROGRESS_EVENTS = os.getenv("PROGRESS_EVENTS", "true").lower() == "true"
+# Stream model tokens as well; makes the consumers call Ollama in streaming mode
+PROGRESS_TOKENS = os.getenv("PROGRESS_TOKENS", "false").lower() == "true"
+# Tokens are sent in chunks at most this often
+PROGRESS_TOKEN_INTERVAL_MS = int(os.getenv("PROGRESS_TOKEN_INTERVAL_MS", 100))
+# Events waiting for the publisher thread; newer events are dropped beyond this
+PROGRESS_QUEUE_SIZE = int(os.getenv("PROGRESS_QUEUE_SIZE", 10000))
+
+PROGRESS_EXCHANGE = "rfp.progress"
+
+# Stages after which nothing more happens to a message
+TERMINAL_STAGES = ("published", "dead_lettered", "completed", "failed")
+
+
+def make_event(stage: str, message_id: Optional[str] = None, rfp_id: Optional[str] = None, **data) -> Dict[str, Any]:
+    event = {"stage": stage, "message_id": message_id, "rfp_id": rfp_id, "ts": int(time.time() * 1000)}
+    event.update(data)
+    return event
+
+
+class ProgressEmitter:
+    """Publishes events from a background thread that owns its own connection."""
+
+    def __init__(self, max_pending: int = PROGRESS_QUEUE_SIZE):
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max(1, max_pending))
+        self._thread = None
+        self._lock = threading.Lock()
+        self._connection = None
+        self._channel = None
+        self.dropped = 0
+
+    def emit(self, stage: str, message_id: Optional[str] = None, rfp_id: Optional[str] = None, **data):
+        if not (message_id or rfp_id):
+            return
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(make_event(stage, message_id, rfp_id, **data))
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="progress-events", daemon=True)
+                self._thread.start()
+
+    def _connect(self):
+        self._connection = pika.BlockingConnection(connection_parameters())
+        self._channel = self._connection.channel()
+        self._channel.exchange_declare(exchange=PROGRESS_EXCHANGE, exchange_type="fanout")
+
+    def _disconnect(self):
+        try:
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
+        self._channel = None
+
+    def _run(self):
+        properties = pika.BasicProperties(content_type="application/json", delivery_mode=pika.DeliveryMode.Transient)
+        while True:
+            try:
+                event = self._queue.get(timeout=30)
+            except queue.Empty:
+                # Service heartbeats while idle
+                try:
+                    if self._connection is not None:
+                        self._connection.process_data_events(time_limit=0)
+                except Exception:
+                    self._disconnect()
+                continue
+            try:
+                if self._connection is None or not self._connection.is_open:
+                    self._connect()
+                self._channel.basic_publish(exchange=PROGRESS_EXCHANGE, routing_key="", body=json.dumps(event, default=str), properties=properties)
+            except Exception as e:
+                self.dropped += 1
+                logger.debug("Dropped progress event: %s", e)
+                self._disconnect()
+                # Don't spin on a broker that is down
+                time.sleep(1)
+
+
+_emitter: Optional[ProgressEmitter] = None
+_emitter_lock = threading.Lock()
+
+
+def get_emitter() -> ProgressEmitter:
+    global _emitter
+    if _emitter is None:
+        with _emitter_lock:
+            if _emitter is None:
+                _emitter = ProgressEmitter()
+    return _emitter
+
+
+def emit(stage: str, message_id: Optional[str] = None, rfp_id: Optional[str] = None, **data):
+    """Report a pipeline stage for a message and/or RFP (no-op with PROGRESS_EVENTS=false)."""
+    if PROGRESS_EVENTS:
+        get_emitter().emit(stage, message_id, rfp_id, **data)
+
+
+class TokenStream:
+    """Collects streamed tokens and emits them in chunks every PROGRESS_TOKEN_INTERVAL_MS."""
+
+    def __init__(self, message_id: Optional[str], rfp_id: Optional[str] = None, interval_ms: int = PROGRESS_TOKEN_INTERVAL_MS):
+        self.message_id = message_id
+        self.rfp_id = rfp_id
+        self.interval = interval_ms / 1000.0
+        self._parts = []
+        self._last_flush = time.monotonic()
+
+    def __call__(self, token: str):
+        self._parts.append(token)
+        if time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            emit("token", self.message_id, self.rfp_id, text="".join(self._parts))
+            self._parts = []
+        self._last_flush = time.monotonic()
+
+
+@contextmanager
+def token_stream(message_id: Optional[str], rfp_id: Optional[str] = None):
+    """on_token callback for call_ollama, or None when token events are off."""
+    if not (PROGRESS_EVENTS and PROGRESS_TOKENS):
+        yield None
+        return
+    stream = TokenStream(message_id, rfp_id)
+    try:
+        yield stream
+    finally:
+        stream.flush()
+
+
+class EventBus:
+    """
+    In-process fan-out of progress events to asyncio subscribers, keyed by
+    messageId and rfp_id. The last few stage events per key are kept so a
+    subscriber that connects late still sees how far the message got.
+    """
+
+    def __init__(self, history: int = 20, max_keys: int = 1000, max_pending: int = 1000):
+        self.history = history
+        self.max_keys = max_keys
+        self.max_pending = max_pending
+        self._subscribers: Dict[str, set] = {}
+        self._recent: "OrderedDict[str, deque]" = OrderedDict()
+
+    @staticmethod
+    def keys(event: Dict[str, Any]):
+        if event.get("message_id"):
+            yield f"message:{event['message_id']}"
+        if event.get("rfp_id"):
+            yield f"rfp:{event['rfp_id']}"
+
+    def publish(self, event: Dict[str, Any]):
+        """Deliver to subscribers; call on the event loop thread."""
+        delivered = set()
+        for key in self.keys(event):
+            if event.get("stage") != "token":
+                recent = self._recent.pop(key, None) or deque(maxlen=self.history)
+                recent.append(event)
+                self._recent[key] = recent
+                while len(self._recent) > self.max_keys:
+                    self._recent.popitem(last=False)
+            for subscriber in self._subscribers.get(key, ()):
+                # A subscriber following both the message and its RFP gets the event once
+                if id(subscriber) in delivered:
+                    continue
+                delivered.add(id(subscriber))
+                try:
+                    subscriber.put_nowait(event)
+                except asyncio.QueueFull:
+                    # A client that can't keep up loses tokens, not the connection
+                    pass
+
+    @contextmanager
+    def subscribe(self, message_id: Optional[str] = None, rfp_id: Optional[str] = None):
+        """asyncio.Queue of events for the messageId and/or rfp_id, starting with recent history."""
+        subscriber: asyncio.Queue = asyncio.Queue(maxsize=self.max_pending)
+        keys = [key for key in self.keys({"message_id": message_id, "rfp_id": rfp_id})]
+        seen = set()
+        for event in sorted((e for key in keys for e in self._recent.get(key, ())), key=lambda e: e["ts"]):
+            if id(event) not in seen:
+                seen.add(id(event))
+                subscriber.put_nowait(event)
+        for key in keys:
+            self._subscribers.setdefault(key, set()).add(subscriber)
+        try:
+            yield subscriber
+        finally:
+            for key in keys:
+                subscribers = self._subscribers.get(key)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._subscribers[key]
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """One server-sent event; the stage is the SSE event name."""
+    return f"event: {event['stage']}\ndata: {json.dumps(event, default=str)}\n\n"
@@ -0,0 +1,171 @@
+"""
+Prompt templates for Ollama calls.
+
+Each template is split into a fixed system message (instructions and the JSON
+format) and a user message that holds only the variable text. The system
+message is byte-identical for every call of the same task, so it forms a
+stable prompt prefix the model server can keep in its KV cache between calls
+(together with keep_alive, which stops the model from being unloaded).
+Anything that varies per call - texts, counts, index ranges - belongs in the
+user message.
+"""
+from typing import Dict, List
+
+CLIENT_JSON_EXAMPLE = '{"title":"...", "description":"...", "budget":"...", "items":[{"name":"...", "quantity":"...", "specs":"a string describing the specifications"}], "delivery_time":"...", "payment_terms":"...", "warranty":"..."}'
+VENDOR_JSON_EXAMPLE = '{"price_per_piece": null, "total_price": null, "quantity": null, "terms": "...", "warranty": "...", "delivery_time": "..."}'
+
+EVALUATION_JSON_EXAMPLE = '''{
+    "best_price": [{
+        "proposal_index": 0,
+        "reasoning": "why this has best price"
+    },{
+        "proposal_index": 1,
+        "reasoning": "why this has second best price"
+    },{
+        "proposal_index": 2,
+        "reasoning": "why this has third best price"
+    }],
+    "best_warranty": [{
+        "proposal_index": 0,
+        "reasoning": "why this has best warranty"
+    },{
+        "proposal_index": 1,
+        "reasoning": "why this has second best warranty"
+    },{
+        "proposal_index": 2,
+        "reasoning": "why this has third best warranty"
+    }],
+    "best_delivery": [{
+        "proposal_index": 0,
+        "reasoning": "why this has best delivery"
+    },{
+        "proposal_index": 2,
+        "reasoning": "why this has second best delivery"
+    },{
+        "proposal_index": 3,
+        "reasoning": "why this has third best delivery"
+    }],
+    "best_quantity": [{
+        "proposal_index": 0,
+        "reasoning": "why this has best quantity"
+    },{
+        "proposal_index": 1,
+        "reasoning": "why this has second best quantity"
+    },{
+        "proposal_index": 2,
+        "reasoning": "why this has third best quantity"
+    }],
+    "overall_best": [{
+        "proposal_index": 0,
+        "reasoning": "comprehensive reasoning for overall best",
+        "scores": {
+            "price_score": 8,
+            "warranty_score": 7,
+            "delivery_score": 9,
+            "overall_score": 8
+        }
+    },{
+        "proposal_index": 1,
+        "reasoning": "comprehensive reasoning for overall second best",
+        "scores": {
+            "price_score": 7,
+            "warranty_score": 6,
+            "delivery_score": 8,
+            "overall_score": 7
+        }
+    },{
+        "proposal_index": 2,
+        "reasoning": "comprehensive reasoning for overall third best",
+        "scores": {
+            "price_score": 6,
+            "warranty_score": 5,
+            "delivery_score": 7,
+            "overall_score": 6
+        }
+    }]
+}'''
+
+
+class PromptTemplate:
+    def __init__(self, name: str, system: str, user: str):
+        self.name = name
+        self.system = system
+        self.user = user
+
+    def render(self, **values) -> List[Dict[str, str]]:
+        """Chat messages for this template; only the user message varies."""
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user.format(**values)},
+        ]
+
+
+CLIENT_EXTRACTION = PromptTemplate(
+    "client_extraction",
+    system=f"""You extract a structured RFP from the text the user sends.
+
+Return ONLY a JSON object in this exact format (no markdown, no code blocks, no extra text):
+{CLIENT_JSON_EXAMPLE}""",
+    user='''Extract structured RFP from this text:
+
+"{text}"'''
+)
+
+VENDOR_EXTRACTION = PromptTemplate(
+    "vendor_extraction",
+    system=f"""You extract a structured vendor proposal from the text the user sends.
+
+Return ONLY a JSON object in this exact format (no markdown, no code blocks, no extra text):
+{VENDOR_JSON_EXAMPLE}
+
+Notes:
+- If vendor provides only a single price, prefer returning it as `price_per_piece`.
+- `total_price` is the overall total (price_per_piece * quantity) if provided or calculable.""",
+    user='''Extract structured proposal from this text:
+
+"{text}"'''
+)
+
+_BATCH_SYSTEM = """You extract a structured {kind} from EACH document the user sends.
+
+Return ONLY a JSON array with one object per document (no markdown, no code blocks, no extra text).
+Each object must have an "id" field set to the document id plus the fields of this format:
+{json_example}"""
+
+CLIENT_BATCH_EXTRACTION = PromptTemplate(
+    "client_batch_extraction",
+    system=_BATCH_SYSTEM.format(kind="RFP", json_example=CLIENT_JSON_EXAMPLE),
+    user="""Extract a structured RFP from each of these {count} documents (ids: {ids}):
+
+{documents}"""
+)
+
+VENDOR_BATCH_EXTRACTION = PromptTemplate(
+    "vendor_batch_extraction",
+    system=_BATCH_SYSTEM.format(kind="proposal", json_example=VENDOR_JSON_EXAMPLE),
+    user="""Extract a structured proposal from each of these {count} documents (ids: {ids}):
+
+{documents}"""
+)
+
+PROPOSAL_RANKING = PromptTemplate(
+    "proposal_ranking",
+    system=f"""You rank vendor proposals in 5 categories. Return JSON only.
+
+Rank by: price (lowest), warranty (best), delivery (fastest), quantity (best fit), overall (best value).
+Return JSON with keys: best_price, best_warranty, best_delivery, best_quantity, overall_best
+Each has 3 items with proposal_index (0-based position of the proposal in the list), reasoning (1 sentence), scores.
+
+Format:
+{EVALUATION_JSON_EXAMPLE}""",
+    user="""Rank these {count} proposals (proposal_index 0 to {last_index}):
+
+{proposals}"""
+)
+
+RANKING_REASONING = PromptTemplate(
+    "ranking_reasoning",
+    system="""Proposals have already been ranked, best first. For each rank write one sentence explaining why it is placed there.
+Return ONLY JSON: {"reasoning": ["sentence for rank 1", "sentence for rank 2", "sentence for rank 3"]}""",
+    user="""{ranking}"""
+)
@@ -1,30 +1,53 @@
 """
 RabbitMQ Proposal Evaluator Consumer: 
 - Consumes from proposals_evaluation_queue
-- Groups proposals by RFP ID
+- Keeps per-RFP evaluation state (evaluation_state.py) and only re-ranks
+  when new or changed proposals move the top-k
+- Optionally debounces bursts of triggers per RFP into one evaluation
 - Evaluates best proposal using AI
 - Publishes result to evaluation_results_queue
 """
 import pika
 import json
 import os
+import time
+import functools
 from dotenv import load_dotenv
-from collections import defaultdict
-from queue_publisher import publish_to_queue
-from ai_service import evaluate_proposals
+from queue_publisher import RABBITMQ_HOST, RABBITMQ_PORT, connection_parameters, publish_to_queue, get_publisher
+from ai_service import EVALUATION_MODE, EVALUATION_LLM_REASONING, evaluate_proposals, fallback_evaluation
+from evaluation_state import get_evaluation_state
+from structured_logging import LazyJson, configure_logging, get_logger, message_context
+from metrics import STAGE_SECONDS, MESSAGES, IN_FLIGHT, EVALUATIONS, observe_queue_wait, start_metrics_server
+from resilience import PermanentError, declare_retry_topology, retry_or_dead_letter
+from progress_events import emit
 
 load_dotenv()
 
-RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")
-RABBITMQ_PORT = int(os.getenv("RABBITMQ_PORT", 5672))
-RABBITMQ_USER = os.getenv("RABBITMQ_USER", "guest")
-RABBITMQ_PASS = os.getenv("RABBITMQ_PASS", "guest")
+logger = get_logger(__name__)
 
 INPUT_QUEUE = "proposals_evaluation_queue"
 OUTPUT_QUEUE = "evaluation_results_queue"
+# Label of this consumer's metrics
+CONSUMER_NAME = "proposal_evaluator"
 
-# Store proposals temporarily (in production, use Redis or DB)
-proposals_by_rfp = defaultdict(list)
+# Quiet window per rfp_id: triggers arriving within it are merged into one
+# evaluation (0 = evaluate every trigger on its own)
+EVALUATION_DEBOUNCE_MS = int(os.getenv("EVALUATION_DEBOUNCE_MS", 0))
+# Upper bound on how long a burst can keep postponing its evaluation
+EVALUATION_DEBOUNCE_MAX_MS = int(os.getenv("EVALUATION_DEBOUNCE_MAX_MS", 5000))
+# Unacked triggers held while debouncing
+EVALUATION_PREFETCH = int(os.getenv("EVALUATION_PREFETCH", 50))
+
+
+def build_evaluation_output(message: dict, evaluation_result: dict) -> dict:
+    """Payload published to evaluation_results_queue for the Node evaluation listener."""
+    return {
+        "rfp_id": message.get("rfp_id"),
+        "client_email": message.get("client_email"),
+        "evaluation": evaluation_result,
+        "timestamp": message.get("timestamp"),
+        "evaluated_at": json.dumps({"$date": {"$numberLong": str(int(os.times()[4] * 1000))}})
+    }
 
 
 def process_evaluation_message(channel, method, properties, body):
@@ -39,161 +62,261 @@ def process_evaluation_message(channel, method, properties, body):
         "trigger": "manual" or "auto"
     }
     """
+    waited = observe_queue_wait(properties)
     try:
         message = json.loads(body)
-        rfp_id = message.get("rfp_id")
-        proposals = message.get("proposals", [])
-        client_email = message.get("client_email")
-        
-        print(f"\n{'='*60}")
-        print(f"📊 Evaluating proposals for RFP: {rfp_id}")
-        print(f"   Total proposals: {len(proposals)}")
-        print(f"   Client: {client_email}")
-        print(f"{'='*60}")
-        
-        if len(proposals) == 0:
-            print("⚠️ No proposals to evaluate")
-            channel.basic_ack(method.delivery_tag)
-            return
-        
-        # Evaluate using AI service
-        print("\n   🤖 Running AI evaluation...")
+    except Exception as e:
+        logger.error("Undecodable evaluation request: %s", e)
+        MESSAGES.inc(consumer=CONSUMER_NAME, outcome="failed")
+        handle_failed_evaluation(channel, method, properties, body, None, e)
+        return
+
+    rfp_id = message.get("rfp_id")
+    emit("queued", message.get("messageId"), rfp_id, waited_ms=None if waited is None else int(waited * 1000))
+    with message_context(message.get("messageId") or rfp_id), IN_FLIGHT.track_inprogress(consumer=CONSUMER_NAME):
         try:
-            evaluation_result = evaluate_proposals(proposals)
+            evaluate_and_publish(channel, method, properties, body, message)
         except Exception as e:
-            print(f"✗ Evaluation failed: {e}")
-            import traceback
-            traceback.print_exc()
-            
-            # Fallback with top 3 structure - safe price handling
-            def get_price(proposal):
-                extracted = proposal.get('extracted', {})
-                total = extracted.get('total_price')
-                if total is not None:
-                    try:
-                        return float(total)
-                    except (ValueError, TypeError):
-                        pass
-                ppp = extracted.get('price_per_piece')
-                if ppp is not None:
-                    try:
-                        return float(ppp)
-                    except (ValueError, TypeError):
-                        pass
-                return float('inf')
-            
-            sorted_by_price = sorted(proposals, key=get_price)[:min(3, len(proposals))]
-            
-            def create_fallback_top3(count=3):
-                result = []
-                for i in range(min(count, len(proposals))):
-                    result.append({
-                        "proposal": proposals[i],
-                        "reasoning": f"Rank {i+1} (fallback - AI evaluation failed)",
-                        "scores": {}
-                    })
-                return result
-            
-            evaluation_result = {
-                "best_price_top3": [{"proposal": p, "reasoning": f"Rank {i+1} by price (fallback)", "scores": {}} for i, p in enumerate(sorted_by_price)],
-                "best_warranty_top3": create_fallback_top3(),
-                "best_delivery_top3": create_fallback_top3(),
-                "best_quantity_top3": create_fallback_top3(),
-                "overall_best_top3": [{"proposal": p, "reasoning": f"Rank {i+1} by price (fallback)", "scores": {}} for i, p in enumerate(sorted_by_price)],
-                "total_proposals_evaluated": len(proposals)
+            logger.error("Error processing evaluation: %s", e)
+            MESSAGES.inc(consumer=CONSUMER_NAME, outcome="failed")
+            handle_failed_evaluation(channel, method, properties, body, message, e)
+
+
+def ranking_summary(evaluation_result: dict) -> dict:
+    """Vendors per ranking category, for debug logs and progress events."""
+    return {
+        category: [
+            {
+                "vendor": (item.get("proposal") or {}).get("vendor_email"),
+                "reasoning": item.get("reasoning"),
+                "scores": item.get("scores")
             }
-        
-        print(f"   ✓ Evaluation complete (Top 3 per category):")
-        
-        # Print top 3 for each category with reasoning
-        def print_top3(category_name, top3_list):
-            print(f"\n      {category_name}:")
-            for i, item in enumerate(top3_list[:3], 1):
-                proposal = item.get('proposal', {})
-                vendor = proposal.get('vendor_email', 'N/A')
-                vendor_id = proposal.get('vendor_id', 'N/A')
-                reasoning = item.get('reasoning', 'No reasoning provided')
-                scores = item.get('scores', {})
-                
-                print(f"         {i}. Vendor: {vendor}")
-                print(f"            Vendor ID: {vendor_id}")
-                print(f"            Reasoning: {reasoning}")
-                if scores:
-                    print(f"            Scores: {scores}")
-        
-        print_top3("Best Price", evaluation_result.get('best_price_top3', []))
-        print_top3("Best Warranty", evaluation_result.get('best_warranty_top3', []))
-        print_top3("Best Delivery", evaluation_result.get('best_delivery_top3', []))
-        print_top3("Best Quantity", evaluation_result.get('best_quantity_top3', []))
-        print_top3("Overall Best", evaluation_result.get('overall_best_top3', []))
-        
-        # Prepare output message
-        output = {
-            "rfp_id": rfp_id,
-            "client_email": client_email,
-            "evaluation": evaluation_result,
-            "timestamp": message.get("timestamp"),
-            "evaluated_at": json.dumps({"$date": {"$numberLong": str(int(os.times()[4] * 1000))}})
-        }
-        
-        # Publish to results queue
-        print(f"\n   📤 Publishing evaluation result to {OUTPUT_QUEUE}...")
-        success = publish_to_queue(OUTPUT_QUEUE, output)
-        
-        if success:
-            print(f"✓ Evaluation completed and published")
-            channel.basic_ack(method.delivery_tag)
-        else:
-            print(f"✗ Failed to publish evaluation result")
-            channel.basic_nack(method.delivery_tag, False, True)
-            
-    except Exception as e:
-        print(f"✗ Error processing evaluation: {e}")
-        channel.basic_nack(method.delivery_tag, False, False)
+            for item in evaluation_result.get(category, [])[:3]
+        ]
+        for category in ("best_price_top3", "best_warranty_top3", "best_delivery_top3", "best_quantity_top3", "overall_best_top3")
+    }
+
+
+def evaluate_and_publish(channel, method, properties, body, message: dict):
+    proposals = message.get("proposals", [])
+    logger.info(
+        "Evaluating %d proposals for RFP %s (client %s)",
+        len(proposals), message.get("rfp_id"), message.get("client_email")
+    )
+
+    if len(proposals) == 0:
+        logger.warning("No proposals to evaluate")
+        channel.basic_ack(method.delivery_tag)
+        MESSAGES.inc(consumer=CONSUMER_NAME, outcome="ok")
+        return
+
+    emit("evaluating", message.get("messageId"), message.get("rfp_id"), proposals=len(proposals))
+    try:
+        with STAGE_SECONDS.time(stage="evaluation"):
+            evaluation_result = evaluate_rfp(message.get("rfp_id"), proposals)
+    except Exception:
+        logger.exception("Evaluation failed; using fallback ranking")
+        evaluation_result = fallback_evaluation(proposals)
+
+    logger.debug("Ranking: %s", LazyJson(ranking_summary(evaluation_result), indent=2))
+
+    output = build_evaluation_output(message, evaluation_result)
+    if publish_to_queue(OUTPUT_QUEUE, output):
+        emit("published", message.get("messageId"), message.get("rfp_id"), queue=OUTPUT_QUEUE, evaluation=ranking_summary(evaluation_result))
+        channel.basic_ack(method.delivery_tag)
+        MESSAGES.inc(consumer=CONSUMER_NAME, outcome="ok")
+        logger.info("Evaluation completed and published to %s", OUTPUT_QUEUE)
+    else:
+        logger.error("Failed to publish evaluation result")
+        MESSAGES.inc(consumer=CONSUMER_NAME, outcome="failed")
+        # Retry after a backoff instead of requeueing straight back into a hot loop
+        handle_failed_evaluation(channel, method, properties, body, message, Exception("Failed to publish evaluation result"))
+
+
+def evaluate_rfp(rfp_id, proposals: list) -> dict:
+    """
+    Evaluate against the RFP's stored state: unchanged proposals get the
+    previous ranking back, and the model is only asked again when the top-k moved.
+    """
+    state = get_evaluation_state()
+    if state is None or not rfp_id:
+        EVALUATIONS.inc(result="ranked")
+        return evaluate_proposals(proposals)
+
+    plan = state.plan(rfp_id, proposals)
+    evaluation_result = plan.reuse(EVALUATION_MODE == "llm", EVALUATION_LLM_REASONING)
+    if evaluation_result is None:
+        evaluation_result = evaluate_proposals(proposals, scored=plan.scored)
+        EVALUATIONS.inc(result="ranked")
+    else:
+        EVALUATIONS.inc(result="rescored" if plan.changed else "unchanged")
+    logger.info(
+        "RFP %s: %d proposals, %d new or changed, top-k %s",
+        rfp_id, len(proposals), plan.delta, "changed" if plan.ranking_changed else "unchanged"
+    )
+    state.save(plan, evaluation_result)
+    return evaluation_result
+
+
+def handle_failed_evaluation(channel, method, properties, body, message, error: Exception):
+    """Move a failed evaluation request to its retry or dead-letter queue and ack it."""
+    if message is None:
+        message = body.decode("utf-8", errors="replace") if isinstance(body, bytes) else body
+        error = PermanentError(f"Invalid message body: {error}")
+    headers = properties.headers if properties is not None else None
+    if retry_or_dead_letter(INPUT_QUEUE, message, headers, error):
+        channel.basic_ack(method.delivery_tag)
+    else:
+        channel.connection.sleep(1)
+        channel.basic_nack(method.delivery_tag, False, True)
+
+
+def proposal_identity(proposal: dict):
+    return proposal.get("_id") or proposal.get("vendor_id") or json.dumps(proposal, sort_keys=True, default=str)
+
+
+def merge_evaluation_requests(messages: list) -> dict:
+    """
+    One evaluation request covering several triggers for the same RFP: the
+    latest trigger's fields, and the union of all proposal lists (by _id /
+    vendor_id, later triggers win).
+    """
+    merged = dict(messages[-1])
+    proposals = {}
+    for message in messages:
+        for proposal in message.get("proposals") or []:
+            proposals[proposal_identity(proposal)] = proposal
+    merged["proposals"] = list(proposals.values())
+    if any(message.get("trigger") == "manual" for message in messages):
+        merged["trigger"] = "manual"
+    return merged
+
+
+class CoalescedChannel:
+    """Acks/nacks every superseded delivery together with the one that is evaluated."""
+
+    def __init__(self, channel, delivery_tags: list):
+        self.channel = channel
+        self.delivery_tags = delivery_tags
+
+    @property
+    def connection(self):
+        return self.channel.connection
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        for tag in self.delivery_tags:
+            self.channel.basic_ack(tag)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        for tag in self.delivery_tags:
+            self.channel.basic_nack(tag, False, requeue)
+
+
+class EvaluationDebouncer:
+    """
+    Holds evaluation triggers per rfp_id on the pika I/O thread until no new
+    trigger for that RFP has arrived for `window_ms` (or `max_wait_ms` has
+    passed since the first one), then runs a single evaluation for all of them.
+    """
+
+    def __init__(self, connection, window_ms: int = EVALUATION_DEBOUNCE_MS, max_wait_ms: int = EVALUATION_DEBOUNCE_MAX_MS):
+        self.connection = connection
+        self.window_s = window_ms / 1000.0
+        self.max_wait_s = max(window_ms, max_wait_ms) / 1000.0
+        self.pending = {}
+        self.first_seen = {}
+        self.timers = {}
+
+    def on_message(self, channel, method, properties, body):
+        try:
+            message = json.loads(body)
+        except Exception:
+            message = None
+        rfp_id = message.get("rfp_id") if isinstance(message, dict) else None
+        if not rfp_id:
+            process_evaluation_message(channel, method, properties, body)
+            return
+
+        self.pending.setdefault(rfp_id, []).append((method, properties, body, message))
+        self.first_seen.setdefault(rfp_id, time.monotonic())
+        timer = self.timers.pop(rfp_id, None)
+        if timer is not None:
+            self.connection.remove_timeout(timer)
+        delay = min(self.window_s, max(0.0, self.first_seen[rfp_id] + self.max_wait_s - time.monotonic()))
+        self.timers[rfp_id] = self.connection.call_later(delay, functools.partial(self._on_timer, channel, rfp_id))
+
+    def _on_timer(self, channel, rfp_id):
+        self.timers.pop(rfp_id, None)
+        self.first_seen.pop(rfp_id, None)
+        deliveries = self.pending.pop(rfp_id, [])
+        if deliveries:
+            evaluate_coalesced(channel, deliveries)
+
+
+def evaluate_coalesced(channel, deliveries: list):
+    """Run one evaluation for (method, properties, body, message) triggers of the same RFP."""
+    method, properties, body, _ = deliveries[-1]
+    if len(deliveries) == 1:
+        process_evaluation_message(channel, method, properties, body)
+        return
+    for _, superseded_properties, _, _ in deliveries[:-1]:
+        observe_queue_wait(superseded_properties)
+    MESSAGES.inc(len(deliveries) - 1, consumer=CONSUMER_NAME, outcome="coalesced")
+    merged = merge_evaluation_requests([message for _, _, _, message in deliveries])
+    logger.info(
+        "Coalesced %d evaluation triggers for RFP %s (%d proposals)",
+        len(deliveries), merged.get("rfp_id"), len(merged["proposals"])
+    )
+    tags = [delivery_method.delivery_tag for delivery_method, _, _, _ in deliveries]
+    process_evaluation_message(CoalescedChannel(channel, tags), method, properties, json.dumps(merged).encode())
 
 
 def main():
     """Start the proposal evaluator consumer"""
+    configure_logging()
+    connection = None
     try:
         # Connect to RabbitMQ
-        credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-        connection = pika.BlockingConnection(
-            pika.ConnectionParameters(
-                host=RABBITMQ_HOST,
-                port=RABBITMQ_PORT,
-                credentials=credentials
-            )
-        )
+        connection = pika.BlockingConnection(connection_parameters())
         channel = connection.channel()
         
+        start_metrics_server()
+
         # Declare queues
         channel.queue_declare(queue=INPUT_QUEUE, durable=True)
         channel.queue_declare(queue=OUTPUT_QUEUE, durable=True)
+        declare_retry_topology(channel, INPUT_QUEUE)
         
-        # Set prefetch to process one message at a time
-        channel.basic_qos(prefetch_count=1)
+        on_message = process_evaluation_message
+        if EVALUATION_DEBOUNCE_MS > 0:
+            logger.info("Debouncing evaluation triggers: %d ms quiet window, %d ms max", EVALUATION_DEBOUNCE_MS, EVALUATION_DEBOUNCE_MAX_MS)
+            on_message = EvaluationDebouncer(connection).on_message
+            # Triggers have to be delivered while earlier ones wait out their window
+            channel.basic_qos(prefetch_count=max(1, EVALUATION_PREFETCH))
+        else:
+            # Set prefetch to process one message at a time
+            channel.basic_qos(prefetch_count=1)
         
         # Start consuming
         channel.basic_consume(
             queue=INPUT_QUEUE,
-            on_message_callback=process_evaluation_message
+            on_message_callback=on_message
         )
         
-        print(f"\n{'='*60}")
-        print(f"🚀 Proposal Evaluator Consumer Started")
-        print(f"   Input Queue: {INPUT_QUEUE}")
-        print(f"   Output Queue: {OUTPUT_QUEUE}")
-        print(f"   RabbitMQ: {RABBITMQ_HOST}:{RABBITMQ_PORT}")
-        print(f"{'='*60}\n")
-        print("⏳ Waiting for evaluation requests...")
+        logger.info(
+            "Proposal Evaluator Consumer started: input=%s output=%s rabbitmq=%s:%s",
+            INPUT_QUEUE, OUTPUT_QUEUE, RABBITMQ_HOST, RABBITMQ_PORT
+        )
         
         channel.start_consuming()
         
     except KeyboardInterrupt:
-        print("\n\n⏹️ Consumer stopped by user")
-        connection.close()
+        logger.info("Consumer stopped by user")
+        get_publisher().close()
+        if connection:
+            connection.close()
     except Exception as e:
-        print(f"\n✗ Consumer error: {e}")
+        logger.error("Consumer error: %s", e)
         raise
 
 
@@ -0,0 +1,282 @@
+"""
+Deterministic proposal scoring: ranks proposals for an RFP from their
+already-extracted fields instead of asking the LLM.
+
+Every proposal is turned into a row of numeric features (total price, unit
+price, warranty months, delivery days, quantity). Totals are only compared
+with totals: a proposal whose total can't be derived (no quantity) is priced
+by its unit price against everyone's unit prices. Each category is scored
+0-10 with vectorized NumPy operations, and the top-k per category is picked
+with a partition-based selection instead of a full sort. The output has the same shape as
+ai_service.evaluate_proposals (best_price_top3, ..., overall_best_top3).
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from duration_normalizer import delivery_days as parse_delivery_days, warranty_months as parse_warranty_months
+
+TOP_K = 3
+
+# Weights of the per-category scores in overall_score
+SCORE_WEIGHTS = {
+    "price": float(os.getenv("SCORE_WEIGHT_PRICE", 0.4)),
+    "delivery": float(os.getenv("SCORE_WEIGHT_DELIVERY", 0.25)),
+    "warranty": float(os.getenv("SCORE_WEIGHT_WARRANTY", 0.2)),
+    "quantity": float(os.getenv("SCORE_WEIGHT_QUANTITY", 0.15)),
+}
+
+_NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def _to_float(value: Any) -> float:
+    if value is None or isinstance(value, bool):
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = _NUMBER_RE.search(value.replace(",", ""))
+        if match:
+            return float(match.group())
+    return np.nan
+
+
+def _canonical(extracted: Dict[str, Any], canonical_key: str, text_key: str, parse) -> float:
+    """Use the value stored at extraction time, parsing the text only for older proposals."""
+    value = extracted.get(canonical_key)
+    if value is None:
+        value = parse(extracted.get(text_key))
+    return np.nan if value is None else float(value)
+
+
+def extract_features(proposals: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Numeric feature columns, NaN where a proposal doesn't state the value."""
+    n = len(proposals)
+    total = np.full(n, np.nan)
+    unit = np.full(n, np.nan)
+    quantity = np.full(n, np.nan)
+    warranty_months = np.full(n, np.nan)
+    delivery_days = np.full(n, np.nan)
+
+    for i, proposal in enumerate(proposals):
+        extracted = proposal.get("extracted") or {}
+        total[i] = _to_float(extracted.get("total_price"))
+        unit[i] = _to_float(extracted.get("price_per_piece", extracted.get("price")))
+        quantity[i] = _to_float(extracted.get("quantity"))
+        warranty_months[i] = _canonical(extracted, "warranty_months", "warranty", parse_warranty_months)
+        delivery_days[i] = _canonical(extracted, "delivery_days", "delivery_time", parse_delivery_days)
+
+    # Fill whichever price is missing from the other one and the quantity
+    with np.errstate(divide="ignore", invalid="ignore"):
+        total = np.where(np.isnan(total), unit * quantity, total)
+        unit = np.where(np.isnan(unit) & (quantity > 0), total / quantity, unit)
+    # What a proposal is priced by (see _price_scores); for eligibility and reasoning
+    price = np.where(np.isnan(total), unit, total)
+
+    return {
+        "price": price,
+        "total_price": total,
+        "price_per_piece": unit,
+        "quantity": quantity,
+        "warranty_months": warranty_months,
+        "delivery_days": delivery_days,
+    }
+
+
+def _lower_is_better(values: np.ndarray) -> np.ndarray:
+    """Min-max score 0-10 where the smallest value scores 10; missing values score 0."""
+    scores = np.zeros(len(values))
+    known = ~np.isnan(values)
+    if not known.any():
+        return scores
+    lo, hi = values[known].min(), values[known].max()
+    scores[known] = 10.0 if hi == lo else 10.0 * (hi - values[known]) / (hi - lo)
+    return scores
+
+
+def _higher_is_better(values: np.ndarray) -> np.ndarray:
+    scores = np.zeros(len(values))
+    known = ~np.isnan(values)
+    if not known.any():
+        return scores
+    lo, hi = values[known].min(), values[known].max()
+    scores[known] = 10.0 if hi == lo else 10.0 * (values[known] - lo) / (hi - lo)
+    return scores
+
+
+def _unit_priced(total: np.ndarray, unit: np.ndarray) -> np.ndarray:
+    """
+    Proposals priced by unit price alone. A lone unit price among totals has
+    nothing to be compared with and counts as no price.
+    """
+    unit_only = np.isnan(total) & ~np.isnan(unit)
+    if np.count_nonzero(~np.isnan(unit)) < 2 and not np.isnan(total).all():
+        return np.zeros(len(total), dtype=bool)
+    return unit_only
+
+
+def _price_scores(total: np.ndarray, unit: np.ndarray) -> np.ndarray:
+    """Totals scored against totals; proposals with only a unit price against all unit prices."""
+    scores = _lower_is_better(total)
+    unit_only = _unit_priced(total, unit)
+    if unit_only.any():
+        scores[unit_only] = _lower_is_better(unit)[unit_only]
+    return scores
+
+
+def _quantity_fit(quantity: np.ndarray, requested: Optional[float]) -> np.ndarray:
+    """10 for offering exactly the requested quantity, falling off with relative distance."""
+    scores = np.zeros(len(quantity))
+    known = ~np.isnan(quantity)
+    if not known.any():
+        return scores
+    target = requested if requested else float(np.median(quantity[known]))
+    if target <= 0:
+        return scores
+    distance = np.abs(quantity[known] - target) / target
+    scores[known] = 10.0 * np.clip(1.0 - distance, 0.0, 1.0)
+    return scores
+
+
+def compute_scores(features: Dict[str, np.ndarray], requested_quantity: Optional[float] = None) -> Dict[str, np.ndarray]:
+    scores = {
+        "price": _price_scores(features["total_price"], features["price_per_piece"]),
+        "delivery": _lower_is_better(features["delivery_days"]),
+        "warranty": _higher_is_better(features["warranty_months"]),
+        "quantity": _quantity_fit(features["quantity"], requested_quantity),
+    }
+    weight_total = sum(SCORE_WEIGHTS.values()) or 1.0
+    scores["overall"] = sum(scores[name] * weight for name, weight in SCORE_WEIGHTS.items()) / weight_total
+    return scores
+
+
+def top_k_indices(
+    scores: np.ndarray,
+    k: int,
+    eligible: np.ndarray,
+    proposals: List[Dict[str, Any]],
+    tiebreak: Optional[np.ndarray] = None
+) -> List[int]:
+    """
+    Indices of the k best eligible scores, best first, one entry per vendor.
+
+    np.partition finds the score threshold of the candidate set in O(n); only
+    candidates at or above it (ties included) are sorted. Ties are broken by
+    `tiebreak` (higher first) and then by original order. The candidate set
+    is widened if duplicate vendors use it up.
+    """
+    candidates = np.flatnonzero(eligible)
+    if len(candidates) == 0:
+        return []
+    if tiebreak is None:
+        tiebreak = np.zeros(len(scores))
+    width = min(len(candidates), k * 4)
+    while True:
+        values = scores[candidates]
+        if width < len(candidates):
+            threshold = -np.partition(-values, width - 1)[width - 1]
+            picked = candidates[values >= threshold]
+        else:
+            picked = candidates
+        picked = picked[np.lexsort((picked, -tiebreak[picked], -scores[picked]))]
+
+        top, seen_vendors = [], set()
+        for idx in picked.tolist():
+            vendor_id = proposals[idx].get("vendor_id")
+            if vendor_id and vendor_id in seen_vendors:
+                continue
+            if vendor_id:
+                seen_vendors.add(vendor_id)
+            top.append(idx)
+            if len(top) == k:
+                return top
+        if len(picked) >= len(candidates):
+            return top
+        width = min(len(candidates), width * 4)
+
+
+def _score_card(scores: Dict[str, np.ndarray], idx: int) -> Dict[str, float]:
+    return {
+        "price_score": round(float(scores["price"][idx]), 2),
+        "warranty_score": round(float(scores["warranty"][idx]), 2),
+        "delivery_score": round(float(scores["delivery"][idx]), 2),
+        "quantity_score": round(float(scores["quantity"][idx]), 2),
+        "overall_score": round(float(scores["overall"][idx]), 2),
+    }
+
+
+def _format_number(value: float) -> str:
+    return f"{value:,.2f}".rstrip("0").rstrip(".")
+
+
+def _reasoning(category: str, rank: int, features: Dict[str, np.ndarray], idx: int, count: int) -> str:
+    if category == "price":
+        if np.isnan(features["total_price"][idx]):
+            return f"Rank {rank} by price: ${_format_number(features['price_per_piece'][idx])} per unit, no total ({count} priced proposals)"
+        return f"Rank {rank} by price: ${_format_number(features['total_price'][idx])} total ({count} priced proposals)"
+    if category == "warranty":
+        return f"Rank {rank} by warranty: {_format_number(features['warranty_months'][idx])} months"
+    if category == "delivery":
+        return f"Rank {rank} by delivery: {_format_number(features['delivery_days'][idx])} days"
+    if category == "quantity":
+        return f"Rank {rank} by quantity fit: {_format_number(features['quantity'][idx])} units"
+    return f"Rank {rank} by weighted overall score"
+
+
+def score_proposals(proposals: List[Dict[str, Any]], requested_quantity: Optional[float] = None, k: int = TOP_K) -> Dict[str, Any]:
+    return rank_features(proposals, extract_features(proposals), requested_quantity, k)
+
+
+def rank_features(
+    proposals: List[Dict[str, Any]],
+    features: Dict[str, np.ndarray],
+    requested_quantity: Optional[float] = None,
+    k: int = TOP_K
+) -> Dict[str, Any]:
+    """score_proposals for feature columns that were already extracted (e.g. kept in evaluation_state)."""
+    scores = compute_scores(features, requested_quantity)
+
+    priced = ~np.isnan(features["total_price"]) | _unit_priced(features["total_price"], features["price_per_piece"])
+    source = {
+        "price": np.where(priced, features["price"], np.nan),
+        "warranty": features["warranty_months"],
+        "delivery": features["delivery_days"],
+        "quantity": features["quantity"],
+    }
+    everyone = np.ones(len(proposals), dtype=bool)
+
+    result = {}
+    for category in ("price", "warranty", "delivery", "quantity", "overall"):
+        # Categories only rank proposals that actually state the value; the
+        # rest are used to fill the top-k like the LLM path does
+        eligible = everyone if category == "overall" else ~np.isnan(source[category])
+        top = top_k_indices(scores[category], k, eligible, proposals, tiebreak=scores["overall"])
+        entries = [
+            {
+                "proposal": proposals[idx],
+                "reasoning": _reasoning(category, rank, features, idx, int(eligible.sum())),
+                "scores": _score_card(scores, idx),
+            }
+            for rank, idx in enumerate(top, 1)
+        ]
+        if len(entries) < k:
+            taken = set(top)
+            taken_vendors = {proposals[i].get("vendor_id") for i in top if proposals[i].get("vendor_id")}
+            for idx in top_k_indices(scores["overall"], len(proposals), everyone, proposals):
+                if len(entries) >= k:
+                    break
+                vendor_id = proposals[idx].get("vendor_id")
+                if idx in taken or (vendor_id and vendor_id in taken_vendors):
+                    continue
+                entries.append({
+                    "proposal": proposals[idx],
+                    "reasoning": f"Ranked #{len(entries) + 1} (added to fill top {k}; no {category} stated)",
+                    "scores": _score_card(scores, idx),
+                })
+        key = "overall_best_top3" if category == "overall" else f"best_{category}_top3"
+        result[key] = entries
+
+    result["total_proposals_evaluated"] = len(proposals)
+    return result
@@ -2,28 +2,103 @@ import pika
 import json
 import os
 import uuid
+import time
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from ai_service import (
     process_client_request,
     process_vendor_proposal,
+    process_extraction_batch,
     generate_vendor_message,
     generate_client_message
 )
-from queue_publisher import publish_to_queue
+from queue_publisher import RABBITMQ_HOST, RABBITMQ_PORT, connection_parameters, publish_to_queue, get_publisher
+from idempotency import get_ledger
+from resilience import (
+    RETRY_BASE_DELAY_MS,
+    PermanentError,
+    ollama_circuit,
+    declare_retry_topology,
+    retry_or_dead_letter
+)
 from models import Item, ExtractedData
+from structured_logging import LazyJson, configure_logging, get_logger, message_context
+from metrics import MESSAGES, IN_FLIGHT, observe_queue_wait, start_metrics_server
+from progress_events import emit, token_stream
 
 load_dotenv()
 
-RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")
-RABBITMQ_PORT = int(os.getenv("RABBITMQ_PORT", 5672))
-RABBITMQ_USER = os.getenv("RABBITMQ_USER", "guest")
-RABBITMQ_PASS = os.getenv("RABBITMQ_PASS", "guest")
+logger = get_logger(__name__)
 
 INPUT_QUEUE = "ai_request_queue"
 OUTPUT_QUEUE = "ai_responses_queue"
+# Label of this consumer's metrics
+CONSUMER_NAME = "queue_consumer"
+
+# Number of deliveries processed concurrently. 1 keeps the original behaviour
+# of handling each message inline on the pika I/O thread.
+CONSUMER_WORKERS = int(os.getenv("CONSUMER_WORKERS", 1))
+
+# Micro-batching (opt-in): short texts of the same origin are collected for up
+# to CONSUMER_BATCH_WAIT_MS or until CONSUMER_BATCH_SIZE messages, then
+# extracted with a single model call. 1 disables batching.
+CONSUMER_BATCH_SIZE = int(os.getenv("CONSUMER_BATCH_SIZE", 1))
+CONSUMER_BATCH_WAIT_MS = int(os.getenv("CONSUMER_BATCH_WAIT_MS", 200))
+# Longer texts gain little from sharing a prompt and are processed on their own
+CONSUMER_BATCH_MAX_CHARS = int(os.getenv("CONSUMER_BATCH_MAX_CHARS", 1500))
+
+
+class ThreadsafeChannel:
+    """
+    Channel proxy handed to worker threads.
+
+    pika channels may only be used from the thread running the connection's
+    I/O loop, so acks/nacks are scheduled back onto it with
+    add_callback_threadsafe.
+    """
+
+    def __init__(self, connection, channel):
+        self._connection = connection
+        self._channel = channel
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self._connection.add_callback_threadsafe(
+            functools.partial(self._channel.basic_ack, delivery_tag, multiple)
+        )
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self._connection.add_callback_threadsafe(
+            functools.partial(self._channel.basic_nack, delivery_tag, multiple, requeue)
+        )
+
 
+def pause(channel, seconds: float):
+    """Sleep in a handler; on the pika I/O thread heartbeats keep being serviced."""
+    if isinstance(channel, ThreadsafeChannel):
+        time.sleep(seconds)
+    else:
+        channel.connection.sleep(seconds)
 
-def process_message(channel, method, properties, body):
+
+def handle_failed_delivery(channel, method, properties, body, message, error: Exception):
+    """
+    Move a failed delivery to its retry queue (or the dead-letter queue once
+    out of attempts) and ack it. If even that publish fails the delivery is
+    requeued after a short pause.
+    """
+    if message is None:
+        message = body.decode("utf-8", errors="replace") if isinstance(body, bytes) else body
+        error = PermanentError(f"Invalid message body: {error}")
+    headers = properties.headers if properties is not None else None
+    if retry_or_dead_letter(INPUT_QUEUE, message, headers, error):
+        channel.basic_ack(method.delivery_tag)
+    else:
+        pause(channel, RETRY_BASE_DELAY_MS / 1000.0)
+        channel.basic_nack(method.delivery_tag, False, True)
+
+
+def process_message(channel, method, properties, body, queued: bool = False):
     """
     format:
     {
@@ -35,195 +110,352 @@ def process_message(channel, method, properties, body):
         "rfp_id": "...",  (optional for vendor)
         "vendor_id": "..."  (optional for vendor)
     }
+
+    `queued` means the caller already recorded the delivery's queue wait and
+    "queued" event (batch fallback), so they aren't counted twice.
     """
+    waited = None if queued else observe_queue_wait(properties)
+    message = None
+    message_id = None
     try:
         message = json.loads(body)
-        origin = message.get("origin")
-        
-        print(f"Processing message from {INPUT_QUEUE}")
-        print(f"Origin: {origin}")
-        print(f"MessageID: {message.get('messageId')}")
-        
-        if origin == "client":
-            process_client_message(channel, message)
-        elif origin == "vendor":
-            process_vendor_message(channel, message)
-        else:
-            print(f"Unknown origin: {origin}")
-            channel.basic_nack(method.delivery_tag, False, False)
-            return
-        
-        channel.basic_ack(method.delivery_tag)
-        print(f"Message acknowledged")
-        
-    except Exception as e:
-        print(f"Error processing message: {e}")
+        message_id = message.get("messageId")
+    except Exception:
+        message = None
+
+    with message_context(message_id), IN_FLIGHT.track_inprogress(consumer=CONSUMER_NAME):
         try:
-            print("Message body causing error:", body[:1000])
-        except Exception:
-            pass
-        channel.basic_nack(method.delivery_tag, False, False)
+            if message is None:
+                raise PermanentError("Message body is not valid JSON")
+            origin = message.get("origin")
+            logger.info("Processing %s message from %s", origin, INPUT_QUEUE)
+            if not queued:
+                emit_queued(message, waited)
+
+            if replay_processed_message(message_id):
+                channel.basic_ack(method.delivery_tag)
+                MESSAGES.inc(consumer=CONSUMER_NAME, outcome="duplicate")
+                logger.info("Duplicate message acknowledged")
+                return
+
+            # Wait out a model server outage instead of failing every prefetched message
+            ollama_circuit.wait_until_available(functools.partial(pause, channel))
+
+            if origin == "client":
+                process_client_message(channel, message)
+            elif origin == "vendor":
+                process_vendor_message(channel, message)
+            else:
+                raise PermanentError(f"Unknown origin: {origin}")
+
+            channel.basic_ack(method.delivery_tag)
+            MESSAGES.inc(consumer=CONSUMER_NAME, outcome="ok")
+            logger.info("Message acknowledged")
+
+        except Exception as e:
+            logger.error("Error processing message: %s", e)
+            logger.debug("Message body causing error: %r", body[:1000])
+            MESSAGES.inc(consumer=CONSUMER_NAME, outcome="failed")
+            handle_failed_delivery(channel, method, properties, body, message, e)
+
+
+def emit_queued(message: dict, waited):
+    emit(
+        "queued", message.get("messageId"), message.get("rfp_id"),
+        origin=message.get("origin"), waited_ms=None if waited is None else int(waited * 1000)
+    )
+
+
+def replay_processed_message(message_id) -> bool:
+    """Re-publish the stored response if this messageId was already processed."""
+    ledger = get_ledger()
+    if ledger is None or not message_id:
+        return False
+    entry = ledger.get(message_id)
+    if entry is None:
+        return False
+    logger.info("MessageID already processed; re-publishing stored response")
+    if not publish_to_queue(entry["queue"], entry["response"]):
+        raise Exception("Failed to re-publish stored response")
+    return True
 
 
-def process_client_message(channel, message: dict):
+def record_processed_message(message: dict, response: dict):
+    ledger = get_ledger()
+    message_id = message.get("messageId")
+    if ledger is None or not message_id:
+        return
     try:
-        message_id = message.get("messageId") or str(uuid.uuid4())
-        client_email = message.get("client_email")
-        vendor_email = message.get("vendor_email")
-        text = message.get("text")
-        
-        print(f"Client Email: {client_email}")
-        print(f"Vendor Email: {vendor_email}")
-        print(f"Text preview: {text[:100]}...")
-        
-        print("\nCalling Ollama AI for data extraction...")
+        ledger.record(message_id, OUTPUT_QUEUE, response)
+    except Exception as e:
+        # The response is already published; a missing ledger entry only costs a re-run on redelivery
+        logger.warning("Failed to record messageId in idempotency ledger: %s", e)
+
+
+def build_client_response(message: dict, structured_data, message_id: str) -> dict:
+    """Turn extracted RFP data into the ai_responses_queue payload for the Node listener."""
+    if isinstance(structured_data, list):
+        logger.warning("AI returned list instead of dict; wrapping items")
+        structured_data = {"items": structured_data}
+    
+    items = []
+    for item in structured_data.get("items", []):
+        if isinstance(item, dict):
+            items.append(Item(
+                name=item.get("name"),
+                quantity=item.get("quantity"),
+                specs=item.get("specs")
+            ))
+        else:
+            logger.warning("Skipping non-dict item: %r", item)
+    
+    message_for_vendor = generate_vendor_message(structured_data)
+    
+    return {
+        "origin": "client",
+        "messageId": message_id,
+        "client_email": message.get("client_email"),
+        "vendor_email": message.get("vendor_email"),
+        "subject": f"RFP: {structured_data.get('title', 'New Request')}",
+        "message_for_vendor": message_for_vendor,
+        "title": structured_data.get("title", "Untitled RFP"),
+        "description": structured_data.get("description", ""),
+        "budget": structured_data.get("budget"),
+        "items": [item.model_dump() for item in items],
+        "delivery_time": structured_data.get("delivery_time"),
+        "payment_terms": structured_data.get("payment_terms"),
+        "warranty": structured_data.get("warranty")
+    }
+
+
+def build_vendor_response(message: dict, structured_data: dict, message_id: str) -> dict:
+    """Turn extracted proposal data into the ai_responses_queue payload for the Node listener."""
+    message_for_client = generate_client_message(structured_data)
+    
+    return {
+        "origin": "vendor",
+        "messageId": message_id,
+        "client_email": message.get("client_email"),
+        "vendor_email": message.get("vendor_email"),
+        "subject": "Proposal Received",
+        "message_for_client": message_for_client,
+        "extracted": {
+            "price_per_piece": structured_data.get("price_per_piece"),
+            "total_price": structured_data.get("total_price"),
+            "price": structured_data.get("price"),
+            "quantity": structured_data.get("quantity"),
+            "terms": structured_data.get("terms"),
+            "warranty": structured_data.get("warranty"),
+            "delivery_time": structured_data.get("delivery_time"),
+            "delivery_days": structured_data.get("delivery_days"),
+            "warranty_months": structured_data.get("warranty_months")
+        },
+        "rfp_id": message.get("rfp_id"),
+        "vendor_id": message.get("vendor_id")
+    }
+
+
+def process_client_message(channel, message: dict, structured_data=None):
+    message_id = message.get("messageId") or str(uuid.uuid4())
+    text = message.get("text")
+    logger.debug(
+        "Client message client=%s vendor=%s text=%r",
+        message.get("client_email"), message.get("vendor_email"), text[:100] if text else text
+    )
+
+    if structured_data is None:
+        logger.info("Calling Ollama for data extraction")
+        emit("extracting", message_id)
         try:
-            structured_data = process_client_request(text)
-            print(f"AI extraction successful")
-            print(f"Extracted type: {type(structured_data)}")
-            print(f"Extracted: {json.dumps(structured_data, indent=2)[:300]}...")
+            with token_stream(message_id) as on_token:
+                structured_data = process_client_request(text, on_token=on_token)
         except Exception as e:
-            print(f"AI extraction failed: {e}")
+            logger.error("AI extraction failed: %s", e)
             raise
-        
-        if isinstance(structured_data, list):
-            print(f"AI returned list instead of dict; wrapping items...")
-            structured_data = {"items": structured_data}
-        
-        items = []
-        for item in structured_data.get("items", []):
-            if isinstance(item, dict):
-                items.append(Item(
-                    name=item.get("name"),
-                    quantity=item.get("quantity"),
-                    specs=item.get("specs")
-                ))
-            else:
-                print(f"Skipping non-dict item: {item}")
-        
-        message_for_vendor = generate_vendor_message(structured_data)
-        
-        response = {
-            "origin": "client",
-            "messageId": message_id,
-            "client_email": client_email,
-            "vendor_email": vendor_email,
-            "subject": f"RFP: {structured_data.get('title', 'New Request')}",
-            "message_for_vendor": message_for_vendor,
-            "title": structured_data.get("title", "Untitled RFP"),
-            "description": structured_data.get("description", ""),
-            "budget": structured_data.get("budget"),
-            "items": [item.model_dump() for item in items],
-            "delivery_time": structured_data.get("delivery_time"),
-            "payment_terms": structured_data.get("payment_terms"),
-            "warranty": structured_data.get("warranty")
-        }
-        
-        print(f"\nPublishing to {OUTPUT_QUEUE}...")
-        success = publish_to_queue(OUTPUT_QUEUE, response)
-        
-        if success:
-            print(f"Client message processed and published successfully")
-        else:
-            raise Exception("Failed to publish to output queue")
-            
-    except Exception as e:
-        print(f"Error processing client message: {e}")
-        raise
+        logger.debug("Extracted: %s", LazyJson(structured_data, limit=300, indent=2))
+    emit("parsed", message_id, extracted=structured_data)
 
+    response = build_client_response(message, structured_data, message_id)
 
-def process_vendor_message(channel, message: dict):
-    try:
-        message_id = message.get("messageId") or str(uuid.uuid4())
-        client_email = message.get("client_email")
-        vendor_email = message.get("vendor_email")
-        text = message.get("text")
-        rfp_id = message.get("rfp_id")
-        vendor_id = message.get("vendor_id")
-        
-        print(f"   Client Email: {client_email}")
-        print(f"   Vendor Email: {vendor_email}")
-        print(f"   Text preview: {text[:100]}...")
-        
-        print("\nCalling Ollama AI for data extraction...")
+    if not publish_to_queue(OUTPUT_QUEUE, response):
+        raise Exception("Failed to publish to output queue")
+    emit("published", message_id, queue=OUTPUT_QUEUE)
+    record_processed_message(message, response)
+    logger.info("Client message processed and published to %s", OUTPUT_QUEUE)
+
+
+def process_vendor_message(channel, message: dict, structured_data=None):
+    message_id = message.get("messageId") or str(uuid.uuid4())
+    text = message.get("text")
+    logger.debug(
+        "Vendor message client=%s vendor=%s text=%r",
+        message.get("client_email"), message.get("vendor_email"), text[:100] if text else text
+    )
+
+    rfp_id = message.get("rfp_id")
+    if structured_data is None:
+        logger.info("Calling Ollama for data extraction")
+        emit("extracting", message_id, rfp_id)
         try:
-            structured_data = process_vendor_proposal(text)
-            print(f"AI extraction successful")
-            print(f"Extracted: {json.dumps(structured_data, indent=2)[:300]}...")
+            with token_stream(message_id, rfp_id) as on_token:
+                structured_data = process_vendor_proposal(text, on_token=on_token)
         except Exception as e:
-            print(f"AI extraction failed: {e}")
+            logger.error("AI extraction failed: %s", e)
             raise
-        
-        message_for_client = generate_client_message(structured_data)
-        
-        response = {
-            "origin": "vendor",
-            "messageId": message_id,
-            "client_email": client_email,
-            "vendor_email": vendor_email,
-            "subject": "Proposal Received",
-            "message_for_client": message_for_client,
-            "extracted": {
-                "price_per_piece": structured_data.get("price_per_piece"),
-                "total_price": structured_data.get("total_price"),
-                "price": structured_data.get("price"),
-                "quantity": structured_data.get("quantity"),
-                "terms": structured_data.get("terms"),
-                "warranty": structured_data.get("warranty"),
-                "delivery_time": structured_data.get("delivery_time")
-            },
-            "rfp_id": rfp_id,
-            "vendor_id": vendor_id
-        }
-        
-        print(f"\nPublishing to {OUTPUT_QUEUE}...")
-        success = publish_to_queue(OUTPUT_QUEUE, response)
-        
-        if success:
-            print(f"Vendor message processed and published successfully")
-        else:
-            raise Exception("Failed to publish to output queue")
-            
+        logger.debug("Extracted: %s", LazyJson(structured_data, limit=300, indent=2))
+    emit("parsed", message_id, rfp_id, extracted=structured_data)
+
+    response = build_vendor_response(message, structured_data, message_id)
+
+    if not publish_to_queue(OUTPUT_QUEUE, response):
+        raise Exception("Failed to publish to output queue")
+    emit("published", message_id, rfp_id, queue=OUTPUT_QUEUE)
+    record_processed_message(message, response)
+    logger.info("Vendor message processed and published to %s", OUTPUT_QUEUE)
+
+def process_message_batch(channel, origin: str, deliveries: list):
+    """
+    Extract a batch of same-origin deliveries with one model call, then
+    publish and ack each delivery on its own.
+
+    deliveries: list of (method, properties, body, message). Messages the
+    batch answer doesn't cover, or all of them if the batch call fails, go
+    through the normal per-message path.
+    """
+    documents = {str(i + 1): message.get("text") for i, (_, _, _, message) in enumerate(deliveries)}
+    for _, properties, _, message in deliveries:
+        emit_queued(message, observe_queue_wait(properties))
+        emit("extracting", message.get("messageId"), message.get("rfp_id"))
+    logger.info("Processing batch of %d %s messages", len(deliveries), origin)
+    ollama_circuit.wait_until_available(functools.partial(pause, channel))
+    try:
+        results = process_extraction_batch(origin, documents)
     except Exception as e:
-        print(f"Error processing vendor message: {e}")
-        raise
+        logger.warning("Batch extraction failed, falling back to per-message calls: %s", e)
+        results = {}
+
+    handler = process_client_message if origin == "client" else process_vendor_message
+    for i, (method, properties, body, message) in enumerate(deliveries):
+        structured_data = results.get(str(i + 1))
+        if structured_data is None:
+            process_message(channel, method, properties, body, queued=True)
+            continue
+        with message_context(message.get("messageId")):
+            try:
+                handler(channel, message, structured_data)
+                channel.basic_ack(method.delivery_tag)
+                MESSAGES.inc(consumer=CONSUMER_NAME, outcome="ok")
+            except Exception as e:
+                logger.error("Error processing batched message: %s", e)
+                MESSAGES.inc(consumer=CONSUMER_NAME, outcome="failed")
+                handle_failed_delivery(channel, method, properties, body, message, e)
+
+
+class MicroBatcher:
+    """
+    Collects short ai_request_queue messages per origin on the pika I/O thread
+    and hands full (or timed-out) batches to `dispatch`.
+    """
+
+    def __init__(self, connection, dispatch, batch_size: int = CONSUMER_BATCH_SIZE, wait_ms: int = CONSUMER_BATCH_WAIT_MS):
+        self.connection = connection
+        self.dispatch = dispatch
+        self.batch_size = batch_size
+        self.wait_s = wait_ms / 1000.0
+        self.pending = {"client": [], "vendor": []}
+        self.timers = {}
+
+    def on_message(self, channel, method, properties, body):
+        try:
+            message = json.loads(body)
+        except Exception:
+            message = None
+
+        origin = message.get("origin") if isinstance(message, dict) else None
+        text = message.get("text") if isinstance(message, dict) else None
+        if origin not in self.pending or not isinstance(text, str) or len(text) > CONSUMER_BATCH_MAX_CHARS:
+            self.dispatch(process_message, method, properties, body)
+            return
+        ledger = get_ledger()
+        if ledger is not None and message.get("messageId") and ledger.get(message["messageId"]):
+            # Duplicates are answered from the ledger by the normal path
+            self.dispatch(process_message, method, properties, body)
+            return
+
+        self.pending[origin].append((method, properties, body, message))
+        if len(self.pending[origin]) >= self.batch_size:
+            self.flush(origin)
+        elif origin not in self.timers:
+            self.timers[origin] = self.connection.call_later(self.wait_s, functools.partial(self._on_timer, origin))
+
+    def _on_timer(self, origin: str):
+        self.timers.pop(origin, None)
+        self.flush(origin)
+
+    def flush(self, origin: str):
+        timer = self.timers.pop(origin, None)
+        if timer is not None:
+            self.connection.remove_timeout(timer)
+        deliveries, self.pending[origin] = self.pending[origin], []
+        if deliveries:
+            self.dispatch(process_message_batch, origin, deliveries)
+
 
 def start_consumer():
+    connection = None
+    executor = None
     try:
-        print(f"Starting RabbitMQ Queue Consumer")
-        print(f"Input Queue: {INPUT_QUEUE}")
-        print(f"Output Queue: {OUTPUT_QUEUE}")
-        print(f"RabbitMQ: {RABBITMQ_HOST}:{RABBITMQ_PORT}")
-        
-        credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-        connection = pika.BlockingConnection(
-            pika.ConnectionParameters(
-                host=RABBITMQ_HOST,
-                port=RABBITMQ_PORT,
-                credentials=credentials,
-                heartbeat=600,
-                blocked_connection_timeout=300
-            )
+        configure_logging()
+        logger.info(
+            "Starting RabbitMQ Queue Consumer: input=%s output=%s rabbitmq=%s:%s workers=%d",
+            INPUT_QUEUE, OUTPUT_QUEUE, RABBITMQ_HOST, RABBITMQ_PORT, CONSUMER_WORKERS
         )
+        start_metrics_server()
+        
+        connection = pika.BlockingConnection(connection_parameters())
         channel = connection.channel()        
         channel.queue_declare(queue=INPUT_QUEUE, durable=True)        
-        channel.basic_qos(prefetch_count=1)        
+        declare_retry_topology(channel, INPUT_QUEUE)
+
+        on_message = process_message
+        if CONSUMER_WORKERS > 1:
+            executor = ThreadPoolExecutor(max_workers=CONSUMER_WORKERS, thread_name_prefix="ai-worker")
+            worker_channel = ThreadsafeChannel(connection, channel)
+
+            def dispatch(handler, *args):
+                executor.submit(handler, worker_channel, *args)
+
+            def on_message(ch, method, properties, body):
+                dispatch(process_message, method, properties, body)
+        else:
+            def dispatch(handler, *args):
+                handler(channel, *args)
+
+        batch_size = max(1, CONSUMER_BATCH_SIZE)
+        if batch_size > 1:
+            logger.info("Micro-batching: up to %d messages / %d ms", batch_size, CONSUMER_BATCH_WAIT_MS)
+            on_message = MicroBatcher(connection, dispatch, batch_size, CONSUMER_BATCH_WAIT_MS).on_message
+
+        # Enough unacked deliveries to fill one batch per worker, and no more
+        channel.basic_qos(prefetch_count=max(1, CONSUMER_WORKERS) * batch_size)
         channel.basic_consume(
             queue=INPUT_QUEUE,
-            on_message_callback=process_message,
+            on_message_callback=on_message,
             auto_ack=False
         )
         
-        print(f"Connected to RabbitMQ")
-        print(f"Listening to '{INPUT_QUEUE}' queue...")
-        print(f"Processing messages...\n")
+        logger.info("Connected to RabbitMQ; listening to '%s'", INPUT_QUEUE)
        
         channel.start_consuming()
         
     except Exception as e:
-        print(f"Consumer error: {e}")
+        logger.error("Consumer error: %s", e)
         raise
     finally:
+        if executor:
+            # Unacked deliveries of in-flight work are redelivered by the broker
+            executor.shutdown(wait=False, cancel_futures=True)
+        get_publisher().close()
         if connection:
             connection.close()
 
@@ -232,6 +464,6 @@ if __name__ == "__main__":
     try:
         start_consumer()
     except KeyboardInterrupt:
-        print("\nConsumer stopped")
+        logger.info("Consumer stopped")
     except Exception as e:
-        print(f"\nFatal error: {e}")
+        logger.critical("Fatal error: %s", e)
@@ -1,62 +1,238 @@
 """
 RabbitMQ Publisher: Sends processed AI responses to Node.js backend via RabbitMQ
+
+Publishing goes through a long-lived QueuePublisher that keeps a small pool of
+connections/channels open, remembers which queues were already declared and
+waits for publisher confirms, instead of doing a full TCP + AMQP handshake for
+every message.
 """
 import pika
 import json
+import logging
 import os
+import queue
+import threading
+import time
 from dotenv import load_dotenv
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from metrics import STAGE_SECONDS
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")
 RABBITMQ_PORT = int(os.getenv("RABBITMQ_PORT", 5672))
 RABBITMQ_USER = os.getenv("RABBITMQ_USER", "guest")
 RABBITMQ_PASS = os.getenv("RABBITMQ_PASS", "guest")
 
+PUBLISHER_POOL_SIZE = int(os.getenv("PUBLISHER_POOL_SIZE", 4))
+PUBLISHER_CONFIRMS = os.getenv("PUBLISHER_CONFIRMS", "true").lower() == "true"
+PUBLISHER_MAX_RETRIES = int(os.getenv("PUBLISHER_MAX_RETRIES", 2))
+PUBLISHER_ACQUIRE_TIMEOUT = float(os.getenv("PUBLISHER_ACQUIRE_TIMEOUT", 30))
+
+
+def connection_parameters() -> pika.ConnectionParameters:
+    """RabbitMQ connection settings shared by every blocking connection of this service."""
+    credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
+    return pika.ConnectionParameters(
+        host=RABBITMQ_HOST,
+        port=RABBITMQ_PORT,
+        credentials=credentials,
+        heartbeat=600,
+        blocked_connection_timeout=300
+    )
+
+
+class _PooledChannel:
+    """One connection + channel pair owned by the pool."""
+
+    def __init__(self, confirm: bool):
+        self.connection = pika.BlockingConnection(connection_parameters())
+        self.channel = self.connection.channel()
+        if confirm:
+            self.channel.confirm_delivery()
+
+    @property
+    def is_open(self) -> bool:
+        return self.connection.is_open and self.channel.is_open
+
+    def close(self):
+        try:
+            if self.connection.is_open:
+                self.connection.close()
+        except Exception:
+            pass
+
+
+class QueuePublisher:
+    """
+    Thread-safe pooled publisher.
+
+    pika's BlockingConnection must not be shared between threads, so each
+    pooled connection is checked out by exactly one publishing thread at a time.
+    Broken connections are discarded and replaced on the next publish.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = PUBLISHER_POOL_SIZE,
+        confirm: bool = PUBLISHER_CONFIRMS,
+        max_retries: int = PUBLISHER_MAX_RETRIES
+    ):
+        self.pool_size = max(1, pool_size)
+        self.confirm = confirm
+        self.max_retries = max(0, max_retries)
+        self._idle: "queue.LifoQueue[_PooledChannel]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._declared = set()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _acquire(self) -> _PooledChannel:
+        if not self._slots.acquire(timeout=PUBLISHER_ACQUIRE_TIMEOUT):
+            raise TimeoutError("Timed out waiting for a free publisher channel")
+        try:
+            while True:
+                try:
+                    pooled = self._idle.get_nowait()
+                except queue.Empty:
+                    return _PooledChannel(self.confirm)
+                if pooled.is_open:
+                    try:
+                        # Service heartbeats that arrived while the connection sat idle
+                        pooled.connection.process_data_events(time_limit=0)
+                        return pooled
+                    except Exception:
+                        pass
+                pooled.close()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, pooled: _PooledChannel, broken: bool = False):
+        if broken or self._closed or not pooled.is_open:
+            pooled.close()
+            if broken:
+                # The broker may have restarted; declare queues again on the new connection
+                with self._lock:
+                    self._declared.clear()
+        else:
+            self._idle.put(pooled)
+        self._slots.release()
+
+    def _ensure_queue(self, pooled: _PooledChannel, queue_name: str):
+        if queue_name in self._declared:
+            return
+        pooled.channel.queue_declare(queue=queue_name, durable=True)
+        with self._lock:
+            self._declared.add(queue_name)
+
+    def publish(
+        self,
+        queue_name: str,
+        message: Dict[str, Any],
+        headers: Optional[Dict[str, Any]] = None,
+        exchange: str = '',
+        expiration: Optional[str] = None
+    ) -> bool:
+        """
+        Publish a message, reconnecting up to max_retries times.
+
+        With the default exchange the queue is declared first and queue_name
+        is the routing key. With a named exchange, queue_name is only used as
+        the routing key; the exchange and its bindings must already exist.
+
+        Returns:
+            True if the broker accepted (and, with confirms enabled, confirmed) the message
+        """
+        with STAGE_SECONDS.time(stage="publish"):
+            return self._publish(queue_name, message, headers, exchange, expiration)
+
+    def _publish(self, queue_name, message, headers, exchange, expiration) -> bool:
+        body = json.dumps(message)
+        now = time.time()
+        # Lets consumers measure how long the message waited in the queue; for
+        # delayed (expiring) retries, from the moment it becomes deliverable
+        ready_at = now + (float(expiration) / 1000.0 if expiration else 0.0)
+        properties = pika.BasicProperties(
+            delivery_mode=pika.DeliveryMode.Persistent,
+            content_type="application/json",
+            headers=dict(headers or {}, **{"x-published-at": int(ready_at * 1000)}),
+            timestamp=int(now),
+            expiration=expiration
+        )
+
+        last_error = None
+        for _ in range(self.max_retries + 1):
+            try:
+                pooled = self._acquire()
+            except Exception as e:
+                last_error = e
+                continue
+
+            try:
+                if not exchange:
+                    self._ensure_queue(pooled, queue_name)
+                pooled.channel.basic_publish(
+                    exchange=exchange,
+                    routing_key=queue_name,
+                    body=body,
+                    properties=properties,
+                    mandatory=self.confirm
+                )
+            except (pika.exceptions.UnroutableError, pika.exceptions.NackError) as e:
+                # The broker is reachable but refused the message; retrying on a
+                # fresh connection won't change that.
+                self._release(pooled)
+                logger.error("Broker rejected message for %s: %s", queue_name, e)
+                return False
+            except Exception as e:
+                last_error = e
+                self._release(pooled, broken=True)
+                continue
+
+            self._release(pooled)
+            return True
+
+        logger.error("Failed to publish to queue %s: %s", queue_name, last_error)
+        return False
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_publisher: Optional[QueuePublisher] = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher() -> QueuePublisher:
+    """Return the process-wide publisher, creating it on first use."""
+    global _publisher
+    if _publisher is None:
+        with _publisher_lock:
+            if _publisher is None:
+                _publisher = QueuePublisher()
+    return _publisher
+
 
 def publish_to_queue(queue_name: str, message: Dict[str, Any]) -> bool:
     """
     Publish a message to RabbitMQ queue.
-    
+
     Args:
         queue_name: Name of the queue (e.g., "ai_responses_queue")
         message: Dictionary to serialize as JSON
-    
+
     Returns:
         True if successful, False otherwise
     """
-    try:
-        # Create connection
-        credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-        connection = pika.BlockingConnection(
-            pika.ConnectionParameters(
-                host=RABBITMQ_HOST,
-                port=RABBITMQ_PORT,
-                credentials=credentials,
-                heartbeat=600,
-                blocked_connection_timeout=300
-            )
-        )
-        channel = connection.channel()
-        
-        # Declare queue
-        channel.queue_declare(queue=queue_name, durable=True)
-        
-        # Publish message
-        channel.basic_publish(
-            exchange='',
-            routing_key=queue_name,
-            body=json.dumps(message),
-            properties=pika.BasicProperties(
-                delivery_mode=pika.DeliveryMode.Persistent
-            )
-        )
-        
-        print(f"✓ Message published to {queue_name}")
-        connection.close()
-        return True
-        
-    except Exception as e:
-        print(f"✗ Failed to publish to queue: {e}")
-        return False
+    success = get_publisher().publish(queue_name, message)
+    if success:
+        logger.debug("Message published to %s", queue_name)
+    return success
@@ -0,0 +1,245 @@
+"""
+Retries, dead-lettering and a circuit breaker for the AI consumers.
+
+- Failed messages are re-published to per-attempt delay queues
+  (<queue>.retry.<n>) with a jittered, exponentially growing per-message TTL.
+  When the TTL expires the broker dead-letters them back onto <queue>.
+- Messages that still fail after RETRY_MAX_ATTEMPTS (connection errors:
+  RETRY_MAX_CONNECTION_ATTEMPTS), or that can never
+  succeed (invalid JSON, unknown origin), are published to the dead-letter
+  exchange and end up in <queue>.dead with the last error in their headers.
+- `ollama_circuit` trips after repeated connection failures to the model
+  server. While it is open, consumers wait instead of burning through (and
+  failing) every prefetched message.
+
+The input queues themselves keep their original arguments, so existing
+queues don't have to be re-created.
+"""
+import os
+import random
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from queue_publisher import get_publisher
+from progress_events import emit
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", 3))
+# Connection errors have their own, larger budget: an outage shouldn't dead-letter
+# everything, but a message that always fails (e.g. a 5xx from every model server) must
+RETRY_MAX_CONNECTION_ATTEMPTS = int(os.getenv("RETRY_MAX_CONNECTION_ATTEMPTS", 20))
+RETRY_BASE_DELAY_MS = int(os.getenv("RETRY_BASE_DELAY_MS", 2000))
+RETRY_MAX_DELAY_MS = int(os.getenv("RETRY_MAX_DELAY_MS", 60000))
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 15))
+CIRCUIT_MAX_RESET_TIMEOUT = float(os.getenv("CIRCUIT_MAX_RESET_TIMEOUT", 120))
+
+RETRY_EXCHANGE = "rfp.retry"
+DEAD_LETTER_EXCHANGE = "rfp.dead_letter"
+
+RETRY_COUNT_HEADER = "x-retry-count"
+CONNECTION_RETRY_COUNT_HEADER = "x-connection-retry-count"
+ERROR_HEADER = "x-last-error"
+
+
+class PermanentError(Exception):
+    """A message that will fail the same way on every attempt; dead-lettered without retries."""
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of calling the model server while the circuit is open."""
+
+
+def retry_queue_name(queue_name: str, attempt: int) -> str:
+    return f"{queue_name}.retry.{attempt}"
+
+
+def dead_letter_queue_name(queue_name: str) -> str:
+    return f"{queue_name}.dead"
+
+
+def retry_queue_arguments(queue_name: str) -> Dict[str, Any]:
+    # Expired messages go back to the work queue through the default exchange
+    return {"x-dead-letter-exchange": "", "x-dead-letter-routing-key": queue_name}
+
+
+def retry_delay_ms(attempt: int) -> int:
+    """
+    Delay before retry `attempt` (1-based): exponential, capped, with jitter
+    in [delay/2, delay] so a burst of failures doesn't come back at once.
+
+    All messages in one delay queue share the same bounds, which keeps the
+    head-of-line wait of per-message TTLs within that range.
+    """
+    delay = min(RETRY_MAX_DELAY_MS, RETRY_BASE_DELAY_MS * (2 ** (attempt - 1)))
+    return int(delay / 2 + random.random() * delay / 2)
+
+
+def declare_retry_topology(channel, queue_name: str):
+    """Declare the retry/dead-letter exchanges and queues for a work queue (pika channel)."""
+    channel.exchange_declare(exchange=RETRY_EXCHANGE, exchange_type="direct", durable=True)
+    channel.exchange_declare(exchange=DEAD_LETTER_EXCHANGE, exchange_type="direct", durable=True)
+    for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+        name = retry_queue_name(queue_name, attempt)
+        channel.queue_declare(queue=name, durable=True, arguments=retry_queue_arguments(queue_name))
+        channel.queue_bind(queue=name, exchange=RETRY_EXCHANGE, routing_key=name)
+    dead = dead_letter_queue_name(queue_name)
+    channel.queue_declare(queue=dead, durable=True)
+    channel.queue_bind(queue=dead, exchange=DEAD_LETTER_EXCHANGE, routing_key=queue_name)
+
+
+def retry_count(headers: Optional[Dict[str, Any]], header: str = RETRY_COUNT_HEADER) -> int:
+    try:
+        return int((headers or {}).get(header, 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def next_retry(headers: Optional[Dict[str, Any]], error: Exception):
+    """
+    Where a failed message goes next: (attempt, headers) for a retry, or
+    (None, headers) when it should be dead-lettered.
+
+    Connection errors (model server or broker down) don't use up attempts;
+    the circuit breaker already keeps consumers from hammering a dead server.
+    They are counted separately and dead-lettered after
+    RETRY_MAX_CONNECTION_ATTEMPTS, backing off like ordinary retries.
+    """
+    count = retry_count(headers)
+    new_headers = dict(headers or {})
+    new_headers[ERROR_HEADER] = f"{type(error).__name__}: {error}"[:500]
+    if isinstance(error, PermanentError):
+        return None, new_headers
+    if isinstance(error, ConnectionError):
+        connection_count = retry_count(headers, CONNECTION_RETRY_COUNT_HEADER)
+        if connection_count >= RETRY_MAX_CONNECTION_ATTEMPTS:
+            return None, new_headers
+        new_headers[CONNECTION_RETRY_COUNT_HEADER] = connection_count + 1
+        return max(1, min(max(count, connection_count + 1), RETRY_MAX_ATTEMPTS)), new_headers
+    if count >= RETRY_MAX_ATTEMPTS:
+        return None, new_headers
+    new_headers[RETRY_COUNT_HEADER] = count + 1
+    return count + 1, new_headers
+
+
+def retry_or_dead_letter(queue_name: str, message: Any, headers: Optional[Dict[str, Any]], error: Exception) -> bool:
+    """
+    Re-publish a failed message to its delay queue, or to the dead-letter
+    exchange once it is out of attempts.
+
+    Returns True if the message was handed to the broker (the original
+    delivery can then be acked).
+    """
+    attempt, new_headers = next_retry(headers, error)
+    if not isinstance(message, dict):
+        message = {"body": message}
+    publisher = get_publisher()
+    message_id, rfp_id = message.get("messageId"), message.get("rfp_id")
+    if attempt is None:
+        logger.error("Dead-lettering message from %s: %s", queue_name, new_headers[ERROR_HEADER])
+        emit("dead_lettered", message_id, rfp_id, error=new_headers[ERROR_HEADER])
+        return publisher.publish(queue_name, message, headers=new_headers, exchange=DEAD_LETTER_EXCHANGE)
+    delay = retry_delay_ms(attempt)
+    logger.warning("Retrying message from %s in %d ms (attempt %d/%d)", queue_name, delay, attempt, RETRY_MAX_ATTEMPTS)
+    emit("retrying", message_id, rfp_id, attempt=attempt, delay_ms=delay, error=new_headers[ERROR_HEADER])
+    return publisher.publish(
+        retry_queue_name(queue_name, attempt),
+        message,
+        headers=new_headers,
+        exchange=RETRY_EXCHANGE,
+        expiration=str(delay)
+    )
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures. After
+    `reset_timeout` one probe call is let through (half-open); success closes
+    the circuit, failure opens it again with a doubled timeout (capped).
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+        max_reset_timeout: float = CIRCUIT_MAX_RESET_TIMEOUT,
+        name: str = "Model server"
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max(reset_timeout, max_reset_timeout)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._reset_timeout = reset_timeout
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._probing or time.monotonic() - self._opened_at >= self._reset_timeout:
+                return "half-open"
+            return "open"
+
+    def retry_after(self) -> float:
+        """Seconds until a call may be attempted (0 if one may be attempted now)."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            remaining = self._opened_at + self._reset_timeout - time.monotonic()
+            if remaining > 0:
+                return remaining
+            # Half-open: only the probe goes through, everyone else waits for its outcome
+            return 1.0 if self._probing else 0.0
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call is allowed now."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self._reset_timeout - time.monotonic()
+            if remaining > 0 or self._probing:
+                raise CircuitOpenError(f"{self.name} circuit open; retry in {max(remaining, 1.0):.0f}s")
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("%s reachable again; circuit closed", self.name)
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+            self._reset_timeout = self.base_reset_timeout
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing:
+                self._reset_timeout = min(self.max_reset_timeout, self._reset_timeout * 2)
+                self._opened_at = time.monotonic()
+                self._probing = False
+            elif self._opened_at is None and self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                logger.error("%s failing; circuit open for %.0fs", self.name, self._reset_timeout)
+
+    def wait_until_available(self, sleep: Callable[[float], None] = time.sleep):
+        """Block (using `sleep`) while the circuit is open."""
+        while True:
+            remaining = self.retry_after()
+            if remaining <= 0:
+                return
+            sleep(min(remaining, 5.0))
+
+
+ollama_circuit = CircuitBreaker()
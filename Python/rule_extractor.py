@@ -0,0 +1,159 @@
+"""
+Rule-based extraction of simple vendor quotes, without a model call.
+
+Many vendor replies are one line ("$45 per unit, 200 units, delivery in 10
+days, 1 year warranty"). extract_vendor_quote() reads price, quantity,
+delivery and warranty from such text with precompiled patterns and returns
+an ExtractedData plus a confidence in [0, 1]:
+
+- each field found adds its weight (price 0.4, quantity, delivery and
+  warranty 0.2 each),
+- the result is scaled down when the text holds money amounts the patterns
+  didn't account for, several different unit prices, hedging words
+  ("discount", "if", "or", ...), or a total that doesn't match unit price
+  times quantity.
+
+Anything that isn't clearly a simple quote ends up below
+RULE_EXTRACTOR_MIN_CONFIDENCE and goes to the model instead. ai_service
+registers the extractor as the "rules" tier of vendor extraction (see
+model_tiers), in front of the model tiers.
+"""
+import os
+import re
+from typing import Optional, Tuple
+
+from dotenv import load_dotenv
+
+from duration_normalizer import DURATION_PATTERN, delivery_days, warranty_months
+from models import ExtractedData
+
+load_dotenv()
+
+RULE_EXTRACTOR_ENABLED = os.getenv("RULE_EXTRACTOR_ENABLED", "true").lower() == "true"
+# Quotes below this confidence are sent to the model
+RULE_EXTRACTOR_MIN_CONFIDENCE = float(os.getenv("RULE_EXTRACTOR_MIN_CONFIDENCE", 0.8))
+# Longer texts are never rule-extracted; they carry context the patterns can't see
+RULE_EXTRACTOR_MAX_CHARS = int(os.getenv("RULE_EXTRACTOR_MAX_CHARS", 400))
+
+_WEIGHTS = {"price": 0.4, "quantity": 0.2, "delivery": 0.2, "warranty": 0.2}
+
+_AMOUNT = r'(\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)'
+_MONEY = r'(?:(?:\$|US\$|USD\s?)\s*' + _AMOUNT + r'|' + _AMOUNT + r'\s*(?:dollars|USD)\b)'
+_PER_UNIT = r'(?:per|/|a|an|for\s+each)\s*(?:unit|piece|pc|item|ea)s?\b|each\b|apiece\b|ea\b'
+_DURATION = r'(?P<duration>' + DURATION_PATTERN + r')'
+
+_MONEY_RE = re.compile(_MONEY, re.IGNORECASE)
+# "$45 per unit", "$45/pc", "$45 each", "unit price: $45"
+_UNIT_PRICE_RE = re.compile(
+    _MONEY + r'\s*(?:' + _PER_UNIT + r')|\b(?:unit\s+price|price\s+per\s+(?:unit|piece|item))\s*(?:is|of|:|=|at)?\s*' + _MONEY,
+    re.IGNORECASE
+)
+# "total: $9,000", "total price of $9,000", "$9,000 in total"
+_TOTAL_RE = re.compile(
+    r'\btotal(?:\s+(?:price|cost|amount))?\s*(?:is|of|:|=|comes\s+to|at)?\s*' + _MONEY + r'|' + _MONEY + r'\s*(?:in\s+)?total\b',
+    re.IGNORECASE
+)
+# "200 units", "qty: 200", "quantity of 200"
+_QUANTITY_RE = re.compile(
+    r'\b(\d{1,3}(?:,\d{3})+|\d+)\s*(?:units?|pieces?|pcs|items?|sets?)\b|\b(?:quantity|qty)\s*(?:of|is|:|=)?\s*(\d{1,3}(?:,\d{3})+|\d+)\b',
+    re.IGNORECASE
+)
+# "delivery in 10 days", "ships within 2-3 weeks", "10-day delivery"
+_DELIVERY_RE = re.compile(
+    r'\b(?:deliver(?:y|ed|s)?|ship(?:ping|ped|s)?|lead\s*time|dispatch(?:ed)?|arriv(?:e|es|ing|al))\b[^.;\d$]{0,25}?' + _DURATION
+    + r'|' + _DURATION.replace('?P<duration>', '?P<duration2>') + r'\s*(?:delivery|lead\s*time|shipping)\b',
+    re.IGNORECASE
+)
+# "1 year warranty", "2-year limited warranty", "warranty: 12 months", "lifetime warranty"
+_WARRANTY_RE = re.compile(
+    _DURATION + r'\s*(?:of\s+)?(?:\w+\s+)?warranty\b'
+    + r'|\bwarranty\b[^.;\d$]{0,20}?' + _DURATION.replace('?P<duration>', '?P<duration2>')
+    + r'|\b(?P<lifetime>lifetime)\s+warranty\b',
+    re.IGNORECASE
+)
+# "net 30", "30% advance"
+_TERMS_RE = re.compile(r'\bnet\s*\d+\b|\b\d+\s*%\s*(?:advance|upfront|deposit)\b', re.IGNORECASE)
+# Conditions the patterns would silently drop
+_HEDGE_RE = re.compile(
+    r'\b(?:discount\w*|if|unless|or|alternatively|option(?:al|s)?|instead|tier(?:ed|s)?|depend\w*|approx\w*|'
+    r'estimat\w*|tbd|negotiable|excluding|plus|\+\s*tax|shipping\s+extra)\b',
+    re.IGNORECASE
+)
+
+
+def _amount(match: re.Match) -> Optional[float]:
+    value = next((g for g in match.groups() if g and re.fullmatch(_AMOUNT, g)), None)
+    return None if value is None else float(value.replace(",", ""))
+
+
+def _duration(match: re.Match) -> Optional[str]:
+    groups = match.groupdict()
+    if groups.get("lifetime"):
+        return "lifetime"
+    value = groups.get("duration") or groups.get("duration2")
+    return " ".join(value.split()) if value else None
+
+
+def extract_vendor_quote(text: str) -> Tuple[ExtractedData, float]:
+    """Structured data of a simple vendor quote and the confidence that it is complete and right."""
+    data = ExtractedData()
+    if not text or len(text) > RULE_EXTRACTOR_MAX_CHARS:
+        return data, 0.0
+
+    explained = set()
+    unit_prices = set()
+    for match in _UNIT_PRICE_RE.finditer(text):
+        unit_prices.add(_amount(match))
+        explained.update(_amount(m) for m in _MONEY_RE.finditer(match.group(0)))
+    totals = set()
+    for match in _TOTAL_RE.finditer(text):
+        totals.add(_amount(match))
+        explained.update(_amount(m) for m in _MONEY_RE.finditer(match.group(0)))
+    quantities = {int((m.group(1) or m.group(2)).replace(",", "")) for m in _QUANTITY_RE.finditer(text)}
+
+    if len(unit_prices) == 1:
+        data.price_per_piece = data.price = unit_prices.pop()
+    if len(totals) == 1:
+        data.total_price = totals.pop()
+    if len(quantities) == 1:
+        data.quantity = quantities.pop()
+
+    delivery = _DELIVERY_RE.search(text)
+    if delivery:
+        data.delivery_time = _duration(delivery)
+        data.delivery_days = delivery_days(data.delivery_time)
+    warranty = _WARRANTY_RE.search(text)
+    if warranty:
+        data.warranty = _duration(warranty)
+        data.warranty_months = warranty_months(data.warranty)
+    terms = _TERMS_RE.search(text)
+    if terms:
+        data.terms = terms.group(0)
+
+    found = {
+        "price": data.price_per_piece is not None or data.total_price is not None,
+        "quantity": data.quantity is not None,
+        "delivery": data.delivery_days is not None,
+        "warranty": data.warranty_months is not None,
+    }
+    confidence = sum((weight for field, weight in _WEIGHTS.items() if found[field]), 0.0)
+
+    amounts = {_amount(m) for m in _MONEY_RE.finditer(text)}
+    if amounts - explained or unit_prices or totals or len(quantities) > 1:
+        # Leftover sets hold conflicting values: more than one unit price, total or quantity
+        confidence *= 0.3
+    if _HEDGE_RE.search(text):
+        confidence *= 0.5
+    if data.price_per_piece is not None and data.total_price is not None and data.quantity:
+        expected = data.price_per_piece * data.quantity
+        if abs(expected - data.total_price) > max(1.0, 0.01 * data.total_price):
+            confidence *= 0.3
+    return data, round(confidence, 3)
+
+
+def extract_confident_vendor_quote(text: str) -> Optional[dict]:
+    """The quote's fields when confidence reaches RULE_EXTRACTOR_MIN_CONFIDENCE, else None."""
+    data, confidence = extract_vendor_quote(text)
+    if confidence < RULE_EXTRACTOR_MIN_CONFIDENCE:
+        return None
+    return data.model_dump()
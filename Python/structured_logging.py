@@ -0,0 +1,138 @@
+"""
+Structured, non-blocking logging for the consumers.
+
+Log calls only put the record on an in-memory queue (QueueHandler); a
+background QueueListener thread formats it and writes it to stderr, so a
+slow stdout/pipe never stalls message processing. Every record carries the
+messageId of the message being processed (see message_context), and is
+written as one JSON object per line (LOG_FORMAT=json) or as plain text.
+
+Use %-style arguments (logger.info("... %s", value)) so messages are only
+formatted when the level is enabled, and wrap expensive payload dumps in
+LazyJson so they are only serialized at DEBUG.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Any, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" (one object per line) or "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+_message_id: contextvars.ContextVar = contextvars.ContextVar("message_id", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_configure_lock = threading.Lock()
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "message_id", "asctime"}
+
+
+class LazyJson:
+    """Serializes `value` only when the log record is actually formatted."""
+
+    def __init__(self, value: Any, limit: int = 2000, indent: Optional[int] = None):
+        self.value = value
+        self.limit = limit
+        self.indent = indent
+
+    def __str__(self) -> str:
+        try:
+            text = json.dumps(self.value, indent=self.indent, default=str)
+        except (TypeError, ValueError):
+            text = repr(self.value)
+        return text if len(text) <= self.limit else text[:self.limit] + "..."
+
+
+class CorrelationFilter(logging.Filter):
+    """Stamps each record with the messageId of the current message_context."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "message_id"):
+            record.message_id = _message_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "message_id", None):
+            entry["message_id"] = record.message_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s [%(message_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not getattr(record, "message_id", None):
+            record.message_id = "-"
+        return super().format(record)
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> logging.handlers.QueueListener:
+    """Install the queue-backed handler on the root logger (once per process)."""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return _listener
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+        log_queue = queue.SimpleQueue()
+        # The caller only merges msg % args; JSON formatting and I/O happen on the listener thread
+        handler = logging.handlers.QueueHandler(log_queue)
+        handler.addFilter(CorrelationFilter())
+
+        root = logging.getLogger()
+        root.handlers = [handler]
+        root.setLevel(level)
+        # pika logs every reconnect attempt at INFO
+        logging.getLogger("pika").setLevel(max(logging.WARNING, root.level))
+
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        return _listener
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
+
+
+def set_message_id(message_id: Optional[str]):
+    """Set the messageId for the rest of the current thread/asyncio task."""
+    _message_id.set(message_id)
+
+
+@contextmanager
+def message_context(message_id: Optional[str]):
+    """Attach message_id to every record logged inside the block (thread/task local)."""
+    token = _message_id.set(message_id)
+    try:
+        yield
+    finally:
+        _message_id.reset(token)
@@ -0,0 +1,70 @@
+"""
+Structured output for Ollama extractions.
+
+Builds JSON schemas from the pydantic models in models.py and sends them as
+the `format` of a chat request, so Ollama constrains decoding to JSON of that
+shape. Such responses are validated with model_validate_json directly instead
+of being searched for JSON with extract_json_from_response.
+"""
+import os
+from typing import Any, Dict, Iterable, Type
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from models import ExtractedData, RFPExtraction
+
+load_dotenv()
+
+# Send extraction schemas as Ollama's `format` (needs Ollama >= 0.5)
+OLLAMA_STRUCTURED_OUTPUT = os.getenv("OLLAMA_STRUCTURED_OUTPUT", "false").lower() == "true"
+
+# ExtractedData fields computed after extraction; the model is not asked for them
+DERIVED_VENDOR_FIELDS = ("price", "delivery_days", "warranty_months")
+
+
+def _inline_refs(node: Any, defs: Dict[str, Any]) -> Any:
+    if isinstance(node, dict):
+        if "$ref" in node:
+            return _inline_refs(defs[node["$ref"].rsplit("/", 1)[-1]], defs)
+        return {key: _inline_refs(value, defs) for key, value in node.items() if key != "$defs"}
+    if isinstance(node, list):
+        return [_inline_refs(value, defs) for value in node]
+    return node
+
+
+def json_schema_for(model: Type[BaseModel], exclude: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Self-contained JSON schema of `model` for Ollama's `format` parameter.
+
+    Nested models are inlined, excluded fields are dropped, and every
+    remaining field is required so the model always emits each key (null
+    when the text doesn't state it).
+    """
+    schema = model.model_json_schema()
+    schema = _inline_refs(schema, schema.get("$defs", {}))
+    for name in exclude:
+        schema["properties"].pop(name, None)
+    schema["required"] = list(schema["properties"])
+    return schema
+
+
+CLIENT_SCHEMA = json_schema_for(RFPExtraction)
+VENDOR_SCHEMA = json_schema_for(ExtractedData, exclude=DERIVED_VENDOR_FIELDS)
+
+
+def extraction_format(task: str) -> Dict[str, Any]:
+    """The `format` to send for an extraction task, or None in free-form mode."""
+    if not OLLAMA_STRUCTURED_OUTPUT:
+        return None
+    return CLIENT_SCHEMA if task == "client" else VENDOR_SCHEMA
+
+
+def parse_structured(task: str, response_text: str) -> Dict[str, Any]:
+    """Validate a constrained response; raises ValueError if it doesn't match the schema."""
+    model = RFPExtraction if task == "client" else ExtractedData
+    data = model.model_validate_json(response_text).model_dump()
+    if task != "client":
+        for name in DERIVED_VENDOR_FIELDS:
+            data.pop(name, None)
+    return data
@@ -0,0 +1,58 @@
+import pytest
+
+from duration_normalizer import delivery_days, warranty_months
+
+
+@pytest.mark.parametrize("text, days", [
+    ("10 days", 10.0),
+    ("10-day", 10.0),
+    ("10d", 10.0),
+    ("48h", 2.0),
+    ("2-3 weeks", 21.0),
+    ("two to three weeks", 21.0),
+    ("twenty-one days", 21.0),
+    ("twenty one days", 21.0),
+    ("within Twenty - Five business days", 35.0),
+    ("twenty to thirty days", 30.0),
+    ("twenty-one to twenty-eight days", 28.0),
+    ("two-three weeks", 21.0),
+    ("forty days", 40.0),
+    ("a week", 7.0),
+    ("within 10 business days", 14.0),
+    ("immediately", 0.0),
+    ("next day", 1.0),
+    ("10", 10.0),
+    (10, 10.0),
+    ("None specified", None),
+])
+def test_delivery_days(text, days):
+    assert delivery_days(text) == days
+
+
+@pytest.mark.parametrize("text, months", [
+    ("1 year", 12.0),
+    ("two-year", 24.0),
+    ("12mo", 12.0),
+    ("half a year", 6.0),
+    ("thirty-six months", 36.0),
+    ("2-3 years", 24.0),
+    ("lifetime", 120.0),
+    ("12", 12.0),
+    (18, 18.0),
+])
+def test_warranty_months(text, months):
+    assert warranty_months(text) == months
+
+
+@pytest.mark.parametrize("text, days", [
+    # "and" / "any" are not "an" + a one-letter unit
+    ("Free shipping and delivery in 10 days", 10.0),
+    ("Ships to any site within 5 days", 5.0),
+    ("any day now", None),
+])
+def test_words_are_not_durations(text, days):
+    assert delivery_days(text) == days
+
+
+def test_warranty_after_words_containing_word_numbers():
+    assert warranty_months("parts and labor, 2 years") == 24.0
@@ -0,0 +1,91 @@
+import pytest
+
+from evaluation_state import EvaluationStateStore
+
+
+def proposal(vendor_id, total_price, delivery_days=10, warranty_months=12):
+    return {
+        "_id": vendor_id, "vendor_id": vendor_id,
+        "extracted": {"total_price": total_price, "quantity": 100, "delivery_days": delivery_days, "warranty_months": warranty_months},
+    }
+
+
+BASE = [proposal("a", 9000), proposal("b", 8000, delivery_days=20), proposal("c", 9500, warranty_months=36)]
+
+
+@pytest.fixture
+def store():
+    store = EvaluationStateStore(":memory:")
+    yield store
+    store.close()
+
+
+def evaluated(store, proposals, result=None):
+    plan = store.plan("rfp-1", proposals)
+    store.save(plan, result if result is not None else plan.scored)
+    return plan
+
+
+def test_first_evaluation_ranks_everything(store):
+    plan = store.plan("rfp-1", BASE)
+    assert plan.previous is None and plan.changed and plan.ranking_changed
+    assert plan.delta == 3
+    assert plan.reuse(llm_mode=True, llm_reasoning=False) is None
+    assert plan.reuse(llm_mode=False, llm_reasoning=True) is None
+    assert plan.reuse(llm_mode=False, llm_reasoning=False) is plan.scored
+
+
+def test_unchanged_proposals_reuse_the_published_result(store):
+    published = {"overall_best_top3": [], "note": "from the model"}
+    evaluated(store, BASE, published)
+    plan = store.plan("rfp-1", [dict(p) for p in BASE])
+    assert not plan.changed and plan.delta == 0
+    for llm_mode, llm_reasoning in ((True, False), (False, True), (False, False)):
+        assert plan.reuse(llm_mode, llm_reasoning) == published
+
+
+def test_new_proposal_outside_the_top_k_keeps_the_ranking(store):
+    first = evaluated(store, BASE)
+    for entries in first.scored.values():
+        if isinstance(entries, list):
+            for entry in entries:
+                entry["reasoning"] = "written by the model"
+    store.save(first, first.scored)
+
+    # Worst in every category without widening any range, so nobody else's score moves
+    worse = proposal("d", 9500, delivery_days=20, warranty_months=12)
+    plan = store.plan("rfp-1", BASE + [worse])
+    assert plan.changed and not plan.ranking_changed
+    assert plan.delta == 1
+
+    reused = plan.reuse(llm_mode=True, llm_reasoning=False)
+    assert reused["total_proposals_evaluated"] == 4
+    assert reused["best_price_top3"] == first.scored["best_price_top3"]
+    # Deterministic ranking with LLM reasoning: fresh scores, reasoning carried over
+    result = plan.reuse(llm_mode=False, llm_reasoning=True)
+    assert result is plan.scored
+    assert all(e["reasoning"] == "written by the model" for e in result["best_price_top3"])
+
+
+def test_new_proposal_in_the_top_k_needs_a_new_ranking(store):
+    evaluated(store, BASE)
+    better = proposal("d", 5000, delivery_days=5, warranty_months=48)
+    plan = store.plan("rfp-1", BASE + [better])
+    assert plan.changed and plan.ranking_changed
+    assert plan.reuse(llm_mode=True, llm_reasoning=False) is None
+    assert plan.reuse(llm_mode=False, llm_reasoning=True) is None
+    assert plan.reuse(llm_mode=False, llm_reasoning=False)["best_price_top3"][0]["proposal"]["vendor_id"] == "d"
+
+
+def test_changed_proposal_is_re_extracted(store):
+    evaluated(store, BASE)
+    cheaper = proposal("c", 1000, warranty_months=36)
+    plan = store.plan("rfp-1", BASE[:2] + [cheaper])
+    assert plan.delta == 1 and plan.changed and plan.ranking_changed
+    assert plan.scored["best_price_top3"][0]["proposal"]["vendor_id"] == "c"
+
+
+def test_removed_proposal_counts_as_a_change(store):
+    evaluated(store, BASE)
+    plan = store.plan("rfp-1", BASE[:2])
+    assert plan.changed and plan.delta == 0
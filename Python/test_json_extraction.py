@@ -0,0 +1,28 @@
+import time
+
+from ai_service import extract_json_from_response, find_first_json_value
+
+
+def test_json_after_think_block():
+    text = '<think>fields {title} and {budget}</think>\n{"title": "Laptops", "items": []}'
+    assert extract_json_from_response(text) == {"title": "Laptops", "items": []}
+
+
+def test_valid_span_nested_in_invalid_one():
+    assert find_first_json_value('{"a": {"b": 1} x}') == (True, {"b": 1})
+
+
+def test_invalid_span_then_valid_one():
+    assert find_first_json_value('{x} [1, 2]') == (True, [1, 2])
+
+
+def test_nested_invalid_spans_are_decoded_once():
+    def elapsed(depth):
+        text = '{"a": ' * depth + "x" + "}" * depth + ' {"ok": 1}'
+        start = time.perf_counter()
+        assert find_first_json_value(text) == (True, {"ok": 1})
+        return time.perf_counter() - start
+
+    elapsed(100)
+    # Quadratic rescanning would make 8x the depth ~64x slower
+    assert elapsed(8000) < 30 * max(elapsed(1000), 1e-3)
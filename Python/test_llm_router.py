@@ -0,0 +1,145 @@
+import asyncio
+
+import httpx
+import pytest
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+import ai_service
+import async_consumer
+from llm_router import LLMRouter, NoEndpointAvailable, is_endpoint_failure
+from resilience import CircuitBreaker
+
+URLS = ["http://a/api/chat", "http://b/api/chat"]
+
+
+def make_router():
+    router = LLMRouter(URLS, max_concurrency=2, health_interval=0)
+    for endpoint in router.endpoints:
+        endpoint.circuit = CircuitBreaker(failure_threshold=1, reset_timeout=60, name=endpoint.url)
+    return router
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def failing_first(error):
+    calls = []
+
+    def send(url):
+        calls.append(url)
+        if len(calls) == 1:
+            raise error
+        return url
+
+    return send, calls
+
+
+@pytest.mark.parametrize("error", [
+    requests.ConnectionError("refused"),
+    requests.ConnectTimeout("connect timed out"),
+    http_error(500),
+    http_error(503),
+])
+def test_endpoint_failures_fail_over(error):
+    router = make_router()
+    send, calls = failing_first(error)
+    assert router.call(send) == URLS[1]
+    assert calls == URLS
+    assert router.endpoints[0].circuit.state == "open"
+    assert router.endpoints[1].circuit.state == "closed"
+
+
+@pytest.mark.parametrize("error", [
+    http_error(400),
+    http_error(404),
+    requests.ReadTimeout("read timed out"),
+    # What requests raises when a streamed body stops arriving
+    requests.ConnectionError(ReadTimeoutError(None, URLS[0], "Read timed out.")),
+])
+def test_request_errors_are_raised_without_failover(error):
+    router = make_router()
+    send, calls = failing_first(error)
+    with pytest.raises(type(error)):
+        router.call(send)
+    assert calls == URLS[:1]
+    assert all(e.circuit.state == "closed" and e.outstanding == 0 for e in router.endpoints)
+
+
+def test_all_endpoints_failing_raises_no_endpoint_available():
+    router = make_router()
+
+    def send(url):
+        raise http_error(502)
+
+    with pytest.raises(NoEndpointAvailable):
+        router.call(send)
+    assert all(e.circuit.state == "open" for e in router.endpoints)
+
+
+def test_least_outstanding_endpoint_is_chosen():
+    router = make_router()
+    busy = router.acquire()
+    assert router.call(lambda url: url) != busy.url
+    router.release(busy)
+
+
+def test_classifiers():
+    assert is_endpoint_failure(http_error(500))
+    assert not is_endpoint_failure(http_error(422))
+    assert not is_endpoint_failure(ValueError("not a transport error"))
+    request = httpx.Request("POST", URLS[0])
+    assert async_consumer.is_endpoint_failure(httpx.ConnectError("refused", request=request))
+    assert async_consumer.is_endpoint_failure(
+        httpx.HTTPStatusError("bad gateway", request=request, response=httpx.Response(502, request=request))
+    )
+    assert not async_consumer.is_endpoint_failure(
+        httpx.HTTPStatusError("not found", request=request, response=httpx.Response(404, request=request))
+    )
+    assert not async_consumer.is_endpoint_failure(httpx.ReadTimeout("slow", request=request))
+
+
+def test_async_failover_uses_the_same_rules():
+    router = make_router()
+    request = httpx.Request("POST", URLS[0])
+    calls = []
+
+    async def send(url):
+        calls.append(url)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        if len(calls) == 2:
+            return url
+        raise httpx.HTTPStatusError("not found", request=request, response=httpx.Response(404, request=request))
+
+    assert asyncio.run(router.call_async(send, async_consumer.is_endpoint_failure)) == URLS[1]
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(router.call_async(send, async_consumer.is_endpoint_failure))
+    assert calls == [URLS[0], URLS[1], URLS[1]]
+    assert router.endpoints[1].circuit.state == "closed"
+
+
+class FakeSession:
+    def __init__(self, error):
+        self.error = error
+
+    def post(self, url, **kwargs):
+        raise self.error
+
+
+@pytest.mark.parametrize("error, expected", [
+    (http_error(404), ValueError),
+    (requests.ReadTimeout("read timed out"), TimeoutError),
+    (requests.ConnectionError("refused"), ConnectionError),
+])
+def test_call_ollama_error_types(monkeypatch, error, expected):
+    router = make_router()
+    monkeypatch.setattr(ai_service, "get_router", lambda: router)
+    monkeypatch.setattr(ai_service, "get_http_session", lambda: FakeSession(error))
+    monkeypatch.setattr(ai_service, "ollama_circuit", CircuitBreaker(failure_threshold=1, name="all"))
+    with pytest.raises(expected):
+        ai_service.call_ollama("prompt", stream=False)
+    assert ai_service.ollama_circuit.state == ("open" if expected is ConnectionError else "closed")
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+import ai_service
+import async_consumer
+
+
+def fake_ranking(proposals):
+    """What a model ranking looks like: every category holds the first three proposals."""
+    top = [{"proposal": p, "reasoning": ""} for p in proposals[:3]]
+    return {
+        "best_price_top3": top, "best_warranty_top3": top, "best_delivery_top3": top,
+        "best_quantity_top3": top, "overall_best_top3": top,
+        "total_proposals_evaluated": len(proposals),
+    }
+
+
+def proposals(count):
+    return [{"_id": str(i), "extracted": {"total_price": 100 + i}} for i in range(count)]
+
+
+@pytest.fixture
+def ranked_calls(monkeypatch):
+    calls = []
+
+    def rank(shard):
+        calls.append(len(shard))
+        return fake_ranking(shard)
+
+    monkeypatch.setattr(ai_service, "evaluation_shard_size", lambda _: 4)
+    monkeypatch.setattr(ai_service, "rank_with_llm", rank)
+    monkeypatch.setattr(async_consumer, "evaluation_shard_size", lambda _: 4)
+    return calls
+
+
+@pytest.mark.parametrize("count", [5, 6, 7, 9, 13, 40])
+def test_tournament_terminates(ranked_calls, count):
+    result = ai_service.evaluate_proposals_map_reduce(proposals(count))
+    assert result["total_proposals_evaluated"] == count
+    # Every round halves the field; the last call ranks what fits in one prompt
+    assert len(ranked_calls) < count
+    assert ranked_calls[-1] <= 4
+
+
+def test_round_without_progress_stops():
+    candidates = proposals(5)
+    singles = [[p] for p in candidates]
+    # One-proposal shards each forward their proposal: the field didn't shrink
+    assert ai_service.round_winners(candidates, singles, [fake_ranking(s) for s in singles]) is None
+    # Rankings that place nobody would leave nothing to rank
+    assert ai_service.round_winners(candidates, [candidates], [fake_ranking([])]) is None
+    shards = [candidates[0::2], candidates[1::2]]
+    assert len(ai_service.round_winners(candidates, shards, [fake_ranking(s) for s in shards])) == 2
+
+
+def test_async_tournament_terminates(ranked_calls):
+    calls = []
+
+    class Pipeline(async_consumer.AsyncPipeline):
+        def __init__(self):
+            pass
+
+        async def rank_with_llm(self, shard):
+            calls.append(len(shard))
+            return fake_ranking(shard)
+
+    result = asyncio.run(Pipeline().evaluate_map_reduce(proposals(6)))
+    assert result["total_proposals_evaluated"] == 6
+    assert calls == [3, 3, 2]
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+import model_tiers
+from metrics import TIER_REQUESTS
+from model_tiers import run_local_tiers, run_tiers, run_tiers_async, tiers_for
+
+VALID = {"price_per_piece": 45.0, "quantity": 200}
+
+
+@pytest.fixture
+def counts():
+    """TIER_REQUESTS increments of this test, by (tier, outcome)."""
+    keys = [(tier, outcome) for tier in ("small", "large", "local") for outcome in ("served", "escalated", "failed")]
+    before = {key: TIER_REQUESTS.value(task="vendor", tier=key[0], outcome=key[1]) for key in keys}
+
+    def delta():
+        after = {key: TIER_REQUESTS.value(task="vendor", tier=key[0], outcome=key[1]) for key in keys}
+        return {key: after[key] - before[key] for key in keys if after[key] != before[key]}
+
+    return delta
+
+
+@pytest.fixture
+def local_tier(monkeypatch):
+    """A "local" vendor extractor that answers only texts starting with "simple"."""
+    monkeypatch.setitem(model_tiers._EXTRACTORS, "local", ("vendor", lambda text: VALID if text.startswith("simple") else None))
+
+
+def answers(by_tier):
+    calls = []
+
+    def attempt(tier):
+        calls.append(tier)
+        answer = by_tier[tier]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    return attempt, calls
+
+
+def test_first_valid_answer_is_served(counts):
+    attempt, calls = answers({"small": VALID, "large": VALID})
+    assert run_tiers("vendor", ["small", "large"], attempt) == VALID
+    assert calls == ["small"]
+    assert counts() == {("small", "served"): 1}
+
+
+@pytest.mark.parametrize("bad_answer", [
+    ValueError("unparseable"),
+    ["not", "an", "object"],
+    {"price_per_piece": "not a number"},
+    {"price_per_piece": None, "terms": "Net 30"},
+])
+def test_invalid_answers_escalate(counts, bad_answer):
+    attempt, calls = answers({"small": bad_answer, "large": VALID})
+    assert run_tiers("vendor", ["small", "large"], attempt) == VALID
+    assert calls == ["small", "large"]
+    assert counts() == {("small", "escalated"): 1, ("large", "served"): 1}
+
+
+def test_last_tier_failure_is_the_request_failure(counts):
+    attempt, _ = answers({"small": ValueError("bad"), "large": ValueError("still bad")})
+    with pytest.raises(ValueError, match="still bad"):
+        run_tiers("vendor", ["small", "large"], attempt)
+    assert counts() == {("small", "escalated"): 1, ("large", "failed"): 1}
+
+
+def test_connection_errors_are_not_escalated(counts):
+    attempt, calls = answers({"small": ConnectionError("down"), "large": VALID})
+    with pytest.raises(ConnectionError):
+        run_tiers("vendor", ["small", "large"], attempt)
+    assert calls == ["small"]
+    assert counts() == {}
+
+
+def test_local_tier_answers_without_a_model_call(counts, local_tier):
+    attempt, calls = answers({"large": VALID})
+    assert run_tiers("vendor", ["local", "large"], attempt, text="simple quote") == VALID
+    assert calls == []
+    assert run_tiers("vendor", ["local", "large"], attempt, text="complicated quote") == VALID
+    assert calls == ["large"]
+    assert counts() == {("local", "served"): 1, ("local", "escalated"): 1, ("large", "served"): 1}
+
+
+def test_async_tiers_escalate_the_same_way(counts):
+    async def attempt(tier):
+        if tier == "small":
+            raise ValueError("unparseable")
+        return VALID
+
+    assert asyncio.run(run_tiers_async("vendor", ["small", "large"], attempt)) == VALID
+    assert counts() == {("small", "escalated"): 1, ("large", "served"): 1}
+
+
+def test_tier_configuration(monkeypatch, local_tier):
+    monkeypatch.setitem(model_tiers._DEFAULT_TIERS, "vendor", ["local"])
+    monkeypatch.delenv("MODEL_TIERS_VENDOR", raising=False)
+    assert tiers_for("vendor", "default-model") == ["local", "default-model"]
+    assert model_tiers.model_tiers("vendor", "default-model") == ["default-model"]
+    assert run_local_tiers("vendor", "simple quote", "default-model") == VALID
+    assert run_local_tiers("vendor", "complicated quote", "default-model") is None
+
+    monkeypatch.setenv("MODEL_TIERS_VENDOR", " small, large ,")
+    assert tiers_for("vendor", "default-model") == ["small", "large"]
+    assert run_local_tiers("vendor", "simple quote", "default-model") is None
@@ -0,0 +1,136 @@
+import json
+import types
+
+import pytest
+
+import proposal_evaluator
+from proposal_evaluator import EvaluationDebouncer, merge_evaluation_requests
+
+
+class FakeConnection:
+    """pika.BlockingConnection timers, fired by the test."""
+
+    def __init__(self):
+        self.timers = {}
+        self.delays = []
+        self._next = 0
+
+    def call_later(self, delay, callback):
+        self._next += 1
+        self.timers[self._next] = callback
+        self.delays.append(delay)
+        return self._next
+
+    def remove_timeout(self, timer):
+        del self.timers[timer]
+
+    def fire(self):
+        timers, self.timers = self.timers, {}
+        for callback in timers.values():
+            callback()
+
+
+class FakeChannel:
+    def __init__(self):
+        self.acked = []
+        self.nacked = []
+        self.connection = types.SimpleNamespace(sleep=lambda seconds: None)
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag, multiple, requeue):
+        self.nacked.append(delivery_tag)
+
+
+def trigger(rfp_id, *vendor_ids, **fields):
+    proposals = [{"_id": v, "vendor_id": v, "extracted": {"total_price": 100}} for v in vendor_ids]
+    return {"rfp_id": rfp_id, "proposals": proposals, "client_email": "client@example.com", **fields}
+
+
+@pytest.fixture
+def evaluations(monkeypatch):
+    evaluations = []
+
+    def evaluate_rfp(rfp_id, proposals):
+        evaluations.append((rfp_id, sorted(p["_id"] for p in proposals)))
+        return {"overall_best_top3": []}
+
+    monkeypatch.setattr(proposal_evaluator, "evaluate_rfp", evaluate_rfp)
+    monkeypatch.setattr(proposal_evaluator, "publish_to_queue", lambda queue, message: True)
+    monkeypatch.setattr(proposal_evaluator, "emit", lambda *args, **kwargs: None)
+    monkeypatch.setattr(proposal_evaluator, "observe_queue_wait", lambda properties: None)
+    return evaluations
+
+
+def deliver(debouncer, channel, tag, message):
+    properties = types.SimpleNamespace(headers=None)
+    debouncer.on_message(channel, types.SimpleNamespace(delivery_tag=tag), properties, json.dumps(message).encode())
+
+
+def test_merge_keeps_latest_fields_and_union_of_proposals():
+    first = trigger("rfp-1", "a", "b", trigger="manual", client_email="old@example.com")
+    second = trigger("rfp-1", "b", "c", trigger="auto")
+    second["proposals"][0]["extracted"] = {"total_price": 90}
+    merged = merge_evaluation_requests([first, second])
+    assert merged["client_email"] == "client@example.com"
+    assert [p["_id"] for p in merged["proposals"]] == ["a", "b", "c"]
+    assert merged["proposals"][1]["extracted"] == {"total_price": 90}
+    # A manual trigger anywhere in the burst keeps the evaluation manual
+    assert merged["trigger"] == "manual"
+
+
+def test_burst_becomes_one_evaluation_that_acks_every_delivery(evaluations):
+    connection, channel = FakeConnection(), FakeChannel()
+    debouncer = EvaluationDebouncer(connection, window_ms=200, max_wait_ms=5000)
+    deliver(debouncer, channel, 1, trigger("rfp-1", "a"))
+    deliver(debouncer, channel, 2, trigger("rfp-2", "x"))
+    deliver(debouncer, channel, 3, trigger("rfp-1", "a", "b"))
+    deliver(debouncer, channel, 4, trigger("rfp-1", "c"))
+
+    # Every new trigger restarts its RFP's timer
+    assert len(connection.timers) == 2
+    assert evaluations == [] and channel.acked == []
+
+    connection.fire()
+    assert sorted(evaluations) == [("rfp-1", ["a", "b", "c"]), ("rfp-2", ["x"])]
+    assert sorted(channel.acked) == [1, 2, 3, 4]
+    assert not debouncer.pending and not debouncer.timers
+
+
+def test_burst_is_not_postponed_past_max_wait(evaluations, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(proposal_evaluator.time, "monotonic", lambda: now[0])
+    connection, channel = FakeConnection(), FakeChannel()
+    debouncer = EvaluationDebouncer(connection, window_ms=200, max_wait_ms=500)
+    for tag in range(4):
+        deliver(debouncer, channel, tag, trigger("rfp-1", f"v{tag}"))
+        now[0] += 0.15
+    assert connection.delays == pytest.approx([0.2, 0.2, 0.2, 0.05])
+
+
+def test_failed_burst_retries_and_acks_every_delivery(evaluations, monkeypatch):
+    retried = []
+    monkeypatch.setattr(proposal_evaluator, "publish_to_queue", lambda queue, message: False)
+    monkeypatch.setattr(
+        proposal_evaluator, "retry_or_dead_letter",
+        lambda queue, message, headers, error: retried.append(message) or True
+    )
+    connection, channel = FakeConnection(), FakeChannel()
+    debouncer = EvaluationDebouncer(connection, window_ms=200)
+    deliver(debouncer, channel, 1, trigger("rfp-1", "a"))
+    deliver(debouncer, channel, 2, trigger("rfp-1", "b"))
+    connection.fire()
+
+    assert len(retried) == 1
+    assert [p["_id"] for p in retried[0]["proposals"]] == ["a", "b"]
+    assert channel.acked == [1, 2]
+
+
+def test_triggers_without_rfp_id_are_evaluated_at_once(evaluations):
+    connection, channel = FakeConnection(), FakeChannel()
+    debouncer = EvaluationDebouncer(connection, window_ms=200)
+    deliver(debouncer, channel, 1, trigger(None, "a"))
+    assert connection.timers == {}
+    assert evaluations == [(None, ["a"])]
+    assert channel.acked == [1]
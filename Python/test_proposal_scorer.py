@@ -0,0 +1,81 @@
+import numpy as np
+
+from proposal_scorer import extract_features, score_proposals, top_k_indices
+
+
+def proposal(vendor_id, **extracted):
+    return {"_id": vendor_id, "vendor_id": vendor_id, "extracted": extracted}
+
+
+def ids(entries):
+    return [entry["proposal"]["vendor_id"] for entry in entries]
+
+
+def test_categories_are_ordered_best_first():
+    proposals = [
+        proposal("a", total_price=9000, quantity=200, delivery_days=30, warranty_months=12),
+        proposal("b", total_price=8000, quantity=200, delivery_days=10, warranty_months=6),
+        proposal("c", total_price=9500, quantity=200, delivery_days=20, warranty_months=36),
+    ]
+    result = score_proposals(proposals)
+    assert ids(result["best_price_top3"]) == ["b", "a", "c"]
+    assert ids(result["best_delivery_top3"]) == ["b", "c", "a"]
+    assert ids(result["best_warranty_top3"]) == ["c", "a", "b"]
+    assert result["best_price_top3"][0]["scores"]["price_score"] == 10.0
+    assert result["best_price_top3"][2]["scores"]["price_score"] == 0.0
+    assert result["total_proposals_evaluated"] == 3
+
+
+def test_ties_go_to_the_better_overall_score_then_the_earlier_proposal():
+    proposals = [
+        proposal("a", total_price=5000, warranty_months=12),
+        proposal("b", total_price=5000, warranty_months=24),
+        proposal("c", total_price=5000, warranty_months=12),
+    ]
+    assert ids(score_proposals(proposals)["best_price_top3"]) == ["b", "a", "c"]
+
+    scores = np.array([1.0, 2.0, 2.0, 2.0])
+    assert top_k_indices(scores, 2, np.ones(4, dtype=bool), [{}] * 4) == [1, 2]
+
+
+def test_one_entry_per_vendor():
+    proposals = [proposal("a", total_price=100), proposal("a", total_price=200), proposal("b", total_price=300)]
+    proposals[1]["_id"] = "a2"
+    assert ids(score_proposals(proposals)["best_price_top3"]) == ["a", "b"]
+
+
+def test_unit_prices_are_not_ranked_against_totals():
+    proposals = [
+        proposal("unit-only", price_per_piece=45),
+        proposal("total", total_price=9000, quantity=200),
+        proposal("cheaper-total", total_price=8000, quantity=200),
+    ]
+    result = score_proposals(proposals)
+    # $45 per unit is the most expensive unit price here ($45, $45, $40), not the cheapest "price"
+    assert ids(result["best_price_top3"]) == ["cheaper-total", "total", "unit-only"]
+    assert result["best_price_top3"][2]["scores"]["price_score"] == 0.0
+    assert ids(result["overall_best_top3"])[0] == "cheaper-total"
+    assert "per unit" in result["best_price_top3"][2]["reasoning"]
+
+
+def test_lone_unit_price_among_totals_counts_as_no_price():
+    proposals = [
+        proposal("unit-only", price_per_piece=45),
+        proposal("total", total_price=9000),
+        proposal("cheaper-total", total_price=8000),
+    ]
+    result = score_proposals(proposals)
+    assert ids(result["best_price_top3"])[:2] == ["cheaper-total", "total"]
+    assert result["best_price_top3"][2]["scores"]["price_score"] == 0.0
+    assert "no price stated" in result["best_price_top3"][2]["reasoning"]
+
+
+def test_unit_prices_alone_are_compared_with_each_other():
+    proposals = [proposal("a", price_per_piece=50), proposal("b", price_per_piece=45)]
+    assert ids(score_proposals(proposals)["best_price_top3"]) == ["b", "a"]
+
+
+def test_missing_prices_are_derived_from_quantity():
+    features = extract_features([proposal("a", price_per_piece=45, quantity=200), proposal("b", total_price=900, quantity=20)])
+    assert features["total_price"].tolist() == [9000.0, 900.0]
+    assert features["price_per_piece"].tolist() == [45.0, 45.0]
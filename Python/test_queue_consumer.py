@@ -0,0 +1,35 @@
+import json
+
+import queue_consumer
+
+
+class FakeChannel:
+    def __init__(self):
+        self.acked = []
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+
+class FakeMethod:
+    def __init__(self, delivery_tag):
+        self.delivery_tag = delivery_tag
+
+
+def test_batch_fallback_records_queue_wait_once(monkeypatch):
+    waits, stages = [], []
+    monkeypatch.setattr(queue_consumer, "observe_queue_wait", lambda properties: waits.append(properties) or 0.01)
+    monkeypatch.setattr(queue_consumer, "emit", lambda stage, *args, **kwargs: stages.append(stage))
+    # The batch answers nothing, so every message falls back to process_message
+    monkeypatch.setattr(queue_consumer, "process_extraction_batch", lambda origin, documents: {})
+    monkeypatch.setattr(queue_consumer, "replay_processed_message", lambda message_id: True)
+
+    messages = [{"origin": "vendor", "text": "quote", "messageId": str(i)} for i in range(3)]
+    channel = FakeChannel()
+    queue_consumer.process_message_batch(
+        channel, "vendor", [(FakeMethod(i), None, json.dumps(m).encode(), m) for i, m in enumerate(messages)]
+    )
+
+    assert channel.acked == [0, 1, 2]
+    assert len(waits) == 3
+    assert stages.count("queued") == 3
@@ -0,0 +1,178 @@
+import json
+import types
+
+import pytest
+import requests
+
+import ai_service
+import queue_consumer
+import resilience
+from llm_router import LLMRouter
+from resilience import (
+    CONNECTION_RETRY_COUNT_HEADER,
+    DEAD_LETTER_EXCHANGE,
+    ERROR_HEADER,
+    RETRY_COUNT_HEADER,
+    RETRY_EXCHANGE,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_MAX_CONNECTION_ATTEMPTS,
+    CircuitBreaker,
+    CircuitOpenError,
+    PermanentError,
+    next_retry,
+)
+
+
+def test_ordinary_errors_use_up_attempts():
+    headers = None
+    for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+        next_attempt, headers = next_retry(headers, ValueError("bad answer"))
+        assert next_attempt == attempt
+        assert headers[RETRY_COUNT_HEADER] == attempt
+    assert next_retry(headers, ValueError("bad answer"))[0] is None
+    assert headers[ERROR_HEADER] == "ValueError: bad answer"
+
+
+def test_permanent_errors_are_dead_lettered_at_once():
+    assert next_retry(None, PermanentError("invalid JSON"))[0] is None
+
+
+def test_connection_errors_have_their_own_budget():
+    headers = {"x-other": "kept", RETRY_COUNT_HEADER: 1}
+    attempts = []
+    while True:
+        attempt, headers = next_retry(headers, ConnectionError("model server down"))
+        if attempt is None:
+            break
+        attempts.append(attempt)
+        assert len(attempts) <= RETRY_MAX_CONNECTION_ATTEMPTS
+    assert len(attempts) == RETRY_MAX_CONNECTION_ATTEMPTS
+    # Backs off through the delay queues, but leaves the ordinary attempts alone
+    assert attempts[0] == 1 and attempts[-1] == RETRY_MAX_ATTEMPTS
+    assert headers[RETRY_COUNT_HEADER] == 1
+    assert headers[CONNECTION_RETRY_COUNT_HEADER] == RETRY_MAX_CONNECTION_ATTEMPTS
+    assert headers["x-other"] == "kept"
+
+
+def test_malformed_retry_headers_count_as_zero():
+    assert next_retry({RETRY_COUNT_HEADER: "many"}, ValueError("x"))[0] == 1
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    circuit = CircuitBreaker(failure_threshold=3, reset_timeout=10, max_reset_timeout=40)
+    circuit.record_failure()
+    circuit.record_failure()
+    circuit.record_success()
+    circuit.record_failure()
+    circuit.record_failure()
+    assert circuit.state == "closed"
+    circuit.record_failure()
+    assert circuit.state == "open"
+    with pytest.raises(CircuitOpenError):
+        circuit.before_call()
+    assert circuit.retry_after() == pytest.approx(10)
+
+
+def test_half_open_probe(clock):
+    circuit = CircuitBreaker(failure_threshold=1, reset_timeout=10, max_reset_timeout=25)
+    circuit.record_failure()
+    clock.now += 10
+    assert circuit.state == "half-open"
+    circuit.before_call()
+    # Only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        circuit.before_call()
+
+    # A failed probe doubles the wait, capped at max_reset_timeout
+    circuit.record_failure()
+    assert circuit.state == "open" and circuit.retry_after() == pytest.approx(20)
+    clock.now += 20
+    circuit.before_call()
+    circuit.record_failure()
+    assert circuit.retry_after() == pytest.approx(25)
+
+    clock.now += 25
+    circuit.before_call()
+    circuit.record_success()
+    assert circuit.state == "closed" and circuit.retry_after() == 0
+    # Closing resets the backoff
+    circuit.record_failure()
+    assert circuit.retry_after() == pytest.approx(10)
+
+
+class FakePublisher:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, queue_name, message, headers=None, exchange="", expiration=None):
+        self.published.append((exchange, queue_name, message, headers))
+        return True
+
+
+class FakeChannel:
+    def __init__(self):
+        self.acked = []
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+
+class ServerErrorSession:
+    def __init__(self):
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        response = requests.Response()
+        response.status_code = 500
+        raise requests.HTTPError("500 Server Error", response=response)
+
+
+def test_message_that_always_gets_a_5xx_is_dead_lettered(monkeypatch):
+    publisher = FakePublisher()
+    session = ServerErrorSession()
+    router = LLMRouter(["http://a/api/chat", "http://b/api/chat"], max_concurrency=1, health_interval=0)
+    for endpoint in router.endpoints:
+        endpoint.circuit = CircuitBreaker(failure_threshold=1000, name=endpoint.url)
+    circuit = CircuitBreaker(failure_threshold=1000)
+    monkeypatch.delenv("MODEL_TIERS_CLIENT", raising=False)
+    monkeypatch.setattr(ai_service, "get_router", lambda: router)
+    monkeypatch.setattr(ai_service, "get_http_session", lambda: session)
+    monkeypatch.setattr(ai_service, "get_llm_cache", lambda: None)
+    monkeypatch.setattr(ai_service, "ollama_circuit", circuit)
+    monkeypatch.setattr(queue_consumer, "ollama_circuit", circuit)
+    monkeypatch.setattr(queue_consumer, "observe_queue_wait", lambda properties: None)
+    monkeypatch.setattr(queue_consumer, "replay_processed_message", lambda message_id: False)
+    monkeypatch.setattr(resilience, "get_publisher", lambda: publisher)
+    monkeypatch.setattr(resilience, "emit", lambda *args, **kwargs: None)
+
+    body = json.dumps({"origin": "client", "text": "We need 10 laptops", "messageId": "m-1"}).encode()
+    channel = FakeChannel()
+    headers = None
+    for delivery in range(RETRY_MAX_CONNECTION_ATTEMPTS + 2):
+        queue_consumer.process_message(channel, types.SimpleNamespace(delivery_tag=delivery), types.SimpleNamespace(headers=headers), body)
+        exchange, _, _, headers = publisher.published[-1]
+        if exchange == DEAD_LETTER_EXCHANGE:
+            break
+        assert exchange == RETRY_EXCHANGE
+
+    assert exchange == DEAD_LETTER_EXCHANGE
+    assert len(publisher.published) == RETRY_MAX_CONNECTION_ATTEMPTS + 1
+    assert len(channel.acked) == RETRY_MAX_CONNECTION_ATTEMPTS + 1
+    assert session.calls == 2 * (RETRY_MAX_CONNECTION_ATTEMPTS + 1)
+    assert headers[ERROR_HEADER].startswith("ConnectionError")
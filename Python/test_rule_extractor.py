@@ -0,0 +1,57 @@
+import pytest
+
+import ai_service
+import rule_extractor
+from rule_extractor import RULE_EXTRACTOR_MIN_CONFIDENCE, extract_confident_vendor_quote, extract_vendor_quote
+
+
+@pytest.mark.parametrize("text, delivery_time, days", [
+    ("$45 per unit, 200 units, delivery in 10 days, 1 year warranty", "10 days", 10),
+    # Words in front of the number must not be read as a duration ("and" ~ "a" day, "any" ~ "a" year)
+    ("$45 per unit, 200 units, delivery and installation within 10 days, 1 year warranty", "10 days", 10),
+    ("$45 per unit, 200 units. Ships to any site in 5 days, 1 year warranty", "5 days", 5),
+    ("Unit price: $1,200, qty 5, total: $6,000, ships within 2-3 weeks, 2-year warranty", "2-3 weeks", 21),
+])
+def test_simple_quotes(text, delivery_time, days):
+    data, confidence = extract_vendor_quote(text)
+    assert confidence == 1.0
+    assert data.delivery_time == delivery_time
+    assert data.delivery_days == days
+    assert data.warranty_months in (12, 24)
+    assert data.price_per_piece is not None and data.quantity is not None
+
+
+@pytest.mark.parametrize("text", [
+    # Two unit prices
+    "$45 per unit or $40 per unit for 500 units, delivery in 10 days, 1 year warranty",
+    # Total doesn't match unit price times quantity
+    "$45 per unit, 200 units, total $8,000, delivery in 10 days, 1 year warranty",
+    # A condition the patterns would drop
+    "$45 per unit, 200 units, delivery in 10 days, 1 year warranty, 10% discount if paid early",
+    # Too little to go on
+    "Thanks for the RFP, we will send our quote next week.",
+])
+def test_unclear_quotes_go_to_the_model(text):
+    _, confidence = extract_vendor_quote(text)
+    assert confidence < RULE_EXTRACTOR_MIN_CONFIDENCE
+    assert extract_confident_vendor_quote(text) is None
+
+
+def test_long_texts_are_not_rule_extracted():
+    text = "$45 per unit, 200 units, delivery in 10 days, 1 year warranty. " + "x" * rule_extractor.RULE_EXTRACTOR_MAX_CHARS
+    assert extract_vendor_quote(text)[1] == 0.0
+
+
+@pytest.mark.skipif(not rule_extractor.RULE_EXTRACTOR_ENABLED, reason="rules tier disabled")
+def test_rules_tier_answers_without_a_model_call(monkeypatch):
+    def no_model_call(*args, **kwargs):
+        raise AssertionError("model called")
+
+    monkeypatch.delenv("MODEL_TIERS_VENDOR", raising=False)
+    monkeypatch.setattr(ai_service, "get_llm_cache", lambda: None)
+    monkeypatch.setattr(ai_service, "call_ollama", no_model_call)
+    data = ai_service.process_vendor_proposal("$45 per unit, 200 units, delivery and installation within 10 days, 1 year warranty")
+    assert data["price_per_piece"] == 45
+    assert data["total_price"] == 9000
+    assert data["delivery_days"] == 10
+    assert data["warranty_months"] == 12
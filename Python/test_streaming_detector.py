@@ -0,0 +1,40 @@
+from ai_service import StreamingJsonDetector
+
+
+def feed_all(chunks):
+    detector = StreamingJsonDetector()
+    for chunk in chunks:
+        if detector.feed(chunk):
+            return True, detector.text
+    return False, detector.text
+
+
+def test_plain_json():
+    assert feed_all(['  {"a": 1}']) == (True, '  {"a": 1}')
+
+
+def test_braces_inside_think_block_are_ignored():
+    complete, _ = feed_all(['<think>maybe {"a": 1}'])
+    assert not complete
+    complete, text = feed_all(['<think>maybe {"a": 1}', "</think>", '{"b": 2}'])
+    assert complete and text.endswith('{"b": 2}')
+
+
+def test_think_tags_split_across_chunks():
+    chunks = ["<", "thi", "nk>", "reasoning", "</th", "ink", ">", "[1, ", "2]", " trailing"]
+    assert feed_all(chunks) == (True, "<think>reasoning</think>[1, 2]")
+
+
+def test_braces_inside_strings():
+    complete, text = feed_all(['{"a": "}"', ', "b": "\\"{"}'])
+    assert complete and text == '{"a": "}", "b": "\\"{"}'
+
+
+def test_invalid_span_is_skipped():
+    assert feed_all(["{not json} ", '{"ok": true}']) == (True, '{not json} {"ok": true}')
+
+
+def test_long_reasoning_prefix_is_scanned_once():
+    chunks = ["<think>"] + ["word "] * 50000 + ["</think>", '{"a": 1}']
+    complete, text = feed_all(chunks)
+    assert complete and text.endswith('</think>{"a": 1}')